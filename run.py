@@ -1,4 +1,6 @@
 from src.services import add_refresh_job, shutdown_scheduler, start_scheduler
+from src.db import start_summary_workers, stop_summary_workers
+from src.agent import preload_segmenter
 from src.pages.gradio_page import app as subscription_app
 from src.pages.gradio_page import app as index_page
 from src.pages.delete_page import app as delete_record_app
@@ -12,9 +14,15 @@ def main():
         # 添加默认的刷新任务（每小时刷新一次）
     add_refresh_job(hours=0, minutes=30)
     
+    # 后台加载分词词典，避免第一个摘要或查询请求等待
+    preload_segmenter()
+    
     # 启动调度器
     start_scheduler()
     
+    # 启动摘要工作线程，处理上次退出时未完成的摘要任务
+    start_summary_workers()
+    
     try:
         delete_record_app.queue().launch(
             server_name="127.0.0.1", 
@@ -34,6 +42,7 @@ def main():
     finally:
         # 应用关闭时优雅地关闭调度器
         shutdown_scheduler()
+        stop_summary_workers(timeout=5)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
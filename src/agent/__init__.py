@@ -1 +1,8 @@
-from .summary import SubscriptionAgent
\ No newline at end of file
+from .summary import SubscriptionAgent
+from .pool import get_agent, get_learner, clear_agent_pool
+from .llm_cache import get_llm_cache, get_llm_cache_stats
+from .tokens import TokenCounter, get_token_counter, register_token_counter
+from .streaming import get_live_feed
+from .governor import CircuitOpenError, get_breaker
+from .segmentation import preload_segmenter
+from .prompt_builder import get_prompt_stats
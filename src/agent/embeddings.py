@@ -0,0 +1,208 @@
+"""
+文本向量  Embedding models and an on-disk embedding cache for example retrieval.
+
+- get_embedding_model 按厂商返回 LangChain Embeddings：DASHSCOPE 通过
+  DashScopeAPIClient.get_langcahin_embedding_model 调用 DashScope 文本向量接口；
+  local 为离线的哈希向量（字与相邻两字的特征哈希），不需要网络，用于测试和离线环境。
+- EmbeddingStore 按文本哈希缓存向量：每条记录为 20 字节 SHA-1 加 dim 个 float32，只追加写入一个文件，
+  读取时整体内存映射为矩阵，多个进程共享同一份缓存，同一文本不会重复请求向量接口。
+
+Usage:
+    model = get_embedding_model("local", dim=256)
+    store = EmbeddingStore("resources/learning_data/embeddings", "local", "hash-256")
+    slots = store.lookup(texts)
+    store.add(texts, vectors)
+    scores = store.matrix() @ query_vector
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.log import get_logger
+
+logger = get_logger("agent.embeddings")
+
+
+class LocalHashEmbeddings(Embeddings):
+    """离线哈希向量：字与相邻两字的带符号特征哈希  Offline signed feature-hashing embedder
+
+    只能匹配字面相近的文本，不能识别同义改写，用于没有向量接口时的测试。
+
+    Args:
+        dim: 向量维度
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        chars = re.sub(r"\s+", "", text.lower())
+        features = list(chars) + [chars[i:i + 2] for i in range(len(chars) - 1)]
+        for feature in features:
+            code = zlib.crc32(feature.encode("utf-8"))
+            vector[code % self.dim] += 1.0 if code & 0x80000000 else -1.0
+        norm = float(np.linalg.norm(vector))
+        return (vector / norm if norm > 0 else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def get_embedding_model(provider: str, model: Optional[str] = None, dim: int = 256) -> Embeddings:
+    """
+    按厂商获取 LangChain Embeddings
+    Return a LangChain Embeddings for the provider.
+
+    Args:
+        provider: local 或 DASHSCOPE
+        model: 向量模型名称
+        dim: local 向量的维度
+
+    Returns:
+        Embeddings: 向量模型
+
+    Raises:
+        ValueError: 厂商不支持向量接口
+    """
+    provider = (provider or "local").upper()
+    if provider == "LOCAL":
+        return LocalHashEmbeddings(dim)
+    if provider == "DASHSCOPE":
+        from src.services.apis import DashScopeAPIClient
+        api_key = None
+        try:
+            from src.services import ConfigManager
+            app_config = (ConfigManager().get_config() or {}).get("app", {})
+            if (app_config.get("provider") or "").upper() == "DASHSCOPE":
+                api_key = app_config.get("api_key")
+        except Exception:
+            pass
+        client = DashScopeAPIClient(api_key=api_key) if api_key else DashScopeAPIClient()
+        embedding_model = client.get_langcahin_embedding_model(model)
+        if embedding_model is not None:
+            return embedding_model
+    raise ValueError(f"{provider} 不支持向量接口")
+
+
+def text_key(text: str) -> bytes:
+    """缓存键：文本的 SHA-1  Cache key of a text"""
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """按文本哈希缓存向量的只追加文件  Append-only, memory-mapped embedding cache keyed by text hash
+
+    Args:
+        root: 缓存根目录
+        provider: 向量厂商
+        model: 向量模型名称，不同模型的向量分目录保存
+    """
+
+    def __init__(self, root: str, provider: str, model: str):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{provider}-{model}".lower())
+        self.path = os.path.join(root, slug)
+        os.makedirs(self.path, exist_ok=True)
+        self.data_file = os.path.join(self.path, "vectors.bin")
+        self.meta_file = os.path.join(self.path, "meta.json")
+        self.dim: Optional[int] = None
+        self._slots: Dict[bytes, int] = {}
+        self._rows = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                self.dim = int(json.load(f)["dim"])
+
+    def _dtype(self) -> np.dtype:
+        return np.dtype([("key", "S20"), ("vector", "<f4", (self.dim,))])
+
+    def _records(self) -> Optional[np.memmap]:
+        if self.dim is None or not os.path.exists(self.data_file):
+            return None
+        # 忽略写到一半的末尾记录  A trailing partial record is ignored
+        rows = os.path.getsize(self.data_file) // self._dtype().itemsize
+        if not rows:
+            return None
+        return np.memmap(self.data_file, dtype=self._dtype(), mode="r", shape=(rows,))
+
+    def _refresh(self):
+        """读入其他进程或之前追加的记录  Pick up records appended since the last refresh"""
+        records = self._records()
+        if records is None or len(records) == self._rows:
+            return
+        for slot, key in enumerate(records["key"][self._rows:], start=self._rows):
+            self._slots[bytes(key)] = slot
+        self._rows = len(records)
+        self._matrix = None
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def lookup(self, keys: List[bytes]) -> np.ndarray:
+        """
+        查找缓存位置
+        Slots of the given keys in the matrix, -1 when not cached.
+
+        Args:
+            keys: text_key 的结果
+
+        Returns:
+            np.ndarray: 每个键在 matrix() 中的行号
+        """
+        with self._lock:
+            self._refresh()
+            return np.fromiter((self._slots.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+
+    def add(self, keys: List[bytes], vectors: np.ndarray) -> np.ndarray:
+        """
+        追加向量
+        Append vectors for the given keys.
+
+        Args:
+            keys: text_key 的结果
+            vectors: 形状为 (len(keys), dim) 的向量
+
+        Returns:
+            np.ndarray: 新向量在 matrix() 中的行号
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.meta_file, 'w', encoding='utf-8') as f:
+                    json.dump({"dim": self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与缓存的维度 {self.dim} 不一致")
+            self._refresh()
+            records = np.zeros(len(keys), dtype=self._dtype())
+            records["key"] = keys
+            records["vector"] = vectors
+            # 一次写入整批记录  One write per batch keeps records whole
+            with open(self.data_file, 'ab') as f:
+                f.write(records.tobytes())
+            self._refresh()
+            return np.fromiter((self._slots[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    def matrix(self) -> np.ndarray:
+        """
+        全部缓存向量（内存映射，只读）
+        All cached vectors as a read-only memory-mapped (rows, dim) matrix.
+        """
+        with self._lock:
+            self._refresh()
+            if self._matrix is None:
+                records = self._records()
+                self._matrix = records["vector"] if records is not None else np.zeros((0, self.dim or 1), np.float32)
+            return self._matrix
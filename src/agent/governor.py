@@ -0,0 +1,323 @@
+"""
+大模型调用治理  Retry policy and per-provider circuit breaker for LLM calls.
+
+每次大模型调用都经过 LLMGovernor：
+- 按错误类型决定是否重试：网络错误、超时、429 和 5xx 属于服务端故障，退避后重试并计入熔断器；
+  输出格式错误可以立即重试（流式解析失败）或短暂退避后重试，但不说明服务不可用；
+  鉴权失败、请求无效（400/401/403/404/422）等重试也不会成功，直接抛出。
+- 退避时间按指数增长并加入随机抖动，429 响应的 Retry-After 优先。
+- 每个厂商一个熔断器：连续失败达到阈值后熔断，在恢复时间内的调用立即抛出 CircuitOpenError，
+  由调用方把摘要推迟到积压表；恢复时间过后放行一个探测请求，成功则恢复。
+
+Usage:
+    governor = LLMGovernor.from_config("ZHIPU")
+    raw = governor.call(lambda: chain.invoke(inputs))
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, TypeVar
+
+from src.log import get_logger
+
+logger = get_logger("agent.governor")
+
+T = TypeVar("T")
+
+# 默认治理配置，可在 config.yaml 的 llm_governor 节点中覆盖
+# Default governor settings, can be overridden by the `llm_governor` section of config.yaml
+DEFAULT_GOVERNOR_CONFIG = {
+    "max_attempts": 3,          # 每次调用的最大尝试次数
+    "base_delay": 1.0,          # 首次退避时间（秒），之后按 2 的指数增长
+    "max_delay": 30.0,          # 单次退避时间上限（秒）
+    "failure_threshold": 5,     # 连续多少次服务端故障后熔断
+    "recovery_seconds": 60.0,   # 熔断持续时间（秒），之后放行探测请求
+}
+
+# 错误类型  Error kinds
+FATAL = "fatal"             # 重试无意义  Retrying cannot help
+TRANSIENT = "transient"     # 服务端故障，计入熔断  Provider-side failure, counts towards the breaker
+RETRYABLE = "retryable"     # 输出问题等，可重试但不计入熔断  Retry, but the provider is up
+
+_FATAL_STATUS = {400, 401, 403, 404, 422}
+
+
+def load_governor_config() -> Dict:
+    """读取治理配置  Load governor settings merged with defaults
+
+    Returns:
+        Dict: 治理配置
+    """
+    settings = dict(DEFAULT_GOVERNOR_CONFIG)
+    try:
+        from src.services import ConfigManager
+        config = ConfigManager().get_config() or {}
+        for key, value in (config.get("llm_governor") or {}).items():
+            if key in settings and value is not None:
+                settings[key] = type(DEFAULT_GOVERNOR_CONFIG[key])(value)
+    except Exception as e:
+        logger.warning(f"读取LLM调用治理配置失败，使用默认配置: {e}")
+    return settings
+
+
+class CircuitOpenError(RuntimeError):
+    """厂商熔断中，调用未发出  The provider's circuit is open; the call was not made
+
+    Args:
+        provider: 厂商名称
+        retry_after: 距离下次允许探测的秒数
+    """
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} 熔断中，{retry_after:.0f} 秒后重试")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def _transport_errors() -> tuple:
+    """网络层异常类型（按已安装的库收集）  Transport exception types of the installed libraries"""
+    errors = [TimeoutError, ConnectionError]
+    try:
+        import httpx
+        errors.append(httpx.TransportError)
+    except ImportError:
+        pass
+    try:
+        import requests
+        errors.extend([requests.exceptions.ConnectionError, requests.exceptions.Timeout])
+    except ImportError:
+        pass
+    try:
+        import openai
+        errors.extend([openai.APIConnectionError, openai.APITimeoutError])
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+_TRANSPORT_ERRORS = _transport_errors()
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """从 openai / httpx / requests 的异常中取出 HTTP 状态码  HTTP status of an API error, if any"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """429 响应中的 Retry-After（秒）  Retry-After header of a rate-limited response"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    判断错误类型
+    Classify an exception raised by an LLM call.
+
+    Args:
+        error: 异常
+
+    Returns:
+        str: FATAL / TRANSIENT / RETRYABLE
+    """
+    status = _status_code(error)
+    if status is not None:
+        if status == 429 or status >= 500 or status == 408:
+            return TRANSIENT
+        if status in _FATAL_STATUS:
+            return FATAL
+    if isinstance(error, _TRANSPORT_ERRORS):
+        return TRANSIENT
+    if isinstance(error, ValueError) and "api_key" in str(error).lower().replace(" ", "_"):
+        # 缺少或无效的 API Key  Missing or invalid API key
+        return FATAL
+    return RETRYABLE
+
+
+class CircuitBreaker:
+    """单个厂商的熔断器  Consecutive-failure circuit breaker of one provider
+
+    Args:
+        name: 厂商名称
+        failure_threshold: 连续失败多少次后熔断
+        recovery_seconds: 熔断持续时间（秒）
+    """
+
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_GOVERNOR_CONFIG["failure_threshold"],
+                 recovery_seconds: float = DEFAULT_GOVERNOR_CONFIG["recovery_seconds"]):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_seconds = recovery_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        """closed / open / half_open"""
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at < self.recovery_seconds:
+            return "open"
+        return "half_open"
+
+    def retry_after(self) -> float:
+        """距离允许探测的秒数  Seconds until a probe is allowed"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.recovery_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        """是否允许发出请求；半开状态下同时只放行一个探测请求  Whether a call may proceed"""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"{self.name} 已恢复，关闭熔断")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            now = time.monotonic()
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    logger.warning(f"{self.name} 连续失败 {self._failures} 次，熔断 {self.recovery_seconds:.0f} 秒")
+                self._opened_at = now
+            self._probing = False
+
+    def release(self):
+        """请求结束但无法判断服务状态（如鉴权失败），释放探测名额  End a probe without a verdict"""
+        with self._lock:
+            self._probing = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: Optional[str]) -> CircuitBreaker:
+    """获取厂商的熔断器（进程内共享）  Return the shared breaker of a provider"""
+    name = (provider or "default").upper()
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            settings = load_governor_config()
+            breaker = _breakers[name] = CircuitBreaker(name, settings["failure_threshold"],
+                                                       settings["recovery_seconds"])
+        return breaker
+
+
+class LLMGovernor:
+    """按错误类型退避重试，并受厂商熔断器约束  Retries with backoff, guarded by the provider's breaker
+
+    Args:
+        breaker: 厂商熔断器
+        max_attempts: 最大尝试次数
+        base_delay: 首次退避时间（秒）
+        max_delay: 单次退避时间上限（秒）
+    """
+
+    def __init__(self, breaker: CircuitBreaker,
+                 max_attempts: int = DEFAULT_GOVERNOR_CONFIG["max_attempts"],
+                 base_delay: float = DEFAULT_GOVERNOR_CONFIG["base_delay"],
+                 max_delay: float = DEFAULT_GOVERNOR_CONFIG["max_delay"]):
+        self.breaker = breaker
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, provider: Optional[str], max_attempts: Optional[int] = None,
+                    base_delay: Optional[float] = None) -> "LLMGovernor":
+        """按 config.yaml 创建，参数不为 None 时覆盖配置  Build from the `llm_governor` config section"""
+        settings = load_governor_config()
+        return cls(get_breaker(provider),
+                   max_attempts=max_attempts if max_attempts is not None else settings["max_attempts"],
+                   base_delay=base_delay if base_delay is not None else settings["base_delay"],
+                   max_delay=settings["max_delay"])
+
+    def backoff(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """
+        第 attempt 次失败后的等待时间：指数退避加随机抖动
+        Delay after the given failed attempt: exponential backoff with jitter.
+
+        Args:
+            attempt: 已失败的次数（从 1 开始）
+            error: 导致失败的异常，429 时使用其 Retry-After
+
+        Returns:
+            float: 等待秒数
+        """
+        retry_after = _retry_after(error) if error is not None else None
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        # 在 [delay/2, delay] 内随机，避免多个线程同时重试  Equal jitter spreads out concurrent retries
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def call(self, fn: Callable[[], T], description: str = "LLM调用") -> T:
+        """
+        执行一次受治理的调用
+        Run fn with retries, backoff and the circuit breaker.
+
+        Args:
+            fn: 无参调用，通常包含大模型请求和响应解析
+            description: 日志中的调用说明
+
+        Returns:
+            fn 的返回值
+
+        Raises:
+            CircuitOpenError: 厂商熔断中
+            Exception: 不可重试的错误，或重试次数用尽后的最后一个错误
+        """
+        from .streaming import StreamMalformedError
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.breaker.name, self.breaker.retry_after())
+            try:
+                result = fn()
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == TRANSIENT:
+                    self.breaker.record_failure()
+                elif kind == FATAL:
+                    self.breaker.release()
+                else:
+                    # 服务有响应，只是输出不可用  The provider answered; only the output was unusable
+                    self.breaker.record_success()
+                logger.error(f"{description}失败 (第 {attempt}/{self.max_attempts} 次, {kind}): {e}")
+                if kind == FATAL or attempt == self.max_attempts:
+                    raise
+                # 流式输出格式错误立即重试  Malformed streams are retried at once
+                if not isinstance(e, StreamMalformedError):
+                    time.sleep(self.backoff(attempt, e))
+                continue
+            self.breaker.record_success()
+            return result
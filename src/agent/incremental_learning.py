@@ -1,26 +1,106 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, NamedTuple, Optional
+import hashlib
 import json
 import os
+from collections import Counter
 from datetime import datetime
 from pydantic import BaseModel
 from src.log import get_logger
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import jieba
-import pickle
+import threading
+
+from .index_store import load_index, save_index
+from .retrieval import RetrievalBackend, create_backend
+from .segmentation import preload_segmenter, segment_many, tokenize
+from .tfidf_index import TfidfIndex
 
 logger = get_logger("agent.incremental_learning")
 
+# 默认学习配置，可在 config.yaml 的 learning 节点中覆盖
+# Default learner settings, can be overridden by the `learning` section of config.yaml
+DEFAULT_LEARNING_CONFIG = {
+    "compact_every": 500,        # 追加日志达到多少条后在后台合并到 learning_data.json 并保存检查点
+    "idf_refresh_ratio": 0.1,    # 示例数比上次重算 IDF 时增长超过该比例后重算
+    "retrieval": "exact",        # 相似示例检索后端: exact / lsh / embedding
+    "lsh_tables": 8,             # LSH 哈希表数量
+    "lsh_bits": 12,              # 每个 LSH 表的签名位数
+    "embedding_provider": "local",           # 向量厂商: local（离线哈希向量）/ DASHSCOPE
+    "embedding_model": "text-embedding-v3",  # 向量模型
+    "embedding_batch_size": 10,              # 每次请求的文本数
+    "local_embedding_dim": 256,              # local 向量维度
+    "min_similarity": 0.0,       # 相似度低于该值的示例不返回
+}
+
+
+def load_learning_config() -> Dict:
+    """读取学习配置  Load learner settings merged with defaults
+
+    Returns:
+        Dict: 学习配置
+    """
+    settings = dict(DEFAULT_LEARNING_CONFIG)
+    try:
+        from src.services import ConfigManager
+        config = ConfigManager().get_config() or {}
+        for key, value in (config.get("learning") or {}).items():
+            if key in settings and value is not None:
+                settings[key] = type(DEFAULT_LEARNING_CONFIG[key])(value)
+    except Exception as e:
+        logger.warning(f"读取学习配置失败，使用默认配置: {e}")
+    return settings
+
+
 def tokenize_text(text: str) -> List[str]:
     """
-    使用jieba进行中文分词
+    使用jieba进行中文分词（带缓存，见 src.agent.segmentation）
     Args:
         text: 输入文本
     Returns:
         List[str]: 分词结果列表
     """
-    return list(jieba.cut(text))
+    return list(tokenize(text))
+
+
+def _counts(tokens) -> Dict[str, int]:
+    return dict(Counter(token for token in tokens if token.strip()))
+
+
+def term_counts(text: str) -> Dict[str, int]:
+    """
+    文本的词频，与 TfidfVectorizer 一样先转为小写，并去掉空白词
+    Term counts of a text, lowercased like TfidfVectorizer, whitespace tokens dropped.
+    Args:
+        text: 输入文本
+    Returns:
+        Dict[str, int]: 词 -> 词频
+    """
+    return _counts(tokenize(text.lower()))
+
+
+def term_counts_many(texts: List[str]) -> List[Dict[str, int]]:
+    """
+    批量计算词频，示例较多时多进程分词
+    Term counts of many texts, segmented in parallel when there are enough of them.
+    Args:
+        texts: 文本列表
+    Returns:
+        List[Dict[str, int]]: 与 texts 一一对应的词频
+    """
+    return [_counts(tokens) for tokens in segment_many([text.lower() for text in texts])]
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _atomic_write(path: str, mode: str, write, encoding: Optional[str] = None):
+    """先写临时文件再替换，崩溃时不会留下半个文件  Write to a temp file, then rename over path"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode, encoding=encoding) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
 
 class LearningExample(BaseModel):
     """学习示例的数据模型"""
@@ -30,7 +110,28 @@ class LearningExample(BaseModel):
     timestamp: str
     metadata: Dict = {}
 
+
+class ScoredExample(NamedTuple):
+    """检索结果：示例及其与查询的相似度，相似度不写回共享的示例对象
+    A retrieved example with its similarity to the query; the shared example is never mutated."""
+    example: LearningExample
+    similarity: float
+
 class IncrementalLearner:
+    """
+    增量学习器：保存用户反馈的示例，并按 TF-IDF 相似度检索
+    Stores feedback examples and retrieves similar ones by TF-IDF similarity.
+
+    存储文件（storage_path 下）：
+    - learning_data.json：合并后的示例列表；
+    - learning_data.jsonl：之后追加的示例，每行带序号和词频，保存示例只追加一行；
+    - index/：与 learning_data.json 对应的索引检查点（见 src.agent.index_store），内存映射加载，无需重新分词；
+    - lsh_index.npz：使用 lsh 检索后端时的签名（见 src.agent.retrieval）；
+    - embeddings/：使用 embedding 检索后端时按文本哈希缓存的向量（见 src.agent.embeddings）。
+    追加日志达到 compact_every 条后在后台线程中合并，合并过程中的每一步都是原子替换，
+    崩溃后按序号跳过已合并的日志行。
+    """
+
     def __init__(self, storage_path: str = "resources/learning_data"):
         """
         初始化增量学习器
@@ -38,75 +139,159 @@ class IncrementalLearner:
             storage_path: 学习数据存储路径
         """
         self.storage_path = storage_path
+        self.settings = load_learning_config()
         self.examples: List[LearningExample] = []
-        self.vectorizer = TfidfVectorizer(
-            tokenizer=tokenize_text,
-            max_features=10000
-        )
-        self.vectors = None
+        self.index = TfidfIndex(idf_refresh_ratio=self.settings["idf_refresh_ratio"])
+        self.backend: Optional[RetrievalBackend] = None
+        # 多个智能体共享同一个学习器时，保护写入与查询  Guards appends against concurrent queries
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._compaction: Optional[threading.Thread] = None
+        self._log_lines = 0
+        # 后台加载分词词典，第一次查询不必等待  Load jieba's dictionary before the first query needs it
+        preload_segmenter()
         self._ensure_storage_path()
         self._load_existing_data()
-        self._train_model()
+        if self._log_lines >= self.settings["compact_every"]:
+            self._schedule_compaction()
+
+    @property
+    def data_file(self) -> str:
+        return os.path.join(self.storage_path, "learning_data.json")
+
+    @property
+    def log_file(self) -> str:
+        return os.path.join(self.storage_path, "learning_data.jsonl")
+
+    @property
+    def index_dir(self) -> str:
+        return os.path.join(self.storage_path, "index")
+
+    @property
+    def legacy_model_file(self) -> str:
+        """旧版本 pickle 保存的模型，合并时删除  Pickled model of older versions, removed at compaction"""
+        return os.path.join(self.storage_path, "model.pkl")
 
     def _ensure_storage_path(self):
         """确保存储路径存在"""
         os.makedirs(self.storage_path, exist_ok=True)
 
     def _load_existing_data(self):
-        """加载现有的学习数据"""
-        data_file = os.path.join(self.storage_path, "learning_data.json")
-        if os.path.exists(data_file):
+        """加载合并后的示例、追加日志和索引检查点"""
+        if os.path.exists(self.data_file):
             try:
-                with open(data_file, 'r', encoding='utf-8') as f:
+                with open(self.data_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     self.examples = [LearningExample(**example) for example in data]
-                logger.info(f"成功加载 {len(self.examples)} 条学习数据")
+                # 旧版本把检索相似度写进了 metadata 并随合并保存  Older versions persisted retrieval scores
+                for example in self.examples:
+                    example.metadata.pop('similarity_score', None)
             except Exception as e:
                 logger.error(f"加载学习数据失败: {str(e)}")
                 self.examples = []
 
-    def _train_model(self):
-        """训练文本相似度模型"""
-        if not self.examples:
-            logger.warning("没有足够的数据来训练模型")
-            return
+        # 追加日志中的示例自带词频，不需要重新分词  Logged examples carry their term counts
+        logged_terms: Dict[int, Dict[str, int]] = {}
+        if os.path.exists(self.log_file):
+            line = ""
+            with open(self.log_file, 'r', encoding='utf-8') as f:
+                for line_no, line in enumerate(f, 1):
+                    try:
+                        record = json.loads(line)
+                        example = LearningExample(**record["example"])
+                    except Exception as e:
+                        # 最后一行可能在写入时崩溃  The last line may have been cut off by a crash
+                        logger.warning(f"跳过损坏的学习日志第 {line_no} 行: {e}")
+                        continue
+                    self._log_lines += 1
+                    if record.get("seq", len(self.examples)) < len(self.examples):
+                        continue  # 已合并到 learning_data.json  Already compacted
+                    logged_terms[len(self.examples)] = record.get("terms")
+                    self.examples.append(example)
+            if line and not line.endswith("\n"):
+                # 补上换行，避免下一行接在损坏的行后面  Keep the next append off the cut-off line
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write("\n")
+
+        start = self._load_model()
+        # 日志中没有词频的示例（旧格式数据或检查点落后）一次性批量分词
+        # Examples without logged term counts are segmented in one batch
+        untokenized = [i for i in range(start, len(self.examples)) if logged_terms.get(i) is None]
+        rebuilt = len(untokenized)
+        if untokenized:
+            for i, counts in zip(untokenized, term_counts_many([self.examples[i].input_text for i in untokenized])):
+                logged_terms[i] = counts
+        for i in range(start, len(self.examples)):
+            self.index.add(logged_terms[i])
+        if rebuilt:
+            # 旧格式的数据或检查点落后，下次合并时保存检查点  Persist the re-tokenized rows at the next compaction
+            logger.info(f"重新分词 {rebuilt} 条学习示例")
+            self._log_lines = max(self._log_lines, self.settings["compact_every"])
 
+        self.backend = self._create_backend()
+        if not self.backend.load(self.storage_path, lambda row: _text_hash(self.examples[row].input_text)):
+            self.backend.rebuild()
+        if self.examples:
+            logger.info(f"成功加载 {len(self.examples)} 条学习数据")
+
+    def _load_model(self) -> int:
+        """
+        加载索引检查点
+        Returns:
+            int: 检查点覆盖的示例数，之后的示例需要追加到索引
+        """
         try:
-            # 准备训练数据
-            texts = [example.input_text for example in self.examples]
-            
-            # 训练TF-IDF向量化器
-            self.vectors = self.vectorizer.fit_transform(texts)
-            
-            # 保存模型
-            model_path = os.path.join(self.storage_path, "model.pkl")
-            with open(model_path, 'wb') as f:
-                pickle.dump({
-                    'vectorizer': self.vectorizer,
-                    'vectors': self.vectors
-                }, f)
-            
-            logger.info("模型训练完成并保存")
+            loaded = load_index(self.index_dir)
+            if loaded is None:
+                if os.path.exists(self.legacy_model_file):
+                    logger.info("模型文件为旧格式，重新建立索引")
+                return 0
+            state, header = loaded
+            rows = header["rows"]
+            # 检查点必须对应当前示例的前缀  The checkpoint must cover a prefix of the examples
+            if rows > len(self.examples) or (rows and header["fingerprint"] != _text_hash(self.examples[rows - 1].input_text)):
+                logger.warning("模型检查点与学习数据不一致，重新建立索引")
+                return 0
+            self.index = TfidfIndex.from_state(state, self.settings["idf_refresh_ratio"])
+            logger.info("成功加载已训练的模型")
+            return rows
         except Exception as e:
-            logger.error(f"模型训练失败: {str(e)} at line {e.__traceback__.tb_lineno}")
+            logger.error(f"加载模型失败: {str(e)}")
+            return 0
 
-    def _load_model(self):
-        """加载已训练的模型"""
-        model_path = os.path.join(self.storage_path, "model.pkl")
-        if os.path.exists(model_path):
+    def _create_backend(self) -> RetrievalBackend:
+        """按配置创建检索后端"""
+        name = self.settings["retrieval"]
+        if name == "embedding":
             try:
-                with open(model_path, 'rb') as f:
-                    model_data = pickle.load(f)
-                    self.vectorizer = model_data['vectorizer']
-                    self.vectors = model_data['vectors']
-                logger.info("成功加载已训练的模型")
+                return create_backend(name, self.index, **self._embedding_options())
             except Exception as e:
-                logger.error(f"加载模型失败: {str(e)}")
-                self._train_model()
+                logger.error(f"创建向量检索后端失败，使用 exact: {e}")
+                name = "exact"
+        options = {"lsh": {"tables": self.settings["lsh_tables"], "bits": self.settings["lsh_bits"]}}
+        return create_backend(name, self.index, **options.get(name, {}))
+
+    def _embedding_options(self) -> Dict:
+        """向量检索后端的参数"""
+        from .embeddings import EmbeddingStore, get_embedding_model
+        from .governor import LLMGovernor
+        provider = self.settings["embedding_provider"]
+        model = self.settings["embedding_model"]
+        if provider.lower() == "local":
+            model = f"hash-{self.settings['local_embedding_dim']}"
+        return {
+            "text_of": lambda row: self.examples[row].input_text,
+            "embedder": get_embedding_model(provider, model, self.settings["local_embedding_dim"]),
+            "store": EmbeddingStore(os.path.join(self.storage_path, "embeddings"), provider, model),
+            "batch_size": self.settings["embedding_batch_size"],
+            # 向量接口使用单独的熔断器，失败不会熔断同一厂商的摘要调用
+            # Embeddings get their own breaker so a failing endpoint cannot open the summarization circuit
+            "governor": None if provider.lower() == "local" else LLMGovernor.from_config(f"{provider}-embedding"),
+        }
 
     def save_example(self, input_text: str, output_text: str, feedback_score: float, metadata: Dict = None):
         """
-        保存学习示例
+        保存学习示例：追加一行日志并把示例加入索引，不重新训练
         Args:
             input_text: 输入文本
             output_text: 输出文本
@@ -120,64 +305,109 @@ class IncrementalLearner:
             timestamp=datetime.now().isoformat(),
             metadata=metadata or {}
         )
-        self.examples.append(example)
-        self._save_data()
-        
-        # 重新训练模型
-        self._train_model()
-        
+        counts = term_counts(input_text)
+        with self._lock:
+            seq = len(self.examples)
+            self.examples.append(example)
+            self.index.add(counts)
+            self.backend.add(seq, input_text, counts)
+            self._append_log(seq, example, counts)
+            compact = self._log_lines >= self.settings["compact_every"]
+
+        if compact:
+            self._schedule_compaction()
         logger.info(f"保存新的学习示例，当前共有 {len(self.examples)} 条数据")
 
-    def _save_data(self):
-        """保存学习数据到文件"""
-        data_file = os.path.join(self.storage_path, "learning_data.json")
+    def _append_log(self, seq: int, example: LearningExample, counts: Dict[str, int]):
+        """追加一行学习日志"""
         try:
-            with open(data_file, 'w', encoding='utf-8') as f:
-                json.dump([example.dict() for example in self.examples], f, ensure_ascii=False, indent=2)
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"seq": seq, "example": example.dict(), "terms": counts}, ensure_ascii=False) + "\n")
+            self._log_lines += 1
         except Exception as e:
             logger.error(f"保存学习数据失败: {str(e)}")
 
-    def get_similar_examples(self, input_text: str, top_k: int = 3) -> List[LearningExample]:
+    def _schedule_compaction(self):
+        """在后台线程中合并追加日志，同时只运行一个  Start a background compaction unless one is running"""
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            self._compaction = threading.Thread(target=self.compact, name="learner-compaction", daemon=True)
+            self._compaction.start()
+
+    def compact(self):
+        """
+        把追加日志合并到 learning_data.json，并保存对应的索引检查点
+        Fold the append-only log into learning_data.json and checkpoint the index.
+
+        依次原子替换检查点、示例文件和日志；任何一步之后崩溃，重新加载时都能按序号和检查点的哈希恢复。
+        """
+        with self._compact_lock:
+            with self._lock:
+                rows = len(self.examples)
+                examples = list(self.examples)
+                state = self.index.state(rows)
+            if not rows:
+                return
+            try:
+                with self._lock:
+                    self.backend.save(self.storage_path, rows, _text_hash(examples[-1].input_text))
+                version = save_index(self.index_dir, state, _text_hash(examples[-1].input_text))
+                if os.path.exists(self.legacy_model_file):
+                    os.remove(self.legacy_model_file)
+                data = [example.dict() for example in examples]
+                _atomic_write(self.data_file, 'w', lambda f: json.dump(data, f, ensure_ascii=False), encoding='utf-8')
+
+                # 只保留合并期间新追加的示例  Keep only what was appended during the compaction
+                with self._lock:
+                    tail = [json.dumps({"seq": seq, "example": self.examples[seq].dict(),
+                                        "terms": self.index.term_counts(seq)}, ensure_ascii=False) + "\n"
+                            for seq in range(rows, len(self.examples))]
+                    _atomic_write(self.log_file, 'w', lambda f: f.writelines(tail), encoding='utf-8')
+                    self._log_lines = len(tail)
+                logger.info(f"学习数据合并完成，共 {rows} 条示例，词表大小 {self.index.vocabulary_size}，索引版本 {version}")
+            except Exception as e:
+                logger.error(f"合并学习数据失败: {str(e)}")
+
+    def get_similar_examples(self, input_text: str, top_k: int = 3) -> List[ScoredExample]:
         """
         获取与输入文本相似的历史示例
         Args:
             input_text: 输入文本
             top_k: 返回的示例数量
         Returns:
-            List[LearningExample]: 相似的历史示例列表
+            List[ScoredExample]: 相似的历史示例及其相似度，按相似度从高到低排列
         """
-        if not self.examples:
+        counts = term_counts(input_text)
+        with self._lock:
+            rows = len(self.examples)
+        if not rows:
             return []
-
-        try:
-            # 确保模型已加载
-            if self.vectors is None:
-                self._load_model()
-                if self.vectors is None:
-                    return self.examples[-top_k:]
-
-            # 转换输入文本为向量
-            input_vector = self.vectorizer.transform([input_text])
-            
-            # 计算相似度
-            similarities = cosine_similarity(input_vector, self.vectors).flatten()
-            
-            # 获取最相似的示例索引
-            top_indices = np.argsort(similarities)[-top_k:][::-1]
+        # 可能阻塞的准备工作（如请求向量接口）在锁外进行，不阻塞其他检索和保存示例
+        # Blocking work such as remote embedding calls runs without the lock
+        self.backend.prepare(input_text, rows)
+        with self._lock:
+            try:
+                # 检索最相似的示例索引及相似度
+                top_indices, similarities = self.backend.search(input_text, counts, top_k)
             
-            # 返回相似度最高的示例
-            similar_examples = [self.examples[i] for i in top_indices]
+                # 去掉相似度过低的示例，宁可少放示例也不放无关示例
+                keep = similarities >= self.settings["min_similarity"]
+                top_indices, similarities = top_indices[keep], similarities[keep]
+                if not len(top_indices):
+                    logger.debug("没有相似度足够高的示例")
+                    return []
             
-            # 记录相似度分数
-            for i, example in enumerate(similar_examples):
-                example.metadata['similarity_score'] = float(similarities[top_indices[i]])
+                # 返回相似度最高的示例及相似度，示例对象在多个线程间共享，不写入分数
+                similar_examples = [ScoredExample(self.examples[i], float(score))
+                                    for i, score in zip(top_indices, similarities)]
             
-            logger.debug(f"找到 {len(similar_examples)} 个相似示例，最高相似度: {similarities[top_indices[0]]:.4f}")
-            return similar_examples
+                logger.debug(f"找到 {len(similar_examples)} 个相似示例，最高相似度: {similarities[0]:.4f}")
+                return similar_examples
 
-        except Exception as e:
-            logger.error(f"获取相似示例失败: {str(e)}")
-            return self.examples[-top_k:]
+            except Exception as e:
+                logger.error(f"获取相似示例失败: {str(e)}")
+                return [ScoredExample(example, 0.0) for example in self.examples[-top_k:]]
 
     def get_learning_statistics(self) -> Dict:
         """
@@ -197,8 +427,8 @@ class IncrementalLearner:
             "total_examples": len(self.examples),
             "average_feedback": sum(e.feedback_score for e in self.examples) / len(self.examples),
             "latest_update": max(e.timestamp for e in self.examples),
-            "model_status": "已训练" if self.vectors is not None else "未训练",
-            "vocabulary_size": len(self.vectorizer.vocabulary_) if self.vectorizer is not None else 0
+            "model_status": "已训练" if self.index.n_rows else "未训练",
+            "vocabulary_size": self.index.vocabulary_size
         }
 
 def main():
@@ -254,9 +484,9 @@ def main():
     for query in test_queries:
         print(f"\n查询: {query}")
         similar_examples = learner.get_similar_examples(query, top_k=2)
-        for i, example in enumerate(similar_examples, 1):
+        for i, (example, similarity) in enumerate(similar_examples, 1):
             print(f"\n相似示例 {i}:")
-            print(f"相似度: {example.metadata['similarity_score']:.4f}")
+            print(f"相似度: {similarity:.4f}")
             print(f"输入: {example.input_text}")
             print(f"输出: {example.output_text}")
             print(f"反馈分数: {example.feedback_score}")
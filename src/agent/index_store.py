@@ -0,0 +1,207 @@
+"""
+索引文件格式  Versioned, memory-mappable on-disk format of the learner's TF-IDF index.
+
+取代 pickle 保存的 model.pkl。每次保存写入一个新的版本目录，CURRENT 文件指向当前版本::
+
+    index/
+        CURRENT             当前版本目录名
+        v000003/
+            header.json     格式名、格式版本、行数、词表大小、非零元数量、最后一条示例的指纹
+            terms.npy       词表：所有词的 UTF-8 字节依次拼接（uint8）
+            term_offsets.npy  第 i 个词为 terms[offsets[i]:offsets[i+1]]（int64）
+            df.npy          文档频率（int64）
+            idf.npy         IDF 向量（float32）
+            indptr.npy      CSR 行指针（int32）
+            indices.npy     CSR 列号（int32）
+            data.npy        CSR 数据：归一化后的 TF-IDF 权重（float32）
+            counts.npy      原始词频（float32），IDF 重算时使用
+
+数组以 np.load(mmap_mode="r") 打开，界面、调度器和命令行工具等多个进程共享同一份页缓存。
+写入时先写临时目录并逐个 fsync，再改名为版本目录，最后原子替换 CURRENT；任何一步崩溃，
+CURRENT 仍指向完整的旧版本。旧版本保留一个，其余删除。
+
+Usage:
+    save_index("resources/learning_data/index", index.state(), fingerprint)
+    loaded = load_index("resources/learning_data/index")
+    if loaded:
+        state, header = loaded
+        index = TfidfIndex.from_state(state)
+"""
+
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.log import get_logger
+
+logger = get_logger("agent.index_store")
+
+FORMAT_NAME = "upick-tfidf-index"
+FORMAT_VERSION = 1
+
+# 保留的旧版本数  Old versions kept besides the current one
+_KEEP_VERSIONS = 1
+
+_ARRAYS = {
+    "df": np.int64,
+    "idf": np.float32,
+    "indptr": np.int32,
+    "indices": np.int32,
+    "data": np.float32,
+    "counts": np.float32,
+}
+
+
+def _fsync_dir(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # Windows 不能打开目录  Directories cannot be opened on Windows
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_array(path: str, array: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, array, allow_pickle=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _encode_terms(terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [term.encode("utf-8") for term in terms]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(term) for term in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_terms(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    data = blob.tobytes()
+    return [data[start:end].decode("utf-8") for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def current_version(root: str) -> Optional[str]:
+    """当前版本目录名，没有时为 None  Name of the current version directory"""
+    try:
+        with open(os.path.join(root, "CURRENT"), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name if name and os.path.isdir(os.path.join(root, name)) else None
+
+
+def save_index(root: str, state: Dict, fingerprint: str) -> str:
+    """
+    把 TfidfIndex.state() 保存为新版本，并切换 CURRENT
+    Write an index state as a new version and atomically point CURRENT at it.
+
+    Args:
+        root: 索引目录
+        state: TfidfIndex.state() 的结果（需包含 idf 与 weights）
+        fingerprint: 最后一条示例的指纹，加载时用于确认索引对应当前示例
+
+    Returns:
+        str: 新版本目录名
+    """
+    os.makedirs(root, exist_ok=True)
+    versions = _versions(root)
+    number = int(versions[-1][1:]) + 1 if versions else 1
+    name = f"v{number:06d}"
+    tmp_dir = os.path.join(root, f".tmp-{name}-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    blob, offsets = _encode_terms(state["terms"])
+    arrays = {
+        "terms": blob,
+        "term_offsets": offsets,
+        "df": state["df"],
+        "idf": state["idf"],
+        "indptr": state["indptr"],
+        "indices": state["indices"],
+        "data": state["weights"],
+        "counts": state["counts"],
+    }
+    for key, array in arrays.items():
+        _write_array(os.path.join(tmp_dir, f"{key}.npy"), np.ascontiguousarray(array, dtype=_ARRAYS.get(key, array.dtype)))
+    header = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "rows": int(state["rows"]),
+        "vocabulary_size": len(state["terms"]),
+        "nnz": int(len(state["indices"])),
+        "idf_rows": int(state["idf_rows"]),
+        "fingerprint": fingerprint,
+    }
+    with open(os.path.join(tmp_dir, "header.json"), "w", encoding="utf-8") as f:
+        json.dump(header, f)
+        f.flush()
+        os.fsync(f.fileno())
+    _fsync_dir(tmp_dir)
+    os.rename(tmp_dir, os.path.join(root, name))
+
+    current_tmp = os.path.join(root, f"CURRENT.tmp-{os.getpid()}")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(root, "CURRENT"))
+    _fsync_dir(root)
+
+    # 已经打开旧版本的进程仍可继续读取（POSIX 上删除不影响已有映射）
+    # Processes that mapped an old version keep reading it; unlinking does not affect existing maps on POSIX
+    for old in _versions(root)[:-(_KEEP_VERSIONS + 1)]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return name
+
+
+def _versions(root: str) -> List[str]:
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if name.startswith("v") and name[1:].isdigit())
+
+
+def load_index(root: str) -> Optional[Tuple[Dict, Dict]]:
+    """
+    以内存映射方式打开当前版本
+    Open the current version with memory-mapped arrays.
+
+    Args:
+        root: 索引目录
+
+    Returns:
+        Optional[Tuple[Dict, Dict]]: (可传给 TfidfIndex.from_state 的状态, 文件头)，没有可用版本时为 None
+
+    Raises:
+        ValueError: 文件头的格式名或版本不受支持
+    """
+    name = current_version(root)
+    if name is None:
+        return None
+    path = os.path.join(root, name)
+    with open(os.path.join(path, "header.json"), "r", encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_NAME or header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"不支持的索引格式: {header.get('format')} v{header.get('version')}")
+
+    arrays = {key: np.load(os.path.join(path, f"{key}.npy"), mmap_mode="r", allow_pickle=False)
+              for key in list(_ARRAYS) + ["terms", "term_offsets"]}
+    if len(arrays["indptr"]) != header["rows"] + 1 or len(arrays["indices"]) != header["nnz"]:
+        raise ValueError(f"索引版本 {name} 的数组长度与文件头不一致")
+    state = {
+        "rows": header["rows"],
+        "terms": _decode_terms(arrays["terms"], arrays["term_offsets"]),
+        "df": arrays["df"],
+        "idf": arrays["idf"],
+        "indptr": arrays["indptr"],
+        "indices": arrays["indices"],
+        "weights": arrays["data"],
+        "counts": arrays["counts"],
+        "idf_rows": header["idf_rows"],
+    }
+    return state, header
@@ -0,0 +1,227 @@
+"""
+大模型响应缓存  Persistent, content-addressed cache of LLM responses.
+
+键由调用类型、提示模板版本、模型名称和规范化后的输入文本共同哈希得到，
+相同的差异（镜像页面、同一列表的不同 URL、崩溃后的重试）不会重复请求大模型。
+缓存存放在 SQLite 中，按 TTL 过期，并在总大小超限时按最近访问时间淘汰。
+
+Usage:
+    cache = get_llm_cache()
+    key = cache.make_key("summary", PROMPT_VERSION, model_name, contentdiff)
+    raw = cache.get(key)
+    if raw is None:
+        raw = call_llm(...)
+        cache.set(key, raw, model_name)
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.log import get_logger
+
+logger = get_logger("agent.llm_cache")
+
+_ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+
+# 默认缓存配置，可在 config.yaml 的 llm_cache 节点中覆盖
+# Default cache settings, can be overridden by the `llm_cache` section of config.yaml
+DEFAULT_LLM_CACHE_CONFIG = {
+    "enabled": True,
+    "path": "resources/llm_cache",   # 相对项目根目录
+    "ttl_hours": 168.0,              # 缓存有效期（小时）
+    "max_size_mb": 200.0,            # 缓存总大小上限（MB）
+}
+
+# 每写入多少条检查一次过期与容量  Eviction runs every N writes
+_EVICT_EVERY = 50
+
+
+def load_llm_cache_config() -> Dict:
+    """读取缓存配置  Load cache settings merged with defaults
+
+    Returns:
+        Dict: 缓存配置
+    """
+    settings = dict(DEFAULT_LLM_CACHE_CONFIG)
+    try:
+        from src.services import ConfigManager
+        config = ConfigManager().get_config() or {}
+        for key, value in (config.get("llm_cache") or {}).items():
+            if key in settings and value is not None:
+                settings[key] = type(DEFAULT_LLM_CACHE_CONFIG[key])(value)
+    except Exception as e:
+        logger.warning(f"读取LLM缓存配置失败，使用默认配置: {e}")
+    return settings
+
+
+def normalize_text(text: str) -> str:
+    """规范化输入：合并空白字符  Collapse whitespace so formatting noise does not change the key"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+@dataclass
+class CacheStats:
+    """缓存命中统计  Hit/miss counters since process start"""
+    hits: int = 0
+    misses: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self) -> str:
+        return (f"命中 {self.hits} 次, 未命中 {self.misses} 次, 命中率 {self.hit_rate:.1%}, "
+                f"条目 {self.entries} 个, 占用 {self.size_bytes / 1024 / 1024:.1f}MB")
+
+
+class LLMCache:
+    """SQLite 实现的大模型响应缓存  SQLite-backed LLM response cache
+
+    Args:
+        path: 缓存目录
+        ttl_hours: 缓存有效期（小时）
+        max_size_mb: 缓存总大小上限（MB）
+        enabled: 是否启用，关闭时 get 总是未命中、set 不写入
+    """
+
+    def __init__(self,
+                 path: str = DEFAULT_LLM_CACHE_CONFIG["path"],
+                 ttl_hours: float = DEFAULT_LLM_CACHE_CONFIG["ttl_hours"],
+                 max_size_mb: float = DEFAULT_LLM_CACHE_CONFIG["max_size_mb"],
+                 enabled: bool = DEFAULT_LLM_CACHE_CONFIG["enabled"]):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        if not enabled:
+            return
+
+        directory = Path(path) if os.path.isabs(path) else _ROOT_DIR / path
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(str(directory / "cache.db"), check_same_thread=False)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache
+                              (key TEXT PRIMARY KEY,
+                               model TEXT,
+                               value TEXT NOT NULL,
+                               size INTEGER NOT NULL,
+                               created_at REAL NOT NULL,
+                               accessed_at REAL NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(kind: str, prompt_version: str, model: str, text: str) -> str:
+        """
+        生成缓存键
+        Build a content-addressed key.
+
+        Args:
+            kind: 调用类型，如 summary / chunk / batch
+            prompt_version: 提示模板版本，模板修改后应递增
+            model: 模型名称
+            text: 输入文本（差异内容）
+
+        Returns:
+            str: sha256 十六进制键
+        """
+        payload = "\x1f".join([kind, prompt_version, model or "", normalize_text(text)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，过期条目视为未命中  Return the cached value, or None when missing or expired"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self._misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str, model: Optional[str] = None):
+        """写入缓存  Store a value"""
+        if not self.enabled or value is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO llm_cache (key, model, value, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (key, model, value, len(value.encode("utf-8")), now, now))
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        """删除过期条目，并按最近访问时间淘汰到容量以内  Drop expired rows, then least recently used ones"""
+        c = self._conn.cursor()
+        c.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        expired = c.rowcount
+        total = c.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        evicted = 0
+        if total > self.max_bytes:
+            for key, size in c.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        self._conn.commit()
+        if expired or evicted:
+            logger.info(f"LLM缓存清理: 过期 {expired} 条, 容量淘汰 {evicted} 条")
+
+    def stats(self) -> CacheStats:
+        """命中率与占用统计  Hit rate and storage usage"""
+        with self._lock:
+            entries, size = (0, 0)
+            if self.enabled:
+                entries, size = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            return CacheStats(hits=self._hits, misses=self._misses, entries=entries, size_bytes=size)
+
+    def clear(self):
+        """清空缓存  Remove every entry"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    """获取进程级共享缓存（首次调用时按配置创建）
+    Return the process-wide cache, creating it from config.yaml on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache(**load_llm_cache_config())
+    return _cache
+
+
+def get_llm_cache_stats() -> CacheStats:
+    """获取缓存命中统计  Hit statistics of the shared cache"""
+    return get_llm_cache().stats()
@@ -0,0 +1,69 @@
+"""
+智能体池  Process-wide pool of SubscriptionAgent instances.
+
+构造 SubscriptionAgent 需要加载学习数据与相似度索引、创建 LLM 客户端与记忆组件，
+代价很高。这里按 (provider, model, base_url) 缓存智能体，
+所有智能体共用一个增量学习器；只有当 ConfigManager 检测到配置变化时才清空缓存。
+
+Usage:
+    from src.agent import get_agent
+    summary = get_agent().generate_summary(diffs)
+"""
+
+import threading
+from typing import Dict, Optional, Tuple
+
+from src.log import get_logger
+from .incremental_learning import IncrementalLearner
+from .summary import SubscriptionAgent
+
+logger = get_logger("agent.pool")
+
+_lock = threading.Lock()
+_agents: Dict[Tuple, SubscriptionAgent] = {}
+_config_version: Optional[int] = None
+_learner: Optional[IncrementalLearner] = None
+
+
+def get_learner() -> IncrementalLearner:
+    """获取进程级共享的增量学习器  Return the shared incremental learner, training it on first use"""
+    global _learner
+    if _learner is None:
+        with _lock:
+            if _learner is None:
+                _learner = IncrementalLearner()
+    return _learner
+
+
+def get_agent() -> SubscriptionAgent:
+    """
+    获取当前配置对应的智能体，配置未变化时复用已有实例
+    Return the pooled agent for the configured provider and model.
+
+    Returns:
+        SubscriptionAgent: 共享的智能体实例
+    """
+    global _config_version
+    from src.services import ConfigManager
+    manager = ConfigManager()
+    app_config = (manager.get_config() or {}).get("app", {})
+    key = (app_config.get("provider"), app_config.get("model"), app_config.get("base_url"))
+
+    learner = get_learner()
+    with _lock:
+        if manager.version != _config_version:
+            if _agents:
+                logger.info("配置已变化，重建智能体")
+            _agents.clear()
+            _config_version = manager.version
+        agent = _agents.get(key)
+        if agent is None:
+            agent = _agents[key] = SubscriptionAgent(learner=learner)
+            logger.debug(f"创建智能体: {key[0]} / {key[1]}")
+    return agent
+
+
+def clear_agent_pool():
+    """清空智能体池，下次 get_agent 时按当前配置重建  Drop every pooled agent"""
+    with _lock:
+        _agents.clear()
@@ -0,0 +1,296 @@
+"""
+提示组装  Token-budgeted prompt assembly for the summary agent.
+
+提示分为固定前缀和每次调用的可变部分：
+
+- 固定前缀（系统消息）：角色、规则与输出格式说明，构造时组装并计数一次。所有调用的前缀逐字节相同，
+  且放在消息最前面，厂商侧的前缀缓存（DashScope、OpenAI 等的隐式上下文缓存）可以命中；
+- 输出格式说明由 format_instructions 从 Pydantic 模型生成紧凑的 JSON 骨架，只包含需要模型填写的字段，
+  比 PydanticOutputParser 的完整 JSON Schema 少数百个 token，解析仍使用 PydanticOutputParser；
+- 学习示例按 相似度 × 反馈评分 排序，再用最大边际相关性（MMR）去掉彼此相近的示例，
+  在 token 预算内依次放入，放不下时先缩短示例输入；
+- 内容放在最后。每次组装记录前缀、示例、内容和总计的 token 数，get_prompt_stats 汇总调用以来的消耗。
+
+Usage:
+    builder = PromptBuilder(instructions, format_instructions(SummaryResponse, fields), counter)
+    prompt = builder.build(contentdiff, learner.get_similar_examples(contentdiff, top_k=10))
+    llm.invoke(prompt.messages)
+    record_prompt_usage(prompt.usage)
+"""
+
+import json
+import re
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, Union, get_args, get_origin
+
+import numpy as np
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from pydantic import BaseModel
+
+from src.log import get_logger
+from src.agent.tokens import TokenCounter
+
+logger = get_logger("agent.prompt_builder")
+
+_SPACES_RE = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+
+# 每次调用记录的提示部分  Sections accounted for on every call
+SECTIONS = ("prefix", "examples", "content", "frame", "total")
+
+
+def _skeleton(annotation: Any, description: Optional[str], notes: List[str], name: str) -> Any:
+    """按字段类型生成示例值，字符串用字段说明占位，其他标量的说明记入 notes"""
+    origin = get_origin(annotation)
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _skeleton(args[0], description, notes, name) if args else None
+    if origin in (list, List, tuple, set):
+        args = get_args(annotation)
+        return [_skeleton(args[0] if args else str, description, notes, name)]
+    if origin in (dict, Dict):
+        if description:
+            notes.append(f"{name}={description}")
+        return {}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return {key: _skeleton(info.annotation, info.description, notes, key)
+                for key, info in annotation.model_fields.items()}
+    if annotation is str:
+        return description or name
+    if description:
+        notes.append(f"{name}={description}")
+    if annotation is bool:
+        return False
+    return 0.0 if annotation is float else 0
+
+
+@lru_cache(maxsize=None)
+def format_instructions(model: Type[BaseModel], fields: Optional[Tuple[str, ...]] = None) -> str:
+    """
+    紧凑的输出格式说明：一个 JSON 骨架，字符串字段的值为字段说明
+    Compact output-format instructions: a JSON skeleton in place of the full JSON Schema.
+
+    Args:
+        model: 输出的 Pydantic 模型
+        fields: 需要模型填写的顶层字段，默认全部；其余字段由程序补全
+
+    Returns:
+        str: 格式说明
+    """
+    notes: List[str] = []
+    skeleton = {key: _skeleton(info.annotation, info.description, notes, key)
+                for key, info in model.model_fields.items() if fields is None or key in fields}
+    text = json.dumps(skeleton, ensure_ascii=False)
+    if notes:
+        text += "\n其中 " + "；".join(notes)
+    return text
+
+
+def compress_text(text: str) -> str:
+    """合并连续空白与空行  Collapse runs of spaces and blank lines"""
+    return _BLANK_LINES_RE.sub("\n", _SPACES_RE.sub(" ", text)).strip()
+
+
+def _term_vector(text: str) -> Dict[str, int]:
+    from src.agent.incremental_learning import term_counts
+    return term_counts(text)
+
+
+def _cosine(a: Dict[str, int], b: Dict[str, int]) -> float:
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(count * b.get(term, 0) for term, count in a.items())
+    if not dot:
+        return 0.0
+    norm = np.sqrt(sum(v * v for v in a.values())) * np.sqrt(sum(v * v for v in b.values()))
+    return float(dot / norm)
+
+
+def rank_examples(candidates: Sequence[Any], mmr_lambda: float = 0.7,
+                  duplicate_threshold: float = 0.85) -> List[Any]:
+    """
+    按最大边际相关性排序学习示例
+    Order examples by maximal marginal relevance, dropping near-duplicates.
+
+    相关性为 相似度 × 反馈评分；每一步选出 λ·相关性 − (1−λ)·与已选示例的最大相似度 最高的示例，
+    示例之间的相似度按输入与输出的词频余弦计算，与已选示例的相似度达到 duplicate_threshold 的示例直接丢弃。
+
+    Args:
+        candidates: IncrementalLearner.get_similar_examples 返回的 (示例, 相似度) 列表
+        mmr_lambda: 相关性的权重，1 表示不去重
+        duplicate_threshold: 视为重复的相似度
+
+    Returns:
+        List: 排序后的 (示例, 相似度)
+    """
+    candidates = list(candidates)
+    if len(candidates) <= 1:
+        return candidates
+    relevance = [similarity * example.feedback_score for example, similarity in candidates]
+    if mmr_lambda >= 1:
+        return [candidates[i] for i in sorted(range(len(candidates)), key=lambda i: -relevance[i])]
+    vectors = [_term_vector(f"{example.input_text}\n{example.output_text}") for example, _ in candidates]
+    redundancy = [0.0] * len(candidates)
+    remaining = list(range(len(candidates)))
+    ranked: List[int] = []
+    while remaining:
+        best = max(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy[i])
+        ranked.append(best)
+        remaining.remove(best)
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], _cosine(vectors[i], vectors[best]))
+        remaining = [i for i in remaining if redundancy[i] < duplicate_threshold]
+    return [candidates[i] for i in ranked]
+
+
+@dataclass
+class BuiltPrompt:
+    """组装好的提示  An assembled prompt with its per-section token usage"""
+    messages: List[BaseMessage]
+    examples: List[Any]  # 放入提示的 (示例, 相似度)
+    usage: Dict[str, int] = field(default_factory=dict)
+
+    def used_examples(self) -> List[Dict[str, Any]]:
+        """记录到摘要结果中的示例信息  Example info kept on the summary response"""
+        return [
+            {
+                "input_text": example.input_text[:100] + "...",
+                "output_text": example.output_text,
+                "feedback_score": example.feedback_score,
+                "similarity_score": similarity
+            }
+            for example, similarity in self.examples
+        ]
+
+
+class PromptBuilder:
+    """按 token 预算组装提示  Assembles prompts from a cached static prefix, budgeted examples and content
+
+    Args:
+        instructions: 角色与规则说明（固定前缀）
+        format_instructions: 输出格式说明（固定前缀）
+        token_counter: token 计数器
+        example_tokens: 学习示例的 token 预算
+        mmr_lambda: MMR 中相关性的权重
+        input_chars: 示例输入最多保留的字符数
+        content_title: 内容部分的标题
+    """
+
+    def __init__(self, instructions: str, format_instructions: str, token_counter: TokenCounter,
+                 example_tokens: int = 1500, mmr_lambda: float = 0.7, input_chars: int = 200,
+                 content_title: str = "内容差异"):
+        self.token_counter = token_counter
+        self.example_tokens = example_tokens
+        self.mmr_lambda = mmr_lambda
+        self.input_chars = input_chars
+        self.content_title = content_title
+        # 固定前缀只组装和计数一次  The static prefix is assembled and counted once
+        self.prefix = f"{instructions.strip()}\n\n###输出格式（只返回 JSON，不添加任何说明文字或注释）：\n{format_instructions}"
+        self.prefix_message = SystemMessage(content=self.prefix)
+        self.prefix_tokens = token_counter.count(self.prefix)
+
+    def _render_examples(self, examples: List[Any], budget: int, top_k: int,
+                         input_chars: int) -> Tuple[str, List[Any]]:
+        """按顺序放入示例直到预算用完，放不下的示例跳过  Greedily fit examples into the budget"""
+        texts: List[str] = []
+        chosen: List[Any] = []
+        remaining = budget
+        for scored in examples:
+            ex, _ = scored
+            if len(chosen) >= top_k:
+                break
+            prefix = f"示例 {len(chosen) + 1} (评分: {ex.feedback_score:.1f}):\n输入: "
+            suffix = f"...\n输出: {compress_text(ex.output_text)}"
+            # 示例之间的空行按 1 个 token 计
+            frame_tokens = self.token_counter.count(prefix + suffix) + (1 if texts else 0)
+            if frame_tokens >= remaining:
+                continue
+            input_text = self.token_counter.truncate(compress_text(ex.input_text[:input_chars]),
+                                                     remaining - frame_tokens)
+            texts.append(prefix + input_text + suffix)
+            chosen.append(scored)
+            remaining -= frame_tokens + self.token_counter.count(input_text)
+        return "\n\n".join(texts), chosen
+
+    def build(self, content: str, candidates: Sequence[Any] = (), top_k: int = 5,
+              budget: Optional[int] = None, input_chars: Optional[int] = None) -> BuiltPrompt:
+        """
+        组装一次调用的提示
+        Assemble the messages for one call.
+
+        Args:
+            content: 本次的内容（差异、批量条目或收集的块结果），不截断
+            candidates: 候选学习示例 (示例, 相似度)（通常比 top_k 多，供 MMR 去重）
+            top_k: 最多放入的示例数
+            budget: 整个提示的 token 上限，学习示例只使用前缀和内容之外剩余的部分；None 表示只受 example_tokens 限制
+            input_chars: 示例输入最多保留的字符数，默认使用构造时的设置
+
+        Returns:
+            BuiltPrompt: 消息列表、放入的示例和各部分的 token 数
+        """
+        content_tokens = self.token_counter.count(content)
+        example_budget = self.example_tokens
+        if budget:
+            example_budget = min(example_budget, budget - self.prefix_tokens - content_tokens)
+        examples_text, chosen = "", []
+        if candidates and example_budget > 0:
+            ranked = rank_examples(candidates, self.mmr_lambda)
+            examples_text, chosen = self._render_examples(
+                ranked, example_budget, top_k, self.input_chars if input_chars is None else input_chars)
+            if len(chosen) < min(top_k, len(ranked)):
+                logger.debug(f"学习示例超出 token 预算 ({example_budget})，保留 {len(chosen)}/{min(top_k, len(ranked))} 个")
+
+        body = f"###历史学习示例：\n{examples_text}\n\n" if examples_text else ""
+        body += f"###{self.content_title}：\n{content}"
+        body_tokens = self.token_counter.count(body)
+        examples_tokens = self.token_counter.count(examples_text)
+        usage = {
+            "prefix": self.prefix_tokens,
+            "examples": examples_tokens,
+            "content": content_tokens,
+            "frame": max(0, body_tokens - examples_tokens - content_tokens),
+            "total": self.prefix_tokens + body_tokens,
+        }
+        if budget and usage["total"] > budget:
+            logger.debug(f"提示 token 数 ({usage['total']}) 超过预算 ({budget})，内容未截断")
+        return BuiltPrompt(messages=[self.prefix_message, HumanMessage(content=body)], examples=chosen, usage=usage)
+
+
+@dataclass
+class PromptStats:
+    """提示 token 消耗统计  Tokens sent per prompt section since process start"""
+    calls: int = 0
+    prefix: int = 0
+    examples: int = 0
+    content: int = 0
+    frame: int = 0
+    total: int = 0
+
+    def __str__(self) -> str:
+        if not self.calls:
+            return "调用 0 次"
+        return (f"调用 {self.calls} 次, 平均每次 {self.total / self.calls:.0f} token "
+                f"(前缀 {self.prefix / self.calls:.0f}, 示例 {self.examples / self.calls:.0f}, "
+                f"内容 {self.content / self.calls:.0f}, 其他 {self.frame / self.calls:.0f})")
+
+
+_stats = PromptStats()
+_stats_lock = threading.Lock()
+
+
+def record_prompt_usage(usage: Dict[str, int]):
+    """累计一次实际发送的提示的 token 数  Add one sent prompt to the process-wide totals"""
+    with _stats_lock:
+        _stats.calls += 1
+        for section in SECTIONS:
+            setattr(_stats, section, getattr(_stats, section) + usage.get(section, 0))
+
+
+def get_prompt_stats() -> PromptStats:
+    """获取提示 token 消耗统计  Snapshot of the process-wide prompt token totals"""
+    with _stats_lock:
+        return PromptStats(**{key: getattr(_stats, key) for key in ("calls",) + SECTIONS})
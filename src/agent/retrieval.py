@@ -0,0 +1,500 @@
+"""
+相似示例检索后端  Pluggable top-k retrieval over the learner's TF-IDF index.
+
+- exact：float32 稀疏矩阵乘向量得到全部相似度，再用 argpartition 取前 k 个，只对这 k 个排序；
+- lsh：随机超平面（SimHash）局部敏感哈希。每条示例按 lsh_tables 组、每组 lsh_bits 位的签名放入哈希桶，
+  查询时只取同桶及汉明距离为 1 的相邻桶中的候选，再用精确相似度重排。候选不足 k 个时退回 exact；
+- embedding：稠密向量余弦相似度，能匹配同义改写。示例向量按文本哈希缓存在磁盘上（见 src.agent.embeddings）。
+
+LSH 签名在写入时按当时的 IDF 计算，IDF 重算后已有的签名不变（重排使用最新权重，分数仍然精确），
+重建时才按最新的 IDF 重新签名。超平面由随机种子按词号顺序生成，
+只有签名随学习数据合并保存为 storage_path 下的 lsh_index.npz。
+
+调用方（IncrementalLearner）在 add/search 时加锁，后端本身不是线程安全的；
+prepare 在锁外调用，完成检索前可能阻塞的工作（如请求向量接口），使其他检索和保存示例不必等待网络。
+
+Usage:
+    backend = create_backend("lsh", index)
+    backend.add(row, text, counts)
+    backend.prepare(text, rows)
+    rows, scores = backend.search(text, counts, top_k=5)
+
+    # 在合成语料上比较各后端的召回率与延迟
+    python -m src.agent.retrieval --sizes 1000 10000 100000
+"""
+
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.log import get_logger
+from .embeddings import text_key
+from .tfidf_index import TfidfIndex
+
+logger = get_logger("agent.retrieval")
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    分数最高的 top_k 个下标（按分数从高到低），只对前 k 个排序
+    Indices of the top_k scores in descending order, without a full sort.
+
+    Args:
+        scores: 分数
+        top_k: 数量
+
+    Returns:
+        np.ndarray: 下标
+    """
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if top_k < len(scores):
+        candidates = np.argpartition(scores, -top_k)[-top_k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+class RetrievalBackend:
+    """检索后端基类  Base class of retrieval backends
+
+    Args:
+        index: 学习器的 TF-IDF 索引
+    """
+
+    name = "base"
+
+    def __init__(self, index: TfidfIndex):
+        self.index = index
+
+    def add(self, row: int, text: str, counts: Dict[str, int]):
+        """索引中新增一行后调用  Called after a row was appended to the index"""
+
+    def prepare(self, text: str, rows: int):
+        """
+        在调用方的锁外完成检索前可能阻塞的工作，必须线程安全
+        Do blocking work ahead of search() without the caller's lock; must be thread-safe.
+
+        Args:
+            text: 查询原文
+            rows: 调用方在锁内读取的行数，只需为前 rows 行做准备
+        """
+
+    def search(self, text: str, counts: Dict[str, int], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检索最相似的 top_k 行
+        Return the rows most similar to a query.
+
+        Args:
+            text: 查询原文
+            counts: 查询的词频
+            top_k: 返回数量
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: 行号与相似度，按相似度从高到低
+        """
+        raise NotImplementedError
+
+    def rebuild(self):
+        """按索引的当前状态重建  Rebuild from the index's current state"""
+
+    def save(self, storage_path: str, rows: int, fingerprint: str):
+        """保存前 rows 行的后端状态  Persist the state of the first rows rows"""
+
+    def load(self, storage_path: str, fingerprint_of) -> bool:
+        """
+        加载已保存的状态，之后的行由调用方补齐
+        Load persisted state; rows added after it was saved are caught up by the backend.
+
+        Args:
+            storage_path: 学习数据存储路径
+            fingerprint_of: 行号 -> 指纹，用于确认保存的状态对应当前示例
+
+        Returns:
+            bool: 是否成功加载
+        """
+        return True
+
+
+class ExactBackend(RetrievalBackend):
+    """精确检索：全量 float32 稀疏点积 + argpartition  Exact top-k over every row"""
+
+    name = "exact"
+
+    def search(self, text: str, counts: Dict[str, int], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.index.query(counts)
+        rows = top_k_indices(scores, top_k)
+        return rows, scores[rows]
+
+
+class LSHBackend(RetrievalBackend):
+    """随机超平面 LSH：多表分桶 + 相邻桶探测 + 精确重排  Multi-table SimHash with multi-probe and exact re-ranking
+
+    Args:
+        index: 学习器的 TF-IDF 索引
+        tables: 哈希表数量，越多召回率越高
+        bits: 每个表的签名位数，越多桶越小、候选越少
+        seed: 生成超平面的随机种子
+    """
+
+    name = "lsh"
+    file_name = "lsh_index.npz"
+
+    def __init__(self, index: TfidfIndex, tables: int = 8, bits: int = 12, seed: int = 0):
+        super().__init__(index)
+        if not 1 <= bits <= 30:
+            raise ValueError("lsh_bits 必须在 1 到 30 之间")
+        self.tables = tables
+        self.bits = bits
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        self._planes = np.zeros((0, tables * bits), dtype=np.float32)
+        self._keys = np.zeros((0, tables), dtype=np.int64)
+        self._n = 0
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(tables)]
+        self._weights = (1 << np.arange(bits, dtype=np.int64))
+
+    def _ensure_planes(self):
+        """词表增长后为新词生成超平面分量  Extend the hyperplanes to new terms"""
+        vocab_size = self.index.vocabulary_size
+        if vocab_size > len(self._planes):
+            extra = self._rng.standard_normal((vocab_size - len(self._planes), self.tables * self.bits))
+            self._planes = np.vstack([self._planes, extra.astype(np.float32)])
+
+    def _signature_keys(self, projections: np.ndarray) -> np.ndarray:
+        """投影的符号按表打包成整数键  Pack projection signs into one integer key per table"""
+        signs = (projections > 0).reshape(len(projections), self.tables, self.bits)
+        return signs.astype(np.int64) @ self._weights
+
+    def _row_keys(self, start: int, end: int) -> np.ndarray:
+        if not self.index.vocabulary_size:
+            return np.zeros((end - start, self.tables), dtype=np.int64)
+        matrix = self.index.matrix()[start:end]
+        return self._signature_keys(np.asarray(matrix @ self._planes[:matrix.shape[1]]))
+
+    def _append_keys(self, keys: np.ndarray):
+        for offset, row_keys in enumerate(keys):
+            row = self._n + offset
+            for table, key in enumerate(row_keys):
+                self._buckets[table].setdefault(int(key), []).append(row)
+        end = self._n + len(keys)
+        if end > len(self._keys):
+            # 按 2 倍扩容，逐条追加的摊还代价为 O(1)  Grow geometrically so appends stay amortized O(1)
+            grown = np.zeros((max(end, 2 * len(self._keys), 16), self.tables), dtype=np.int64)
+            grown[:self._n] = self._keys[:self._n]
+            self._keys = grown
+        self._keys[self._n:end] = keys
+        self._n = end
+
+    def _catch_up(self):
+        """为索引中尚未签名的行计算签名  Sign the index rows added since the last call"""
+        if self._n < self.index.n_rows:
+            self._ensure_planes()
+            self._append_keys(self._row_keys(self._n, self.index.n_rows))
+
+    def add(self, row: int, text: str, counts: Dict[str, int]):
+        self._catch_up()
+
+    def rebuild(self):
+        self._ensure_planes()
+        self._keys = np.zeros((0, self.tables), dtype=np.int64)
+        self._buckets = [{} for _ in range(self.tables)]
+        self._n = 0
+        self._catch_up()
+
+    def _candidates(self, query: np.ndarray) -> np.ndarray:
+        self._ensure_planes()
+        nonzero = np.flatnonzero(query)
+        projections = query[nonzero] @ self._planes[nonzero]
+        keys = self._signature_keys(projections[None, :])[0]
+        candidates = set()
+        for table, key in enumerate(keys):
+            buckets = self._buckets[table]
+            # 探测同桶及只差一位的相邻桶  Probe the bucket and its Hamming-distance-1 neighbours
+            for probe in [int(key)] + [int(key) ^ (1 << bit) for bit in range(self.bits)]:
+                candidates.update(buckets.get(probe, ()))
+        return np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+
+    def search(self, text: str, counts: Dict[str, int], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        self._catch_up()
+        query = self.index.transform(counts)
+        candidates = self._candidates(query) if query.any() else np.zeros(0, dtype=np.int64)
+        if len(candidates) < top_k:
+            return ExactBackend(self.index).search(text, counts, top_k)
+        scores = self.index.matrix()[candidates].dot(query)
+        order = top_k_indices(scores, top_k)
+        return candidates[order], scores[order]
+
+    def save(self, storage_path: str, rows: int, fingerprint: str):
+        from .incremental_learning import _atomic_write
+        # 超平面由种子按词号顺序生成，只需保存签名  Hyperplanes are regenerated from the seed
+        keys = self._keys[:min(rows, self._n)].astype(np.int32)
+        path = os.path.join(storage_path, self.file_name)
+        _atomic_write(path, 'wb', lambda f: np.savez(
+            f, keys=keys, tables=self.tables, bits=self.bits, seed=self.seed, fingerprint=fingerprint))
+
+    def load(self, storage_path: str, fingerprint_of) -> bool:
+        path = os.path.join(storage_path, self.file_name)
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                if (int(data["tables"]), int(data["bits"]), int(data["seed"])) != (self.tables, self.bits, self.seed):
+                    logger.info("LSH 参数已变化，重建 LSH 索引")
+                    return False
+                keys = data["keys"].astype(np.int64)
+                rows = len(keys)
+                if rows > self.index.n_rows or (rows and str(data["fingerprint"]) != fingerprint_of(rows - 1)):
+                    logger.warning("LSH 索引与学习数据不一致，重建 LSH 索引")
+                    return False
+        except Exception as e:
+            logger.error(f"加载 LSH 索引失败: {e}")
+            return False
+        self._ensure_planes()
+        self._keys = np.zeros((0, self.tables), dtype=np.int64)
+        self._buckets = [{} for _ in range(self.tables)]
+        self._n = 0
+        self._append_keys(keys)
+        # 保存之后新增的行  Rows added since the save
+        self._catch_up()
+        return True
+
+
+class EmbeddingBackend(RetrievalBackend):
+    """向量检索：示例向量按文本哈希缓存在磁盘上  Dense embedding retrieval over an on-disk cache
+
+    保存示例时不请求向量接口。prepare 在学习器的锁外为新示例批量请求向量并计算查询向量，
+    search 只读取缓存；查询向量不可用时本次检索退回 exact，尚无向量的示例本次不参与检索。
+
+    Args:
+        index: 学习器的 TF-IDF 索引（退回 exact 时使用）
+        text_of: 行号 -> 示例输入文本
+        embedder: LangChain Embeddings
+        store: 向量缓存
+        batch_size: 每次请求的文本数
+        governor: 远程向量接口的调用治理，local 时为 None
+    """
+
+    name = "embedding"
+
+    def __init__(self, index: TfidfIndex, text_of: Callable[[int], str], embedder, store,
+                 batch_size: int = 10, governor=None):
+        super().__init__(index)
+        self.text_of = text_of
+        self.embedder = embedder
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.governor = governor
+        self._slots = np.zeros(0, dtype=np.int64)
+        self._n = 0
+        self._queries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._queries_lock = threading.Lock()
+        # 已请求过向量的行数，prepare 之间互斥，避免并发检索重复请求同一批示例
+        # Rows already embedded; prepare() calls serialize on this lock so a batch is requested once
+        self._embedded = 0
+        self._embed_lock = threading.Lock()
+
+    def _call(self, fn, description: str):
+        return self.governor.call(fn, description) if self.governor is not None else fn()
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _embed_rows(self, rows: int):
+        """为前 rows 行中尚未缓存向量的示例批量请求向量  Embed uncached rows below rows, in batches"""
+        if self._embedded >= rows:
+            return
+        with self._embed_lock:
+            start = self._embedded
+            if start >= rows:
+                return
+            texts = {}
+            for row in range(start, rows):
+                text = self.text_of(row)
+                texts.setdefault(text_key(text), text)
+            keys = list(texts)
+            missing = [key for key, slot in zip(keys, self.store.lookup(keys)) if slot < 0]
+            for offset in range(0, len(missing), self.batch_size):
+                batch = missing[offset:offset + self.batch_size]
+                vectors = self._call(lambda: self.embedder.embed_documents([texts[key] for key in batch]),
+                                     "Embedding调用")
+                self.store.add(batch, self._normalize(vectors))
+            if missing:
+                logger.info(f"新增 {len(missing)} 条示例向量")
+            self._embedded = rows
+
+    def _embed_query(self, text: str) -> np.ndarray:
+        key = text_key(text)
+        with self._queries_lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                return vector
+        vector = self._normalize(self._call(lambda: self.embedder.embed_query(text), "Embedding调用"))[0]
+        with self._queries_lock:
+            self._queries[key] = vector
+            if len(self._queries) > 256:
+                self._queries.popitem(last=False)
+        return vector
+
+    def prepare(self, text: str, rows: int):
+        try:
+            self._embed_rows(rows)
+            self._embed_query(text)
+        except Exception as e:
+            logger.warning(f"请求向量失败: {e}")
+
+    def _sync_slots(self):
+        """把每一行对应到缓存中的向量，只查本地缓存  Map rows to cached vectors; local lookups only"""
+        n_rows = self.index.n_rows
+        if len(self._slots) < n_rows:
+            grown = np.full(max(n_rows, 2 * len(self._slots), 16), -1, dtype=np.int64)
+            grown[:self._n] = self._slots[:self._n]
+            self._slots = grown
+        self._n = n_rows
+        pending = np.flatnonzero(self._slots[:n_rows] < 0)
+        if len(pending):
+            self._slots[pending] = self.store.lookup([text_key(self.text_of(int(row))) for row in pending])
+
+    def search(self, text: str, counts: Dict[str, int], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._queries_lock:
+            query = self._queries.get(text_key(text))
+        if query is None:
+            logger.warning("查询向量不可用，使用 exact")
+            return ExactBackend(self.index).search(text, counts, top_k)
+        self._sync_slots()
+        matrix = self.store.matrix()
+        if matrix.shape[1] != len(query):
+            raise ValueError(f"查询向量维度 {len(query)} 与缓存的维度 {matrix.shape[1]} 不一致")
+        slots = self._slots[:self._n]
+        embedded = np.flatnonzero(slots >= 0)
+        if not len(embedded):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = (matrix @ query)[slots[embedded]]
+        best = top_k_indices(scores, top_k)
+        return embedded[best], scores[best]
+
+    def rebuild(self):
+        self._slots = np.zeros(0, dtype=np.int64)
+        self._n = 0
+        with self._embed_lock:
+            self._embedded = 0
+
+    def load(self, storage_path: str, fingerprint_of) -> bool:
+        # 向量已按文本哈希缓存在磁盘上，检索时按需补齐  Vectors are cached on disk and looked up lazily
+        return True
+
+
+BACKENDS = {
+    ExactBackend.name: ExactBackend,
+    LSHBackend.name: LSHBackend,
+    EmbeddingBackend.name: EmbeddingBackend,
+}
+
+
+def create_backend(name: str, index: TfidfIndex, **kwargs) -> RetrievalBackend:
+    """
+    按名称创建检索后端，未知名称时使用 exact
+    Create a retrieval backend by name, falling back to exact.
+
+    Args:
+        name: 后端名称：exact / lsh / embedding
+        index: 学习器的 TF-IDF 索引
+        **kwargs: 后端参数
+
+    Returns:
+        RetrievalBackend: 检索后端
+    """
+    backend_cls = BACKENDS.get(name)
+    if backend_cls is None:
+        logger.warning(f"未知的检索后端 {name}，使用 exact")
+        return ExactBackend(index)
+    return backend_cls(index, **kwargs)
+
+
+def _synthetic_corpus(size: int, vocab_size: int, topics: int, rng: np.random.Generator) -> List[Dict[str, int]]:
+    """按主题生成的合成语料：每条示例从一个主题的词分布中取词  Topic-structured synthetic term counts"""
+    topic_terms = [rng.choice(vocab_size, size=200, replace=False) for _ in range(topics)]
+    docs = []
+    for _ in range(size):
+        terms = topic_terms[rng.integers(topics)]
+        words = np.concatenate([terms[rng.zipf(1.5, size=20) % len(terms)], rng.integers(vocab_size, size=10)])
+        counts: Dict[str, int] = {}
+        for word in words:
+            counts[f"w{word}"] = counts.get(f"w{word}", 0) + 1
+        docs.append(counts)
+    return docs
+
+
+def benchmark(sizes: List[int], queries: int = 200, top_k: int = 5, vocab_size: int = 50000,
+              topics: int = 500, backend_options: Optional[Dict[str, Dict]] = None, seed: int = 0) -> List[Dict]:
+    """
+    在合成语料上比较各后端的 recall@k 与查询延迟（以 exact 的结果为准）
+    Compare recall@k against exact and the query latency of each backend on synthetic corpora.
+
+    Args:
+        sizes: 语料规模列表
+        queries: 每个规模的查询数
+        top_k: 检索数量
+        vocab_size: 合成词表大小
+        topics: 合成主题数
+        backend_options: 后端名称 -> 创建参数，默认比较 exact 与 lsh
+        seed: 随机种子
+
+    Returns:
+        List[Dict]: 每个规模、每个后端一行结果
+    """
+    backend_options = backend_options or {"exact": {}, "lsh": {}}
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        docs = _synthetic_corpus(size, vocab_size, topics, rng)
+        index = TfidfIndex()
+        for counts in docs:
+            index.add(counts)
+        index.refresh_idf()
+        query_docs = [docs[i] for i in rng.integers(size, size=queries)]
+        truth = [set(ExactBackend(index).search("", q, top_k)[0].tolist()) for q in query_docs]
+        for name, options in backend_options.items():
+            started = time.perf_counter()
+            backend = create_backend(name, index, **options)
+            backend.rebuild()
+            build_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            found = [set(backend.search("", q, top_k)[0].tolist()) for q in query_docs]
+            latency_ms = (time.perf_counter() - started) / queries * 1000
+            recall = float(np.mean([len(f & t) / max(len(t), 1) for f, t in zip(found, truth)]))
+            results.append({"size": size, "backend": name, "recall": recall,
+                            "latency_ms": latency_ms, "build_seconds": build_seconds})
+    return results
+
+
+def main():
+    """检索后端基准测试  Recall/latency benchmark of the retrieval backends"""
+    parser = argparse.ArgumentParser(description="Benchmark learner retrieval backends on synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Corpus sizes")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per corpus size")
+    parser.add_argument("--top-k", type=int, default=5, help="Number of results per query")
+    parser.add_argument("--lsh-tables", type=int, default=8, help="Number of LSH tables")
+    parser.add_argument("--lsh-bits", type=int, default=12, help="Bits per LSH table")
+    args = parser.parse_args()
+
+    options = {"exact": {}, "lsh": {"tables": args.lsh_tables, "bits": args.lsh_bits}}
+    print(f"{'size':>8} {'backend':>8} {'recall@' + str(args.top_k):>9} {'latency(ms)':>12} {'build(s)':>9}")
+    for row in benchmark(args.sizes, args.queries, args.top_k, backend_options=options):
+        print(f"{row['size']:>8} {row['backend']:>8} {row['recall']:>9.3f} "
+              f"{row['latency_ms']:>12.3f} {row['build_seconds']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+中文分词  Cached, preloadable and parallel jieba segmentation.
+
+- jieba 第一次分词时才加载词典（约 1 秒），加载发生在哪个请求线程就阻塞哪个请求。preload_segmenter
+  在启动时于后台线程中加载，并把前缀词典缓存放在 resources 下，临时目录被清理后也不必重新构建；
+- tokenize 按文本哈希做 LRU 缓存，同一条示例或同一段差异不会重复分词；
+- segment_many 批量分词：缓存未命中的文本超过 parallel_threshold 条时分块交给多个进程，
+  用于重建索引等需要对大量示例分词的场景。
+
+Usage:
+    preload_segmenter()
+    tokens = tokenize("潞晨科技开源视频生成模型")
+    token_lists = segment_many(texts)
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import jieba
+
+from src.log import get_logger
+
+logger = get_logger("agent.segmentation")
+
+_ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+
+# 默认分词配置，可在 config.yaml 的 segmentation 节点中覆盖
+# Default segmentation settings, can be overridden by the `segmentation` section of config.yaml
+DEFAULT_SEGMENTATION_CONFIG = {
+    "cache_file": "resources/jieba.cache",   # jieba 前缀词典缓存（相对项目根目录）
+    "token_cache_size": 4096,                # 分词结果 LRU 缓存的条数
+    "workers": 0,                            # 批量分词的进程数，0 表示 CPU 核数
+    "parallel_threshold": 500,               # 未命中缓存的文本达到该数量才使用多进程
+}
+
+_settings: Optional[Dict] = None
+_settings_lock = threading.Lock()
+_cache: "OrderedDict[bytes, Tuple[str, ...]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_preload_lock = threading.Lock()
+_preload_thread: Optional[threading.Thread] = None
+
+
+def load_segmentation_config() -> Dict:
+    """读取分词配置  Load segmentation settings merged with defaults
+
+    Returns:
+        Dict: 分词配置
+    """
+    settings = dict(DEFAULT_SEGMENTATION_CONFIG)
+    try:
+        from src.services import ConfigManager
+        config = ConfigManager().get_config() or {}
+        for key, value in (config.get("segmentation") or {}).items():
+            if key in settings and value is not None:
+                settings[key] = type(DEFAULT_SEGMENTATION_CONFIG[key])(value)
+    except Exception as e:
+        logger.warning(f"读取分词配置失败，使用默认配置: {e}")
+    return settings
+
+
+def _get_settings() -> Dict:
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = load_segmentation_config()
+                _use_cache_file(_settings["cache_file"])
+    return _settings
+
+
+def _use_cache_file(cache_file: str):
+    """把 jieba 的前缀词典缓存放到固定位置  Keep jieba's prefix-dictionary cache out of the temp dir"""
+    if not cache_file:
+        return
+    path = Path(cache_file)
+    if not path.is_absolute():
+        path = _ROOT_DIR / path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    jieba.dt.cache_file = str(path)
+
+
+def preload_segmenter(background: bool = True) -> Optional[threading.Thread]:
+    """
+    加载 jieba 词典，避免第一次分词的请求等待
+    Load jieba's dictionary ahead of the first request.
+
+    Args:
+        background: 是否在后台线程中加载
+
+    Returns:
+        Optional[threading.Thread]: 后台加载线程，已加载或同步加载时为 None
+    """
+    global _preload_thread
+    _get_settings()
+    if jieba.dt.initialized:
+        return None
+    if not background:
+        jieba.initialize()
+        return None
+    with _preload_lock:
+        if _preload_thread is None or not _preload_thread.is_alive():
+            _preload_thread = threading.Thread(target=jieba.initialize, name="jieba-preload", daemon=True)
+            _preload_thread.start()
+        return _preload_thread
+
+
+def _cut(text: str) -> Tuple[str, ...]:
+    return tuple(jieba.cut(text))
+
+
+def tokenize(text: str) -> Tuple[str, ...]:
+    """
+    分词，结果按文本哈希做 LRU 缓存
+    Segment a text, memoized by its hash.
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        Tuple[str, ...]: 分词结果（不可变，可安全共享）
+    """
+    settings = _get_settings()
+    key = hashlib.sha1(text.encode("utf-8")).digest()
+    with _cache_lock:
+        tokens = _cache.get(key)
+        if tokens is not None:
+            _cache.move_to_end(key)
+            return tokens
+    tokens = _cut(text)
+    _remember(key, tokens, settings["token_cache_size"])
+    return tokens
+
+
+def _remember(key: bytes, tokens: Tuple[str, ...], capacity: int):
+    if capacity <= 0:
+        return
+    with _cache_lock:
+        _cache[key] = tokens
+        _cache.move_to_end(key)
+        while len(_cache) > capacity:
+            _cache.popitem(last=False)
+
+
+def _init_worker(cache_file: Optional[str]):
+    """工作进程从缓存加载词典  Workers load the dictionary from the shared cache file"""
+    if cache_file:
+        jieba.dt.cache_file = cache_file
+    jieba.initialize()
+
+
+def _cut_chunk(texts: List[str]) -> List[Tuple[str, ...]]:
+    return [_cut(text) for text in texts]
+
+
+def segment_many(texts: List[str], workers: Optional[int] = None) -> List[Tuple[str, ...]]:
+    """
+    批量分词，未命中缓存的文本较多时使用多进程
+    Segment many texts, in parallel processes when enough of them miss the cache.
+
+    Args:
+        texts: 文本列表
+        workers: 进程数，默认使用配置
+
+    Returns:
+        List[Tuple[str, ...]]: 与 texts 一一对应的分词结果
+    """
+    settings = _get_settings()
+    keys = [hashlib.sha1(text.encode("utf-8")).digest() for text in texts]
+    results: List[Optional[Tuple[str, ...]]] = [None] * len(texts)
+    with _cache_lock:
+        for i, key in enumerate(keys):
+            results[i] = _cache.get(key)
+    missing = [i for i, tokens in enumerate(results) if tokens is None]
+
+    workers = workers if workers is not None else settings["workers"]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(missing) >= settings["parallel_threshold"]:
+        # 先在本进程加载词典，fork 出的工作进程直接共享  Fork-started workers inherit a loaded dictionary
+        preload_segmenter(background=False)
+        chunk_size = max(1, len(missing) // (workers * 4))
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(jieba.dt.cache_file,)) as executor:
+                for chunk, token_lists in zip(chunks, executor.map(_cut_chunk, [[texts[i] for i in chunk] for chunk in chunks])):
+                    for i, tokens in zip(chunk, token_lists):
+                        results[i] = tokens
+            logger.info(f"使用 {workers} 个进程分词 {len(missing)} 条文本")
+        except Exception as e:
+            logger.warning(f"多进程分词失败，改为单进程: {e}")
+    for i in missing:
+        if results[i] is None:
+            results[i] = _cut(texts[i])
+        _remember(keys[i], results[i], settings["token_cache_size"])
+    return results
+
+
+def get_segmentation_stats() -> Dict:
+    """分词缓存状态  Size of the token cache and whether the dictionary is loaded"""
+    with _cache_lock:
+        size = len(_cache)
+    return {"cached_texts": size, "dictionary_loaded": bool(jieba.dt.initialized)}
@@ -0,0 +1,338 @@
+"""
+流式摘要解析  Incremental JSON parsing of streamed LLM responses.
+
+大模型客户端以 streaming=True 创建，这里逐块读取输出并增量解析其中的 JSON：
+- 每解析完一个字符串或数字就回调一次，关键点可以在整个响应结束前推送到界面；
+- 一旦输出偏离 JSON 语法（或顶层出现不认识的字段、JSON 之前的说明文字过长）立即抛出
+  StreamMalformedError，调用方中断流并重试，不必等待并支付整段错误响应；
+- 顶层对象闭合后即可停止读取，后续多余的文字不再接收。
+
+Usage:
+    parser = IncrementalJSONParser(expected_keys={"content", "key_points"}, on_value=callback)
+    for chunk in chain.stream(inputs):
+        if parser.feed(chunk.content):
+            break
+    json_text = parser.json_text
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.log import get_logger
+
+logger = get_logger("agent.streaming")
+
+Path = Tuple[Any, ...]
+
+# JSON 之前允许出现的说明文字长度（不含 <think> 推理内容、空白和 ``` 代码块标记）
+# Max non-JSON text before the object, excluding <think> blocks, whitespace and code fences
+MAX_PREAMBLE_CHARS = 2000
+
+_THINK_OPEN = "<think>"
+_THINK_CLOSE = "</think>"
+_LITERAL_CHARS = set("0123456789+-.eEtruefalsn")
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class StreamMalformedError(ValueError):
+    """流式输出不是预期的 JSON  The streamed output cannot be the expected JSON"""
+
+
+class _Frame:
+    """解析栈中的一个对象或数组  An open object or array on the parser stack"""
+    __slots__ = ("container", "path", "state", "key")
+
+    def __init__(self, container, path: Path, state: str):
+        self.container = container
+        self.path = path
+        self.state = state
+        self.key = None
+
+
+class IncrementalJSONParser:
+    """增量 JSON 解析器，只接受一个顶层对象  Push parser for a single top-level JSON object
+
+    Args:
+        expected_keys: 允许的顶层字段，为 None 时不检查
+        on_value: 每个字符串/数字/布尔值解析完成时的回调 (路径, 值)
+        max_preamble: JSON 之前允许的说明文字长度
+    """
+
+    def __init__(self, expected_keys: Optional[Iterable[str]] = None,
+                 on_value: Optional[Callable[[Path, Any], None]] = None,
+                 max_preamble: int = MAX_PREAMBLE_CHARS):
+        self.expected_keys = set(expected_keys) if expected_keys is not None else None
+        self.on_value = on_value
+        self.max_preamble = max_preamble
+        self.root: Optional[Dict[str, Any]] = None
+        self.done = False
+        self._preamble: List[str] = []
+        self._preamble_chars = 0
+        self._in_think = False
+        self._text: List[str] = []
+        self._stack: List[_Frame] = []
+        self._string: Optional[List[str]] = None
+        self._escape = False
+        self._unicode: Optional[str] = None
+        self._literal: Optional[List[str]] = None
+
+    @property
+    def json_text(self) -> str:
+        """已接收的 JSON 文本（从 { 开始）  JSON text received so far"""
+        return "".join(self._text)
+
+    def feed(self, chunk: str) -> bool:
+        """
+        输入一段流式输出
+        Feed a chunk of streamed text.
+
+        Args:
+            chunk: 新到达的文本
+
+        Returns:
+            bool: 顶层对象是否已经完整
+
+        Raises:
+            StreamMalformedError: 输出已不可能是预期的 JSON
+        """
+        if self.done or not chunk:
+            return self.done
+        for ch in chunk:
+            if self.root is None:
+                if ch == "{" and not self._in_think:
+                    self._open("{")
+                else:
+                    self._feed_preamble(ch)
+                continue
+            self._text.append(ch)
+            self._feed_char(ch)
+            if self.done:
+                break
+        return self.done
+
+    def _feed_preamble(self, ch: str):
+        """JSON 之前的文字：跳过 <think> 推理内容，其余计入长度限制  Text before the object"""
+        self._preamble.append(ch)
+        if self._in_think:
+            if ch == ">" and "".join(self._preamble[-len(_THINK_CLOSE):]) == _THINK_CLOSE:
+                self._in_think = False
+            return
+        if ch == ">" and "".join(self._preamble[-len(_THINK_OPEN):]) == _THINK_OPEN:
+            self._in_think = True
+            self._preamble_chars -= len(_THINK_OPEN) - 1
+            return
+        if not ch.isspace() and ch != "`":
+            self._preamble_chars += 1
+            if self._preamble_chars > self.max_preamble:
+                raise StreamMalformedError(f"JSON 之前的说明文字超过 {self.max_preamble} 个字符")
+
+    def _feed_char(self, ch: str):
+        if self._string is not None:
+            self._feed_string(ch)
+            return
+        if self._literal is not None:
+            if ch in _LITERAL_CHARS:
+                self._literal.append(ch)
+                return
+            self._finish_literal()
+        if ch.isspace():
+            return
+
+        frame = self._stack[-1]
+        state = frame.state
+        is_object = isinstance(frame.container, dict)
+        if state in ("value", "value_or_end"):
+            if ch == "]" and state == "value_or_end":
+                self._close()
+            elif ch in "{[":
+                self._open(ch)
+            elif ch == '"':
+                self._string = []
+            elif ch in "-0123456789tfn":
+                self._literal = [ch]
+            else:
+                raise StreamMalformedError(f"位置 {len(self._text)} 处应为值，实际为 {ch!r}")
+        elif state in ("key", "key_or_end"):
+            if ch == "}" and state == "key_or_end":
+                self._close()
+            elif ch == '"':
+                self._string = []
+            else:
+                raise StreamMalformedError(f"位置 {len(self._text)} 处应为字段名，实际为 {ch!r}")
+        elif state == "colon":
+            if ch != ":":
+                raise StreamMalformedError(f"位置 {len(self._text)} 处应为冒号，实际为 {ch!r}")
+            frame.state = "value"
+        elif state == "comma_or_end":
+            if ch == ",":
+                frame.state = "key" if is_object else "value"
+            elif (ch == "}" and is_object) or (ch == "]" and not is_object):
+                self._close()
+            else:
+                raise StreamMalformedError(f"位置 {len(self._text)} 处应为逗号或结束符，实际为 {ch!r}")
+
+    def _feed_string(self, ch: str):
+        if self._unicode is not None:
+            self._unicode += ch
+            if len(self._unicode) == 4:
+                try:
+                    self._string.append(chr(int(self._unicode, 16)))
+                except ValueError:
+                    raise StreamMalformedError(f"无效的 unicode 转义: \\u{self._unicode}")
+                self._unicode = None
+        elif self._escape:
+            self._escape = False
+            if ch == "u":
+                self._unicode = ""
+            elif ch in _ESCAPES:
+                self._string.append(_ESCAPES[ch])
+            else:
+                raise StreamMalformedError(f"无效的转义字符: \\{ch}")
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            value, self._string = "".join(self._string), None
+            frame = self._stack[-1]
+            if frame.state in ("key", "key_or_end"):
+                if (len(self._stack) == 1 and self.expected_keys is not None
+                        and value not in self.expected_keys):
+                    raise StreamMalformedError(f"未知的字段: {value}")
+                frame.key = value
+                frame.state = "colon"
+            else:
+                self._add_value(value)
+        else:
+            # 与 PydanticOutputParser 一样容忍字符串中的原始换行  Raw newlines are tolerated, as in json.loads(strict=False)
+            self._string.append(ch)
+
+    def _finish_literal(self):
+        text, self._literal = "".join(self._literal), None
+        try:
+            value = json.loads(text)
+        except ValueError:
+            raise StreamMalformedError(f"无效的字面量: {text}")
+        self._add_value(value)
+
+    def _child_path(self, frame: _Frame) -> Path:
+        if isinstance(frame.container, dict):
+            return frame.path + (frame.key,)
+        return frame.path + (len(frame.container),)
+
+    def _add_value(self, value):
+        frame = self._stack[-1]
+        path = self._child_path(frame)
+        if isinstance(frame.container, dict):
+            frame.container[frame.key] = value
+        else:
+            frame.container.append(value)
+        frame.state = "comma_or_end"
+        if self.on_value is not None and not isinstance(value, (dict, list)):
+            self.on_value(path, value)
+
+    def _open(self, bracket: str):
+        container = {} if bracket == "{" else []
+        state = "key_or_end" if bracket == "{" else "value_or_end"
+        if not self._stack:
+            self.root = container
+            self._text.append(bracket)
+            self._stack.append(_Frame(container, (), state))
+            return
+        parent = self._stack[-1]
+        path = self._child_path(parent)
+        # 容器在打开时就挂到父节点上，部分结果随时可读  Attached on open so the partial tree is always readable
+        if isinstance(parent.container, dict):
+            parent.container[parent.key] = container
+        else:
+            parent.container.append(container)
+        parent.state = "comma_or_end"
+        self._stack.append(_Frame(container, path, state))
+
+    def _close(self):
+        self._stack.pop()
+        if not self._stack:
+            self.done = True
+
+
+def stream_json(chunks: Iterable[Any], parser: IncrementalJSONParser) -> str:
+    """
+    读取流式输出直到顶层 JSON 对象完整
+    Consume streamed chunks until the top-level object closes.
+
+    Args:
+        chunks: chain.stream() 返回的迭代器（消息块或字符串）
+        parser: 增量解析器
+
+    Returns:
+        str: 完整的 JSON 文本
+
+    Raises:
+        StreamMalformedError: 输出格式错误或流在 JSON 完整之前结束
+    """
+    iterator = iter(chunks)
+    try:
+        for chunk in iterator:
+            text = chunk.content if hasattr(chunk, "content") else str(chunk)
+            if parser.feed(text):
+                break
+    finally:
+        # 提前结束时关闭流，不再接收剩余输出  Close the stream so the rest is not generated
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+    if not parser.done:
+        raise StreamMalformedError("流式输出在 JSON 完整之前结束")
+    return parser.json_text
+
+
+class LiveSummaryFeed:
+    """正在生成的摘要，供界面轮询展示  In-progress summaries for the UI to poll
+
+    Args:
+        max_entries: 保留的最近条目数
+    """
+
+    def __init__(self, max_entries: int = 20):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, label: str, key_points: List[str], status: str = "streaming"):
+        """更新某个订阅的部分关键点  Publish partial key points for a label"""
+        with self._lock:
+            self._entries.pop(label, None)
+            self._entries[label] = {
+                "label": label,
+                "key_points": list(key_points),
+                "status": status,
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def finish(self, label: str, status: str = "done"):
+        """标记摘要已完成或失败  Mark a label as finished"""
+        with self._lock:
+            entry = self._entries.get(label)
+            if entry is not None:
+                entry["status"] = status
+                entry["updated_at"] = datetime.now().isoformat(timespec="seconds")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """最近的条目，新的在前  Recent entries, newest first"""
+        with self._lock:
+            return [dict(entry, key_points=list(entry["key_points"])) for entry in reversed(self._entries.values())]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_live_feed = LiveSummaryFeed()
+
+
+def get_live_feed() -> LiveSummaryFeed:
+    """获取进程级共享的实时摘要  Return the process-wide live summary feed"""
+    return _live_feed
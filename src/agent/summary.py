@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
 import yaml
@@ -10,14 +11,54 @@ from langchain.memory import ConversationSummaryBufferMemory
 from langchain_core.messages import SystemMessage
 import json
 import re
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional, Dict, Any, Hashable, Callable
 from src.log import get_logger
 from src.agent.llm import get_ali_llm, get_zhipu_llm
 from src.agent.incremental_learning import IncrementalLearner
+from src.agent.llm_cache import get_llm_cache
+from src.agent.tokens import TokenCounter, get_token_counter
+from src.agent.streaming import IncrementalJSONParser, stream_json
+from src.agent.governor import CircuitOpenError, LLMGovernor
+from src.agent.prompt_builder import BuiltPrompt, PromptBuilder, format_instructions, record_prompt_usage
 
 logger = get_logger("agent.summary")
 
+# 提示模板版本，修改任何提示模板后需要递增，使旧的缓存响应失效
+PROMPT_VERSION = "2"
+
+# 大型差异（超过 max_token_limit）的摘要配置，可在 config.yaml 的 summary 节点中覆盖
+# Settings for oversize diffs, can be overridden by the `summary` section of config.yaml
+DEFAULT_SUMMARY_CONFIG = {
+    "large_diff_mode": "map_reduce",   # map_reduce: 各块并发分析后合并；memory: 各块依次处理并累积对话记忆
+    "map_concurrency": 4,              # map 阶段同时进行的大模型调用数
+    "token_counter": "auto",           # token 计数器: auto（按厂商选择离线分词器）/ qwen / tiktoken / estimate
+    "example_tokens": 1500,            # 提示中学习示例的 token 预算
+    "streaming": True,                 # 流式读取响应并增量解析 JSON，格式错误时立即中断重试
+    "prompt_tokens": 0,                # 整个提示的 token 上限，学习示例只使用剩余部分；0 表示只受 example_tokens 限制
+    "example_candidates": 10,          # 检索的候选示例数，按 相似度×评分 与 MMR 去重后选取
+    "mmr_lambda": 0.7,                 # MMR 中相关性的权重，1 表示不去重
+    "compact_format": True,            # 使用紧凑的 JSON 骨架代替 PydanticOutputParser 的完整 JSON Schema
+}
+
+
+def load_summary_config() -> Dict:
+    """读取摘要配置  Load summary settings merged with defaults
+
+    Returns:
+        Dict: 摘要配置
+    """
+    settings = dict(DEFAULT_SUMMARY_CONFIG)
+    try:
+        from src.services import ConfigManager
+        config = ConfigManager().get_config() or {}
+        for key, value in (config.get("summary") or {}).items():
+            if key in settings and value is not None:
+                settings[key] = type(DEFAULT_SUMMARY_CONFIG[key])(value)
+    except Exception as e:
+        logger.warning(f"读取摘要配置失败，使用默认配置: {e}")
+    return settings
+
 
 
 # 定义 Pydantic 模型用于输出解析
@@ -31,18 +72,101 @@ class SummaryResponse(BaseModel):
     error_message: Optional[str] = Field(default=None, description="错误信息")
     raw_response: Optional[str] = Field(default=None, description="原始响应")
     learning_examples: Optional[List[Dict[str, Any]]] = Field(default=None, description="使用的学习示例")
+    prompt_tokens: Optional[Dict[str, int]] = Field(default=None, description="提示各部分的 token 数")
+
+# 批量摘要中单个条目的输出
+class BatchSummaryItem(BaseModel):
+    id: str = Field(description="条目编号，与输入中的 id 一致")
+    content: List[str] = Field(default_factory=list, description="内容更新概要")
+    key_points: List[str] = Field(default_factory=list, description="关键点列表")
+    url_list: List[List[str]] = Field(default_factory=list, description="每个关键点对应的URL列表")
+    word_count: int = Field(default=0, description="内容字数统计")
+
+    @field_validator("id", mode="before")
+    @classmethod
+    def _id_as_str(cls, value: Any) -> Any:
+        # 模型常把编号原样输出为数字  Models often echo the numeric id as a number
+        return str(value) if isinstance(value, int) else value
+
+class BatchSummaryResponse(BaseModel):
+    summaries: List[BatchSummaryItem] = Field(default_factory=list, description="每个输入条目的摘要")
+
+# 需要模型填写的字段，其余字段由程序补全  Fields the model fills in; the rest are set by the agent
+SUMMARY_FIELDS = ("content", "key_points", "url_list", "word_count")
+
+# 提示的固定前缀：所有调用逐字节相同，放在消息最前面，便于厂商侧的前缀缓存命中
+# Static prompt prefixes; identical across calls so provider-side prefix caching can hit
+SUMMARY_INSTRUCTIONS = """你是一个订阅号运营专家，可以根据差异内容总结出订阅内容的更新情况。请对用户给出的内容差异进行总结。
+
+###注意，有些内容的可能仅仅是时间或者数据的变化，这样的内容更新是不需要总结的，可以看作没有更新，返回空数组
+###注意：content和key_points的列表长度应当一致，也就是他们是一一对应关系
+###注意：url_list是一个二维数组，每个元素对应key_points中的一个元素，包含该关键点中提到的所有URL
+
+###URL提取特别要求：
+- 提取的URL必须是完整的绝对URL，包含协议（http://或https://）和域名
+- 如果原始内容中只有相对路径（如/path/to/page），请根据上下文推断出完整的域名，例如 "/news/123" -> "https://网站域名/news/123"
+- 如果无法确定域名，则不要包含该URL
+
+###要求：
+1. 提供内容更新概要（content），用数组形式返回。
+2. 提取每个内容的关键点（key_points），每个关键点应简洁且突出重点。
+3. 从内容中提取每个关键点相关的URL（url_list），如果没有URL则返回空数组。
+4. 计算 content 字段的总字数（仅统计中文和英文字符，不包括标点和空格）。
+5. 返回结果使用中文，如果没有实质性更新或关键点，返回空数组。
+6. 如果给出了历史学习示例，模仿其中评分较高（大于0.8）的示例的摘要风格和关键点提取方式。"""
+
+BATCH_INSTRUCTIONS = """你是一个订阅号运营专家，可以根据差异内容总结出订阅内容的更新情况。
+用户会给出多个互不相关的订阅的内容差异，每个差异放在 <item id="编号"> 标签中，请分别进行总结。
+
+###注意，有些内容的可能仅仅是时间或者数据的变化，这样的内容更新是不需要总结的，可以看作没有更新，返回空数组
+###注意：每个条目单独总结，不要混用不同条目的内容；summaries 中每个输入条目都要有一项，id 与输入一致
+###注意：content和key_points的列表长度应当一致，也就是他们是一一对应关系
+###注意：url_list是一个二维数组，每个元素对应key_points中的一个元素，包含该关键点中提到的所有URL
+
+###要求：
+1. 提供内容更新概要（content），用数组形式返回。
+2. 提取每个内容的关键点（key_points），每个关键点应简洁且突出重点。
+3. 从内容中提取每个关键点相关的完整URL（url_list，以http://或https://开头），如果没有URL则返回空数组。
+4. 计算 content 字段的总字数（仅统计中文和英文字符，不包括标点和空格）。
+5. 返回结果使用中文，如果没有实质性更新或关键点，返回空数组。
+6. 如果给出了历史学习示例，模仿其中评分较高的示例的摘要风格和关键点提取方式。"""
+
+REDUCE_INSTRUCTIONS = """根据用户给出的从各内容块收集的信息，生成最终摘要。
+
+注意：
+1. content 和 key_points 必须一一对应
+2. url_list 是二维数组，对应每个 key_point 中的URL
+3. 计算 word_count (内容字符总数，不含标点和空格)
+4. 如果发现重复内容，请合并或删除
+5. 如果给出了历史学习示例，参考其中高评分示例的摘要风格"""
 
 class SubscriptionAgent:
-    def __init__(self, llm_model=None, max_retries=3, retry_delay=2, max_token_limit=30000):
+    def __init__(self, llm_model=None, max_retries=None, retry_delay=None, max_token_limit=30000,
+                 batch_token_limit=6000, max_batch_items=8, learner: Optional[IncrementalLearner] = None,
+                 large_diff_mode: Optional[str] = None, map_concurrency: Optional[int] = None,
+                 token_counter: Optional[TokenCounter] = None):
         """
         Args:
             llm_model: 可选的 LLM 模型，如果为 None，则使用默认配置
-            max_retries: 最大重试次数
-            retry_delay: 重试间隔时间（秒）
+            max_retries: 最大尝试次数，为 None 时读取 llm_governor 配置
+            retry_delay: 首次重试的退避时间（秒），之后指数增长，为 None 时读取配置
+            batch_token_limit: 批量摘要时每个请求中差异内容的 token 预算
+            max_batch_items: 每个批量请求最多包含的差异条目数
+            learner: 可选的增量学习器，多个智能体可共享同一个，为 None 时新建
+            large_diff_mode: 超出 max_token_limit 的差异的处理方式，map_reduce 或 memory，为 None 时读取配置
+            map_concurrency: map_reduce 模式下并发分析的块数，为 None 时读取配置
+            token_counter: 可选的 token 计数器，为 None 时按配置的厂商和模型选择
         """
         self.max_token_limit = max_token_limit
+        self.batch_token_limit = batch_token_limit
+        self.max_batch_items = max_batch_items
+        summary_config = load_summary_config()
+        self.large_diff_mode = large_diff_mode or summary_config["large_diff_mode"]
+        self.map_concurrency = max(1, map_concurrency or summary_config["map_concurrency"])
+        self.example_token_limit = summary_config["example_tokens"]
+        self.streaming = summary_config["streaming"]
         # 初始化增量学习器
-        self.learner = IncrementalLearner()
+        self.learner = learner if learner is not None else IncrementalLearner()
         
         # 根据配置文件选择模型
         if llm_model:
@@ -71,46 +195,56 @@ class SubscriptionAgent:
                 logger.warning(f"未知的模型提供商: {provider}，默认使用智谱模型")
                 self.llm = get_zhipu_llm(model_name)
         
-        self.max_retries = max_retries  # 最大重试次数
-        self.retry_delay = retry_delay  # 重试间隔时间（秒）
+        from src.services import ConfigManager
+        app_config = (ConfigManager().get_config() or {}).get("app", {})
+        self.provider = app_config.get("provider")
+
+        # token 计数器：判断是否分块、分块与批量打包、学习示例裁剪都使用同一个计数器
+        if token_counter is None:
+            token_counter = get_token_counter(self.provider, app_config.get("model"),
+                                              summary_config["token_counter"])
+        self.token_counter = token_counter
+
+        # 调用治理：按错误类型退避重试，同一厂商的智能体共用一个熔断器
+        self.governor = LLMGovernor.from_config(self.provider, max_retries, retry_delay)
+        self.max_retries = self.governor.max_attempts  # 最大尝试次数
+        self.retry_delay = self.governor.base_delay  # 首次重试的退避时间（秒）
         
         # 定义 Pydantic 输出解析器
         self.parser = PydanticOutputParser(pydantic_object=SummaryResponse)
         
-        # 定义提示模板
-        self.prompt_template = PromptTemplate(
-            input_variables=["contentdiff", "similar_examples"],
-            partial_variables={"format_instructions": self.parser.get_format_instructions()},
+        # 提示组装：固定前缀（规则与格式说明）只组装一次，学习示例按 token 预算与 MMR 选取
+        self.batch_parser = PydanticOutputParser(pydantic_object=BatchSummaryResponse)
+        self.prompt_token_limit = summary_config["prompt_tokens"] or None
+        self.example_candidates = summary_config["example_candidates"]
+        if summary_config["compact_format"]:
+            summary_format = format_instructions(SummaryResponse, SUMMARY_FIELDS)
+            batch_format = format_instructions(BatchSummaryResponse)
+        else:
+            summary_format = self.parser.get_format_instructions()
+            batch_format = self.batch_parser.get_format_instructions()
+        builder_options = dict(token_counter=self.token_counter, example_tokens=self.example_token_limit,
+                               mmr_lambda=summary_config["mmr_lambda"])
+        self.prompt_builder = PromptBuilder(SUMMARY_INSTRUCTIONS, summary_format, **builder_options)
+        # 批量摘要：多个订阅的差异放在同一个请求中，前缀和学习示例只发送一次
+        self.batch_prompt_builder = PromptBuilder(BATCH_INSTRUCTIONS, batch_format,
+                                                  content_title="内容差异条目", **builder_options)
+        self.reduce_prompt_builder = PromptBuilder(REDUCE_INSTRUCTIONS, summary_format, input_chars=100,
+                                                   content_title="收集的信息", **builder_options)
+
+        # 大型差异分块摘要：每个块单独分析（map），再合并为最终摘要（reduce）
+        self.chunk_prompt_template = PromptTemplate(
+            input_variables=["chunk_content"],
             template="""
-            你是一个订阅号运营专家，可以根据差异内容总结出订阅内容的更新情况。请对以下内容差异进行总结：
-            {contentdiff}
-
-            ###注意，有些内容的可能仅仅是时间或者数据的变化，这样的内容更新是不需要总结的，可以看作没有更新，返回空数组
-            ###注意：content和key_points的列表长度应当一致，也就是他们是一一对应关系
-            ###注意：url_list是一个二维数组，每个元素对应key_points中的一个元素，包含该关键点中提到的所有URL
-
-            ###历史学习示例：
-            {similar_examples}
-
-            ###URL提取特别要求：
-            - 提取的URL必须是完整的绝对URL，包含协议（http://或https://）和域名
-            - 如果原始内容中只有相对路径（如/path/to/page），请根据上下文推断出完整的域名
-            - 如果内容来自特定网站，请构建完整的URL，例如：
-              - 相对路径 "/news/123" -> "https://网站域名/news/123"
-              - 如果能从内容中识别出域名信息，请使用该域名
-            - 如果无法确定域名，则不要包含该URL
-            - 确保所有URL都以http://或https://开头
+            请分析以下内容差异块，提取关键信息：
+            {chunk_content}
+            
+            请提供以下内容（JSON格式）：
+            1. content: 内容更新概要列表
+            2. key_points: 对应的关键点列表
+            3. urls: 从内容中提取的URL列表（二维数组）
             
-            ###要求：
-            1. 提供内容更新概要（content），用数组形式返回。
-            2. 提取每个内容的关键点（key_points），每个关键点应简洁且突出重点。
-            3. 从内容中提取每个关键点相关的URL（url_list），如果没有URL则返回空数组。
-            4. 计算 content 字段的总字数（仅统计中文和英文字符，不包括标点和空格）。
-            5. 返回结果使用中文，如果没有实质性更新或关键点，返回空数组。
-            6. 参考历史学习示例中的成功案例，特别关注那些评分较高的示例，模仿其摘要风格和关键点提取方式。
-            7. 优先选取评分大于0.8的高质量示例作为参考模板。
-            8. 严格按照以下 JSON 格式返回结果，不添加任何多余的说明文字或注释：
-            {format_instructions}
+            只返回JSON格式结果，不要添加额外说明。
             """
         )
 
@@ -124,6 +258,93 @@ class SubscriptionAgent:
 
 
 
+    @property
+    def model_name(self) -> str:
+        """当前模型名称，用于缓存键  Model name used in cache keys"""
+        return getattr(self.llm, "model_name", None) or getattr(self.llm, "model", None) or type(self.llm).__name__
+
+    def _cache_key(self, kind: str, text: str) -> str:
+        return get_llm_cache().make_key(kind, PROMPT_VERSION, self.model_name, text)
+
+    def _call_llm(self, prompt_template: PromptTemplate, inputs: Dict[str, Any],
+                  expected_keys: Optional[List[str]] = None,
+                  on_value: Optional[Callable[[tuple, Any], None]] = None) -> str:
+        """
+        调用大模型并返回响应文本；启用流式时边接收边解析 JSON
+        参数:
+            prompt_template: 提示模板
+            inputs: 模板变量
+            expected_keys: 流式解析时允许的顶层字段，出现其他字段立即中断
+            on_value: 流式解析出每个字符串/数字时的回调 (路径, 值)
+        返回:
+            str: 响应文本，流式时为完整的 JSON
+        异常:
+            StreamMalformedError: 流式输出格式错误，流已中断
+        """
+        return self._complete(prompt_template | self.llm, inputs, expected_keys, on_value)
+
+    def _call_prompt(self, prompt: BuiltPrompt, expected_keys: Optional[List[str]] = None,
+                     on_value: Optional[Callable[[tuple, Any], None]] = None) -> str:
+        """
+        发送 PromptBuilder 组装的提示，并累计各部分的 token 数
+        参数:
+            prompt: 组装好的提示
+            expected_keys: 流式解析时允许的顶层字段
+            on_value: 流式解析出每个字符串/数字时的回调 (路径, 值)
+        返回:
+            str: 响应文本
+        """
+        usage = prompt.usage
+        logger.debug(f"提示 token: 前缀 {usage['prefix']}, 示例 {usage['examples']}, "
+                     f"内容 {usage['content']}, 合计 {usage['total']}")
+        record_prompt_usage(usage)
+        return self._complete(self.llm, prompt.messages, expected_keys, on_value)
+
+    def _complete(self, runnable, inputs, expected_keys: Optional[List[str]] = None,
+                  on_value: Optional[Callable[[tuple, Any], None]] = None) -> str:
+        if not self.streaming:
+            raw_response = runnable.invoke(inputs)
+            return raw_response.content if hasattr(raw_response, 'content') else str(raw_response)
+        parser = IncrementalJSONParser(expected_keys=expected_keys, on_value=on_value)
+        return stream_json(runnable.stream(inputs), parser)
+
+    @staticmethod
+    def _batch_key_point_collector(ids: Dict[str, Hashable],
+                                   on_partial: Optional[Callable[[Hashable, List[str]], None]]):
+        """把批量响应中各条目的 key_points 推送给 on_partial(标识, 关键点)  Per-item variant for batches"""
+        if on_partial is None:
+            return None
+        item_ids: Dict[int, str] = {}
+        key_points: Dict[int, List[str]] = {}
+
+        def on_value(path: tuple, value: Any):
+            if len(path) < 3 or path[0] != "summaries":
+                return
+            index = path[1]
+            if path[2] == "id":
+                item_ids[index] = str(value).strip()
+            elif path[2] == "key_points" and len(path) == 4:
+                key_points.setdefault(index, []).append(str(value))
+            else:
+                return
+            key = ids.get(item_ids.get(index))
+            if key is not None and key_points.get(index):
+                on_partial(key, list(key_points[index]))
+        return on_value
+
+    @staticmethod
+    def _key_point_collector(on_partial: Optional[Callable[[List[str]], None]]):
+        """把流式解析出的 key_points 逐条推送给 on_partial  Forward streamed key points to on_partial"""
+        if on_partial is None:
+            return None
+        key_points: List[str] = []
+
+        def on_value(path: tuple, value: Any):
+            if len(path) == 2 and path[0] == "key_points":
+                key_points.append(str(value))
+                on_partial(list(key_points))
+        return on_value
+
     def extract_json(self, raw_content: str) -> str:
         """从原始响应中提取 JSON 字符串 extract JSON string from raw response
         Args:
@@ -134,104 +355,74 @@ class SubscriptionAgent:
         json_match = re.search(r'\{.*\}', raw_content, re.DOTALL)
         return json_match.group(0) if json_match else raw_content
 
-    def generate_summary(self, contentdiff: str) -> SummaryResponse:
+    def generate_summary(self, contentdiff: str,
+                         on_partial: Optional[Callable[[List[str]], None]] = None) -> SummaryResponse:
         """
         生成 summary 的主函数
         参数:
             contentdiff: 输入的内容差异文本
+            on_partial: 可选回调，流式生成时每解析出一个关键点就以当前全部关键点调用一次
         返回:
             SummaryResponse: 包含摘要内容的 Pydantic 模型
         """
-        # 获取相似的历史示例，特别关注高评分示例
-        similar_examples = self.learner.get_similar_examples(contentdiff, top_k=5)
-        
-        # 过滤并优先使用评分高的示例
-        high_rated_examples = [ex for ex in similar_examples if ex.feedback_score >= 0.8]
-        if high_rated_examples:
-            logger.info(f"找到 {len(high_rated_examples)} 个高评分学习示例")
-            selected_examples = high_rated_examples
-        else:
-            logger.info("没有找到高评分学习示例，使用所有相似示例")
-            selected_examples = similar_examples
-
-        # 构建示例文本，包含评分信息以便模型参考
-        similar_examples_text = "\n\n".join([
-            f"示例 {i+1} (评分: {ex.feedback_score:.1f}):\n输入: {ex.input_text[:200]}...\n输出: {ex.output_text}\n"
-            for i, ex in enumerate(selected_examples)
-        ])
-        
-        # 记录使用的学习示例，以便后续分析
-        used_examples = [
-            {
-                "input_text": ex.input_text[:100] + "...",
-                "output_text": ex.output_text,
-                "feedback_score": ex.feedback_score,
-                "similarity_score": ex.metadata.get('similarity_score', 0)
-            }
-            for ex in selected_examples
-        ]
-
-        # 估算 token 数量
-        avg_token_per_char = 0.5
-        estimated_tokens = len(contentdiff) * avg_token_per_char
+        # 刷新引擎传入的是差异列表，与批量打包一样转换为文本
+        if not isinstance(contentdiff, str):
+            contentdiff = str(contentdiff)
+
+        # 计算 token 数量
+        content_tokens = self.token_counter.count(contentdiff)
         
-        # 如果内容可能超出 token 限制，使用带内存的处理方法
-        if estimated_tokens > self.max_token_limit:
-            logger.info(f"内容估计 token 数 ({int(estimated_tokens)}) 超过限制 ({self.max_token_limit})，使用内存处理")
-            response = self.generate_summary_with_memory(contentdiff)
-            response.learning_examples = used_examples
-            return response
+        # 如果内容超出 token 限制，分块处理后合并（合并阶段自行选取学习示例）
+        if content_tokens > self.max_token_limit:
+            if self.large_diff_mode == "memory":
+                logger.info(f"内容 token 数 ({content_tokens}) 超过限制 ({self.max_token_limit})，使用内存处理")
+                return self.generate_summary_with_memory(contentdiff, on_partial)
+            logger.info(f"内容 token 数 ({content_tokens}) 超过限制 ({self.max_token_limit})，使用 map-reduce 处理")
+            return self.generate_summary_map_reduce(contentdiff, on_partial)
+
+        # 组装提示，并记录使用的示例以便后续分析
+        prompt = self._build_prompt(self.prompt_builder, contentdiff, top_k=5)
+        used_examples = prompt.used_examples()
 
         logger.debug(f"开始生成摘要...")
-        retries = 0
-        last_exception = None
-        raw_response = None
-        
-        while retries < self.max_retries:
+        # 相同差异已经生成过摘要时直接使用缓存的响应，不经过熔断器
+        cache = get_llm_cache()
+        cache_key = self._cache_key("summary", contentdiff)
+        cached_content = cache.get(cache_key)
+        if cached_content is not None:
             try:
-                # 执行 LLM 调用获取原始响应
-                chain = self.prompt_template | self.llm
-                raw_response = chain.invoke({
-                    "contentdiff": contentdiff,
-                    "similar_examples": similar_examples_text
-                })
-
-                logger.debug(f"similar_examples: {similar_examples_text}")
-                
-                # 检查并提取原始内容
-                raw_content = raw_response.content if hasattr(raw_response, 'content') else str(raw_response)
-                json_content = self.extract_json(raw_content)
-                
-                # 尝试解析响应
-                response = self.parser.parse(json_content)
-                
-                # 确保生成时间字段有值
-                if not response.generated_at:
-                    response.generated_at = datetime.now().isoformat()
-                
-                # 计算字数（如果 LLM 未提供，则基于 content 计算）
-                if response.word_count == 0 and response.content:
-                    response.word_count = len("".join(response.content).replace(" ", "").replace(",", "").replace(".", ""))
-                
-                # 添加原始响应到结果中
-                response.raw_response = raw_content
-                # 添加使用的学习示例
-                response.learning_examples = used_examples
-                
-                logger.debug(f"摘要生成成功: {raw_content}")
-                
-                return response
-
+                logger.debug("使用缓存的摘要响应")
+                return self._parse_summary(cached_content, used_examples)
             except Exception as e:
-                logger.error(f"摘要生成失败 at line {e.__traceback__.tb_lineno}: {e}")
-                last_exception = e
-                retries += 1
-                if retries < self.max_retries:
-                    time.sleep(self.retry_delay)
-                    continue
+                logger.warning(f"缓存的摘要响应无法解析，重新生成: {e}")
+
+        raw_responses: List[str] = []
+
+        def attempt() -> SummaryResponse:
+            # 执行 LLM 调用获取原始响应，流式时关键点边生成边推送
+            raw_content = self._call_prompt(
+                prompt,
+                expected_keys=list(SummaryResponse.model_fields),
+                on_value=self._key_point_collector(on_partial))
+            raw_responses.append(raw_content)
+
+            response = self._parse_summary(raw_content, used_examples)
+            response.prompt_tokens = prompt.usage
+            # 只缓存能成功解析的响应
+            cache.set(cache_key, raw_content, self.model_name)
+            logger.debug(f"摘要生成成功: {raw_content}")
+            return response
+
+        try:
+            return self.governor.call(attempt, "摘要生成")
+        except CircuitOpenError:
+            # 熔断中由调用方推迟摘要  Callers defer the summary while the circuit is open
+            raise
+        except Exception as e:
+            last_exception = e
         
         # 所有重试都失败后，返回错误响应
-        raw_content = raw_response.content if raw_response and hasattr(raw_response, 'content') else str(raw_response) if raw_response else "No response"
+        raw_content = raw_responses[-1] if raw_responses else "No response"
         logger.error(f"摘要生成重试全部失败，返回错误响应: {str(last_exception)}")
         return SummaryResponse(
             content=[],
@@ -241,9 +432,182 @@ class SubscriptionAgent:
             status="error",
             error_message=f"Failed to parse SummaryResponse: {str(last_exception)}",
             raw_response=raw_content,
-            learning_examples=used_examples
+            learning_examples=used_examples,
+            prompt_tokens=prompt.usage
         )
 
+    def _parse_summary(self, raw_content: str, used_examples: List[Dict[str, Any]]) -> SummaryResponse:
+        """
+        解析单个摘要响应
+        参数:
+            raw_content: 原始响应文本
+            used_examples: 使用的学习示例
+        返回:
+            SummaryResponse: 解析后的摘要
+        """
+        json_content = self.extract_json(raw_content)
+        
+        # 尝试解析响应
+        response = self.parser.parse(json_content)
+        
+        # 确保生成时间字段有值
+        if not response.generated_at:
+            response.generated_at = datetime.now().isoformat()
+        
+        # 计算字数（如果 LLM 未提供，则基于 content 计算）
+        if response.word_count == 0 and response.content:
+            response.word_count = len("".join(response.content).replace(" ", "").replace(",", "").replace(".", ""))
+        
+        # 添加原始响应到结果中
+        response.raw_response = raw_content
+        # 添加使用的学习示例
+        response.learning_examples = used_examples
+        return response
+
+    def _build_prompt(self, builder: PromptBuilder, content: str, query: Optional[str] = None,
+                      top_k: int = 5) -> BuiltPrompt:
+        """
+        检索候选学习示例并组装提示
+        Args:
+            builder: 提示组装器
+            content: 提示中的内容
+            query: 用于检索相似示例的文本，默认使用 content
+            top_k: 最多放入的示例数
+        Returns:
+            BuiltPrompt: 组装好的提示
+        """
+        # 多检索一些候选，按 相似度×评分 排序并用 MMR 去掉相近的示例
+        candidates = self.learner.get_similar_examples(query or content, top_k=max(top_k, self.example_candidates))
+        prompt = builder.build(content, candidates, top_k=top_k, budget=self.prompt_token_limit)
+        if prompt.examples:
+            logger.info(f"使用 {len(prompt.examples)}/{len(candidates)} 个学习示例，"
+                        f"最高评分 {max(example.feedback_score for example, _ in prompt.examples):.1f}")
+        return prompt
+
+    def pack_batches(self, contentdiffs: Dict[Hashable, Any],
+                     token_budget: Optional[int] = None) -> List[Dict[Hashable, str]]:
+        """
+        按 token 预算把多个差异打包成批
+        参数:
+            contentdiffs: {标识: 内容差异}，标识通常是 content_update_id
+            token_budget: 每批的 token 预算，默认使用 batch_token_limit
+        返回:
+            List[Dict]: 每个元素是一批 {标识: 差异文本}；超出预算的差异单独成批
+        """
+        token_budget = token_budget or self.batch_token_limit
+        batches: List[Dict[Hashable, str]] = []
+        current: Dict[Hashable, str] = {}
+        current_tokens = 0
+        for key, contentdiff in contentdiffs.items():
+            text = contentdiff if isinstance(contentdiff, str) else str(contentdiff)
+            tokens = self.token_counter.count(text)
+            if tokens > token_budget:
+                batches.append({key: text})
+                continue
+            if current and (current_tokens + tokens > token_budget or len(current) >= self.max_batch_items):
+                batches.append(current)
+                current, current_tokens = {}, 0
+            current[key] = text
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def summarize_batch(self, batch: Dict[Hashable, str],
+                        on_partial: Optional[Callable[[Hashable, List[str]], None]] = None
+                        ) -> Dict[Hashable, SummaryResponse]:
+        """
+        在一个请求中为多个差异生成摘要，解析失败或缺失的条目单独重试
+        参数:
+            batch: {标识: 差异文本}
+            on_partial: 可选回调 (标识, 当前关键点)，流式生成时逐条推送关键点
+        返回:
+            Dict[Hashable, SummaryResponse]: 每个标识对应的摘要
+        """
+        def item_partial(key):
+            return (lambda key_points: on_partial(key, key_points)) if on_partial else None
+
+        if len(batch) == 1:
+            key, contentdiff = next(iter(batch.items()))
+            return {key: self.generate_summary(contentdiff, item_partial(key))}
+
+        # 使用短编号，避免任意标识干扰模型输出
+        ids = {str(i + 1): key for i, key in enumerate(batch)}
+        items_text = "\n".join(f'<item id="{item_id}">\n{batch[key]}\n</item>' for item_id, key in ids.items())
+        prompt = self._build_prompt(self.batch_prompt_builder, items_text, query="\n".join(batch.values()), top_k=5)
+        used_examples = prompt.used_examples()
+
+        results: Dict[Hashable, SummaryResponse] = {}
+        cache = get_llm_cache()
+        cache_key = self._cache_key("batch", items_text)
+        cached_content = cache.get(cache_key)
+        parsed = None
+        if cached_content is not None:
+            try:
+                parsed, raw_content = self.batch_parser.parse(self.extract_json(cached_content)), cached_content
+            except Exception as e:
+                logger.warning(f"缓存的批量摘要响应无法解析，重新生成: {e}")
+
+        def attempt():
+            raw_content = self._call_prompt(
+                prompt,
+                expected_keys=["summaries"],
+                on_value=self._batch_key_point_collector(ids, on_partial))
+            parsed = self.batch_parser.parse(self.extract_json(raw_content))
+            cache.set(cache_key, raw_content, self.model_name)
+            return parsed, raw_content
+
+        if parsed is None:
+            try:
+                parsed, raw_content = self.governor.call(attempt, "批量摘要生成")
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                logger.error(f"批量摘要生成失败: {e}")
+
+        if parsed is not None:
+            generated_at = datetime.now().isoformat()
+            for item in parsed.summaries:
+                key = ids.get(item.id.strip())
+                if key is None or key in results:
+                    continue
+                word_count = item.word_count
+                if word_count == 0 and item.content:
+                    word_count = len("".join(item.content).replace(" ", "").replace(",", "").replace(".", ""))
+                results[key] = SummaryResponse(
+                    content=item.content,
+                    key_points=item.key_points,
+                    url_list=item.url_list,
+                    word_count=word_count,
+                    generated_at=generated_at,
+                    raw_response=raw_content,
+                    learning_examples=used_examples,
+                    prompt_tokens=prompt.usage
+                )
+            logger.info(f"批量摘要生成成功: {len(results)}/{len(batch)} 个条目")
+
+        # 缺失或解析失败的条目逐个重试
+        for key, contentdiff in batch.items():
+            if key not in results:
+                logger.info(f"批量结果缺少条目 {key}，单独生成摘要")
+                results[key] = self.generate_summary(contentdiff, item_partial(key))
+        return results
+
+    def generate_summaries(self, contentdiffs: Dict[Hashable, Any],
+                           token_budget: Optional[int] = None) -> Dict[Hashable, SummaryResponse]:
+        """
+        批量生成摘要：按 token 预算把多个小差异合并到同一个请求
+        参数:
+            contentdiffs: {标识: 内容差异}，标识通常是 content_update_id
+            token_budget: 每批的 token 预算，默认使用 batch_token_limit
+        返回:
+            Dict[Hashable, SummaryResponse]: 每个标识对应的摘要
+        """
+        results: Dict[Hashable, SummaryResponse] = {}
+        for batch in self.pack_batches(contentdiffs, token_budget):
+            results.update(self.summarize_batch(batch))
+        return results
+
     def chunking_content(self, contentdiff: str) -> List[str]:
         """
         将大型内容差异分块
@@ -252,48 +616,215 @@ class SubscriptionAgent:
         返回:
             List[str]: 分块后的内容列表
         """
-        # 估计平均每个字符对应的 token 数（这是一个简化的估算）
-        avg_token_per_char = 0.5
-        # 计算内容的预估 token 数
-        estimated_tokens = len(contentdiff) * avg_token_per_char
-        
-        if estimated_tokens <= self.max_token_limit:
+        if self.token_counter.count(contentdiff) <= self.max_token_limit:
             return [contentdiff]
         
-        # 按照变更单元进行分割
+        # 每块的预算扣除块分析提示模板本身占用的 token（至少保留一半限制给内容）
+        template_tokens = self.token_counter.count(self.chunk_prompt_template.template)
+        budget = max(self.max_token_limit // 2, self.max_token_limit - template_tokens, 1)
+        
+        # 按照变更单元进行分割，没有识别到变更单元时按行分割
+        units = re.findall(r'""(?:Changed|Added|Deleted):.*?""', contentdiff, re.DOTALL)
+        if not units:
+            units = contentdiff.splitlines() or [contentdiff]
+        
+        # 组织变更单元成块，每块的 token 数不超过预算
         chunks = []
-        change_units = re.findall(r'""(?:Changed|Added|Deleted):.*?""', contentdiff, re.DOTALL)
+        current_units: List[str] = []
+        current_tokens = 0
+        for unit in units:
+            unit_tokens = self.token_counter.count(unit)
+            # 单个单元超出预算时截断为多段  Split a single oversize unit
+            while unit_tokens > budget:
+                head = self.token_counter.truncate(unit, budget) or unit[:1]
+                if current_units:
+                    chunks.append("\n".join(current_units))
+                    current_units, current_tokens = [], 0
+                chunks.append(head)
+                unit = unit[len(head):]
+                unit_tokens = self.token_counter.count(unit)
+            if not unit:
+                continue
+            # 连接用的换行符按 1 个 token 计
+            if current_units and current_tokens + 1 + unit_tokens > budget:
+                chunks.append("\n".join(current_units))
+                current_units, current_tokens = [], 0
+            current_tokens += unit_tokens + (1 if current_units else 0)
+            current_units.append(unit)
+        if current_units:
+            chunks.append("\n".join(current_units))
         
-        if not change_units:
-            # 如果没有识别到变更单元，则按照字符数简单分割
-            chars_per_chunk = int(self.max_token_limit / avg_token_per_char)
-            for i in range(0, len(contentdiff), chars_per_chunk):
-                chunks.append(contentdiff[i:i+chars_per_chunk])
-        else:
-            # 组织变更单元成块，控制每块大小
-            current_chunk = ""
-            chars_per_chunk = int(self.max_token_limit / avg_token_per_char)
+        logger.info(f"内容已分成 {len(chunks)} 个块进行处理")
+        return chunks
+
+    def _summarize_chunk(self, chunk: str, index: int = 0, total: int = 1) -> Optional[Dict[str, Any]]:
+        """
+        分析单个内容块（map 阶段），相同的块优先使用缓存
+        参数:
+            chunk: 内容块
+            index: 块序号（从 0 开始），仅用于日志
+            total: 总块数，仅用于日志
+        返回:
+            Optional[Dict]: 解析出的 JSON（content/key_points/urls），失败时返回 None
+        """
+        logger.info(f"处理内容块 {index+1}/{total}")
+        cache = get_llm_cache()
+        cache_key = self._cache_key("chunk", chunk)
+
+        def parse(chunk_content: str) -> Dict[str, Any]:
+            # 尝试解析该块的JSON结果
+            json_match = re.search(r'\{.*\}', chunk_content, re.DOTALL)
+            if not json_match:
+                raise ValueError(f"内容块 {index+1}/{total} 未返回JSON结果")
+            chunk_json = json.loads(json_match.group(0))
+            chunk_json["_raw"] = chunk_content
+            return chunk_json
+
+        cached_content = cache.get(cache_key)
+        if cached_content is not None:
+            try:
+                return parse(cached_content)
+            except Exception as e:
+                logger.warning(f"缓存的块分析结果无法解析，重新生成: {e}")
+
+        def attempt() -> Dict[str, Any]:
+            chunk_content = self._call_llm(self.chunk_prompt_template, {"chunk_content": chunk})
+            chunk_json = parse(chunk_content)
+            cache.set(cache_key, chunk_content, self.model_name)
+            return chunk_json
+
+        try:
+            return self.governor.call(attempt, f"内容块 {index+1}/{total} 处理")
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"块处理失败: {e}")
+            return None
+
+    def _reduce_chunk_results(self, contentdiff: str, chunk_results: List[Optional[Dict[str, Any]]],
+                              on_partial: Optional[Callable[[List[str]], None]] = None) -> SummaryResponse:
+        """
+        合并各块的分析结果并生成最终摘要（reduce 阶段）
+        参数:
+            contentdiff: 完整的内容差异文本，用于检索学习示例
+            chunk_results: 按块顺序排列的 _summarize_chunk 结果
+            on_partial: 可选回调，流式生成时逐条推送关键点
+        返回:
+            SummaryResponse: 包含摘要内容的 Pydantic 模型
+        """
+        # 收集所有块的分析结果
+        collected_content = []
+        collected_key_points = []
+        collected_urls = []
+        for chunk_json in chunk_results:
+            if not chunk_json:
+                continue
+            if isinstance(chunk_json.get('content'), list):
+                collected_content.extend(chunk_json['content'])
+            if isinstance(chunk_json.get('key_points'), list):
+                collected_key_points.extend(chunk_json['key_points'])
+            if isinstance(chunk_json.get('urls'), list):
+                collected_urls.extend(chunk_json['urls'])
+
+        # 获取相似的历史示例作为参考，按完整差异检索
+        collected = (f"内容更新概要: {collected_content}\n"
+                     f"关键点列表: {collected_key_points}\n"
+                     f"URL列表: {collected_urls}")
+        prompt = self._build_prompt(self.reduce_prompt_builder, collected, query=contentdiff, top_k=3)
+        used_examples = prompt.used_examples()
+
+        raw_responses: List[str] = []
+
+        def attempt() -> SummaryResponse:
+            # 使用收集的信息生成最终摘要
+            raw_content = self._call_prompt(prompt, expected_keys=list(SummaryResponse.model_fields),
+                                            on_value=self._key_point_collector(on_partial))
+            raw_responses.append(raw_content)
+            
+            # 提取JSON内容
+            json_content = self.extract_json(raw_content)
+            
+            # 使用Pydantic解析器确保结果符合模型定义
+            response = self.parser.parse(json_content)
             
-            for unit in change_units:
-                if len(current_chunk) + len(unit) > chars_per_chunk:
-                    chunks.append(current_chunk)
-                    current_chunk = unit
-                else:
-                    if current_chunk:
-                        current_chunk += "\n"
-                    current_chunk += unit
+            # 确保生成时间字段有值
+            if not response.generated_at:
+                response.generated_at = datetime.now().isoformat()
             
-            if current_chunk:
-                chunks.append(current_chunk)
+            # 计算字数（如果未提供）
+            if response.word_count == 0 and response.content:
+                content_text = "".join(response.content)
+                # 移除标点和空格后计算字数（标准库 re 不支持 \p{P}）
+                word_count = len(re.sub(r'[\s\W_]', '', content_text, flags=re.UNICODE))
+                response.word_count = word_count
+            
+            # 确保URL列表格式正确
+            if len(response.url_list) < len(response.key_points):
+                # 补充空URL列表，使长度匹配
+                for _ in range(len(response.key_points) - len(response.url_list)):
+                    response.url_list.append([])
+            
+            # 添加原始响应和学习示例
+            response.raw_response = raw_content
+            response.learning_examples = used_examples
+            response.prompt_tokens = prompt.usage
+            logger.debug(f"分块摘要合并成功")
+            return response
+
+        # 尝试获取最终结果
+        try:
+            return self.governor.call(attempt, "分块摘要合并")
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            last_exception = e
         
-        logger.info(f"内容已分成 {len(chunks)} 个块进行处理")
-        return chunks
+        # 所有重试失败后，构建空响应
+        logger.error(f"分块摘要合并全部失败: {str(last_exception)}")
+        return SummaryResponse(
+            content=[],
+            key_points=[],
+            url_list=[],
+            word_count=0,
+            generated_at=datetime.now().isoformat(),
+            status="error",
+            error_message=f"分块摘要生成失败: {str(last_exception)}",
+            raw_response=raw_responses[-1] if raw_responses else "No response",
+            learning_examples=used_examples
+        )
+
+    def generate_summary_map_reduce(self, contentdiff: str,
+                                    on_partial: Optional[Callable[[List[str]], None]] = None) -> SummaryResponse:
+        """
+        使用 map-reduce 生成大型差异的摘要：各块并发分析，再用一次调用合并
+        参数:
+            contentdiff: 输入的内容差异文本
+            on_partial: 可选回调，合并阶段流式生成时逐条推送关键点
+        返回:
+            SummaryResponse: 包含摘要内容的 Pydantic 模型
+        """
+        content_chunks = self.chunking_content(contentdiff)
+        total = len(content_chunks)
+        workers = max(1, min(self.map_concurrency, total))
+        logger.debug(f"开始使用 map-reduce 生成摘要，{total} 个块，并发数 {workers}")
+
+        # map 阶段：结果按块的原始顺序排列
+        if workers == 1:
+            chunk_results = [self._summarize_chunk(chunk, i, total) for i, chunk in enumerate(content_chunks)]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary-map") as executor:
+                chunk_results = list(executor.map(self._summarize_chunk, content_chunks, range(total), [total] * total))
+
+        # reduce 阶段
+        return self._reduce_chunk_results(contentdiff, chunk_results, on_partial)
 
-    def generate_summary_with_memory(self, contentdiff: str) -> SummaryResponse:
+    def generate_summary_with_memory(self, contentdiff: str,
+                                     on_partial: Optional[Callable[[List[str]], None]] = None) -> SummaryResponse:
         """
-        使用内存功能生成摘要
+        使用内存功能生成摘要（各块依次处理，并将分析结果累积到对话记忆中）
         参数:
             contentdiff: 输入的内容差异文本
+            on_partial: 可选回调，合并阶段流式生成时逐条推送关键点
         返回:
             SummaryResponse: 包含摘要内容的 Pydantic 模型
         """
@@ -302,11 +833,6 @@ class SubscriptionAgent:
         # 分块处理内容
         content_chunks = self.chunking_content(contentdiff)
         
-        # 收集所有块的分析结果
-        collected_content = []
-        collected_key_points = []
-        collected_urls = []
-        
         # 使用记忆处理多个内容块
         memory = ConversationSummaryBufferMemory(
             llm=self.llm,
@@ -322,177 +848,22 @@ class SubscriptionAgent:
         """))
         
         # 处理每个块，提取信息并累积到记忆中
+        chunk_results = []
         for i, chunk in enumerate(content_chunks):
-            logger.info(f"处理内容块 {i+1}/{len(content_chunks)}")
-            
-            # 构建块处理提示模板
-            chunk_prompt = PromptTemplate(
-                input_variables=["chunk_content"],
-                template="""
-                请分析以下内容差异块，提取关键信息：
-                {chunk_content}
-                
-                请提供以下内容（JSON格式）：
-                1. content: 内容更新概要列表
-                2. key_points: 对应的关键点列表
-                3. urls: 从内容中提取的URL列表（二维数组）
-                
-                只返回JSON格式结果，不要添加额外说明。
-                """
-            )
-            
-            # 为该块创建链
-            chunk_chain = chunk_prompt | self.llm
-            
-            # 获取该块的分析结果
+            chunk_json = self._summarize_chunk(chunk, i, len(content_chunks))
+            chunk_results.append(chunk_json)
+            if chunk_json is None:
+                continue
             try:
-                chunk_result = chunk_chain.invoke({"chunk_content": chunk})
-                chunk_content = chunk_result.content if hasattr(chunk_result, 'content') else str(chunk_result)
-                
-                # 尝试解析该块的JSON结果
-                json_match = re.search(r'\{.*\}', chunk_content, re.DOTALL)
-                if json_match:
-                    chunk_json = json.loads(json_match.group(0))
-                    
-                    # 收集结果
-                    if 'content' in chunk_json and isinstance(chunk_json['content'], list):
-                        collected_content.extend(chunk_json['content'])
-                    if 'key_points' in chunk_json and isinstance(chunk_json['key_points'], list):
-                        collected_key_points.extend(chunk_json['key_points'])
-                    if 'urls' in chunk_json and isinstance(chunk_json['urls'], list):
-                        collected_urls.extend(chunk_json['urls'])
-                
                 # 将分析结果添加到记忆中
                 memory.save_context(
                     {"input": f"内容块 {i+1}:\n{chunk[:200]}..."},
-                    {"output": f"分析结果:\n{chunk_content[:200]}..."}
+                    {"output": f"分析结果:\n{chunk_json['_raw'][:200]}..."}
                 )
-                
             except Exception as e:
                 logger.error(f"块处理失败: {e}")
-                continue
 
-        # 获取相似的历史示例作为参考
-        similar_examples = self.learner.get_similar_examples(contentdiff, top_k=3)
-        # 优先选择高评分示例
-        high_rated_examples = [ex for ex in similar_examples if ex.feedback_score >= 0.8]
-        if high_rated_examples:
-            selected_examples = high_rated_examples
-        else:
-            selected_examples = similar_examples
-            
-        similar_examples_text = "\n\n".join([
-            f"示例 {i+1} (评分: {ex.feedback_score:.1f}):\n输入: {ex.input_text[:100]}...\n输出: {ex.output_text}\n"
-            for i, ex in enumerate(selected_examples)
-        ])
-        
-        # 记录使用的学习示例
-        used_examples = [
-            {
-                "input_text": ex.input_text[:100] + "...",
-                "output_text": ex.output_text,
-                "feedback_score": ex.feedback_score,
-                "similarity_score": ex.metadata.get('similarity_score', 0)
-            }
-            for ex in selected_examples
-        ]
-        
-        # 最终使用收集的信息构建符合Pydantic模型的结果
-        final_prompt_template = PromptTemplate(
-            input_variables=["collected_content", "collected_key_points", "collected_urls", "similar_examples", "format_instructions"],
-            template="""
-            根据以下收集的信息，生成最终摘要：
-            
-            内容更新概要: {collected_content}
-            关键点列表: {collected_key_points}
-            URL列表: {collected_urls}
-            
-            ###历史学习示例：
-            {similar_examples}
-            
-            请严格按以下格式返回JSON结果：
-            {format_instructions}
-            
-            注意：
-            1. content 和 key_points 必须一一对应
-            2. url_list 是二维数组，对应每个 key_point 中的URL
-            3. 计算 word_count (内容字符总数，不含标点和空格)
-            4. 如果发现重复内容，请合并或删除
-            5. 参考历史学习示例中高评分示例的摘要风格
-            6. 只返回JSON，不要添加额外说明
-            """
-        )
-        
-        # 创建最终链
-        final_chain = final_prompt_template | self.llm
-        
-        # 尝试获取最终结果
-        retries = 0
-        last_exception = None
-        raw_response = None
-        
-        while retries < self.max_retries:
-            try:
-                # 使用收集的信息生成最终摘要
-                raw_response = final_chain.invoke({
-                    "collected_content": collected_content,
-                    "collected_key_points": collected_key_points,
-                    "collected_urls": collected_urls,
-                    "similar_examples": similar_examples_text,
-                    "format_instructions": self.parser.get_format_instructions()
-                })
-                
-                # 提取JSON内容
-                raw_content = raw_response.content if hasattr(raw_response, 'content') else str(raw_response)
-                json_content = self.extract_json(raw_content)
-                
-                # 使用Pydantic解析器确保结果符合模型定义
-                response = self.parser.parse(json_content)
-                
-                # 确保生成时间字段有值
-                if not response.generated_at:
-                    response.generated_at = datetime.now().isoformat()
-                
-                # 计算字数（如果未提供）
-                if response.word_count == 0 and response.content:
-                    content_text = "".join(response.content)
-                    # 移除标点和空格后计算字数
-                    word_count = len(re.sub(r'[\s\p{P}]', '', content_text, flags=re.UNICODE))
-                    response.word_count = word_count
-                
-                # 确保URL列表格式正确
-                if len(response.url_list) < len(response.key_points):
-                    # 补充空URL列表，使长度匹配
-                    for _ in range(len(response.key_points) - len(response.url_list)):
-                        response.url_list.append([])
-                
-                # 添加原始响应和学习示例
-                response.raw_response = raw_content
-                response.learning_examples = used_examples
-                logger.debug(f"使用记忆功能摘要生成成功")
-                
-                return response
-                
-            except Exception as e:
-                logger.error(f"使用记忆功能摘要生成失败: {e}")
-                last_exception = e
-                retries += 1
-                if retries < self.max_retries:
-                    time.sleep(self.retry_delay)
-        
-        # 所有重试失败后，构建空响应
-        logger.error(f"使用记忆功能摘要生成全部失败: {str(last_exception)}")
-        return SummaryResponse(
-            content=[],
-            key_points=[],
-            url_list=[],
-            word_count=0,
-            generated_at=datetime.now().isoformat(),
-            status="error",
-            error_message=f"使用记忆功能摘要生成失败: {str(last_exception)}",
-            raw_response=str(raw_response) if raw_response else "No response",
-            learning_examples=used_examples
-        )
+        return self._reduce_chunk_results(contentdiff, chunk_results, on_partial)
 
     def save_feedback(self, input_text: str, output_text: str | List[str], feedback_score: float, metadata: dict = None):
         """
@@ -0,0 +1,274 @@
+"""
+增量 TF-IDF 索引  Append-only TF-IDF index for the incremental learner.
+
+TfidfVectorizer 每加入一条示例都要对全部示例重新分词、重新拟合。这里改为只追加的 CSR 矩阵：
+
+- 每条示例的词频作为新的一行追加到可增长的缓冲区中，词表随新词增长，文档频率即时累加，
+  新增一行只与该行的词数有关；
+- IDF 延迟重算：新行使用当前的 IDF 加权，语料增长超过 idf_refresh_ratio 后的下一次查询
+  才统一重算 IDF 与行归一化，按几何间隔重算使摊还代价仍为 O(1)；
+- IDF 与归一化方式与 TfidfVectorizer 的默认设置一致（smooth_idf、l2），
+  重算后的相似度与整体重新拟合的结果相同。
+
+检查点（见 src.agent.index_store）保存原始词频、IDF 与权重，加载时直接内存映射，不需要重新分词；
+映射的数组只读，本进程第一次追加或重算 IDF 时才复制到内存。
+
+Usage:
+    index = TfidfIndex()
+    row = index.add({"模型": 2, "发布": 1})
+    scores = index.query({"模型": 1})
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from src.log import get_logger
+
+logger = get_logger("agent.tfidf_index")
+
+
+def _grow(buffer: np.ndarray, needed: int) -> np.ndarray:
+    """
+    容量不足时按 2 倍扩容，只读缓冲区（内存映射）复制到内存
+    Grow a buffer geometrically so appends are amortized O(1); read-only (memory-mapped) buffers are copied.
+    """
+    if needed <= len(buffer) and buffer.flags.writeable:
+        return buffer
+    grown = np.zeros(max(needed, 2 * len(buffer), 16), dtype=buffer.dtype)
+    grown[:len(buffer)] = buffer
+    return grown
+
+
+class TfidfIndex:
+    """只追加的 TF-IDF 索引  Append-only TF-IDF matrix with deferred IDF recomputation
+
+    Args:
+        idf_refresh_ratio: 行数比上次重算 IDF 时增长超过该比例后重算
+    """
+
+    def __init__(self, idf_refresh_ratio: float = 0.1):
+        self.idf_refresh_ratio = idf_refresh_ratio
+        self.vocabulary: Dict[str, int] = {}
+        self.terms: List[str] = []
+        self._n = 0
+        self._nnz = 0
+        self._indptr = np.zeros(16, dtype=np.int32)
+        self._indices = np.zeros(16, dtype=np.int32)
+        self._counts = np.zeros(16, dtype=np.float32)
+        self._weights = np.zeros(16, dtype=np.float32)
+        self._df = np.zeros(16, dtype=np.int64)
+        self._idf = np.zeros(16, dtype=np.float32)
+        self._idf_rows = 0
+        self._matrix: Optional[csr_matrix] = None
+        self._lock = threading.RLock()
+
+    @property
+    def n_rows(self) -> int:
+        return self._n
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self.terms)
+
+    def _idf_of(self, df: np.ndarray, n: int) -> np.ndarray:
+        # 与 TfidfVectorizer(smooth_idf=True) 相同  Same as TfidfVectorizer(smooth_idf=True)
+        return (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+
+    def add(self, counts: Dict[str, int]) -> int:
+        """
+        追加一行
+        Append one document given its term counts.
+
+        Args:
+            counts: 词 -> 词频
+
+        Returns:
+            int: 新行的行号
+        """
+        with self._lock:
+            ids = []
+            for term in counts:
+                term_id = self.vocabulary.get(term)
+                if term_id is None:
+                    term_id = self.vocabulary[term] = len(self.terms)
+                    self.terms.append(term)
+                ids.append(term_id)
+            vocab_size = len(self.terms)
+            self._df = _grow(self._df, vocab_size)
+            self._idf = _grow(self._idf, vocab_size)
+            ids = np.asarray(ids, dtype=np.int32)
+            values = np.fromiter(counts.values(), dtype=np.float32, count=len(ids))
+
+            self._df[ids] += 1
+            self._n += 1
+            # 新词没有可沿用的 IDF，立即计算；已有词的 IDF 延迟到下次重算
+            # New terms get an IDF right away; the others keep theirs until the next refresh
+            new_terms = ids[self._idf[ids] == 0]
+            if len(new_terms):
+                self._idf[new_terms] = self._idf_of(self._df[new_terms], self._n)
+
+            weights = values * self._idf[ids]
+            norm = float(np.sqrt(np.dot(weights, weights)))
+            if norm > 0:
+                weights /= norm
+
+            end = self._nnz + len(ids)
+            self._indices = _grow(self._indices, end)
+            self._counts = _grow(self._counts, end)
+            self._weights = _grow(self._weights, end)
+            self._indptr = _grow(self._indptr, self._n + 1)
+            self._indices[self._nnz:end] = ids
+            self._counts[self._nnz:end] = values
+            self._weights[self._nnz:end] = weights
+            self._nnz = end
+            self._indptr[self._n] = end
+            self._matrix = None
+            return self._n - 1
+
+    def term_counts(self, row: int) -> Dict[str, int]:
+        """某一行的原始词频  Raw term counts of a row"""
+        with self._lock:
+            start, end = self._indptr[row], self._indptr[row + 1]
+            return {self.terms[i]: int(v) for i, v in zip(self._indices[start:end], self._counts[start:end])}
+
+    def refresh_idf(self):
+        """按当前语料重算 IDF 与所有行的归一化权重  Recompute the IDF and every row's weights, O(nnz)"""
+        with self._lock:
+            n, nnz, vocab_size = self._n, self._nnz, len(self.terms)
+            self._idf = _grow(self._idf, vocab_size)
+            self._idf[:vocab_size] = self._idf_of(self._df[:vocab_size], n)
+            indices = self._indices[:nnz]
+            weights = self._counts[:nnz] * self._idf[indices]
+            rows = np.repeat(np.arange(n), np.diff(self._indptr[:n + 1]))
+            norms = np.sqrt(np.bincount(rows, weights=weights.astype(np.float64) ** 2, minlength=n))
+            norms[norms == 0] = 1.0
+            weights /= norms[rows].astype(np.float32)
+            self._weights = _grow(self._weights, nnz)
+            self._weights[:nnz] = weights
+            self._idf_rows = n
+            self._matrix = None
+
+    def _refresh_due(self) -> bool:
+        return self._n > 0 and self._n > self._idf_rows * (1 + self.idf_refresh_ratio)
+
+    def matrix(self) -> csr_matrix:
+        """
+        当前的 TF-IDF 矩阵（行已归一化），需要时先重算 IDF
+        The row-normalized TF-IDF matrix, refreshing the IDF first when due.
+
+        Returns:
+            csr_matrix: 形状为 (行数, 词表大小)，与内部缓冲区共享内存
+        """
+        with self._lock:
+            if self._refresh_due():
+                self.refresh_idf()
+            if self._matrix is None:
+                n, nnz = self._n, self._nnz
+                self._matrix = csr_matrix(
+                    (self._weights[:nnz], self._indices[:nnz], self._indptr[:n + 1]),
+                    shape=(n, max(len(self.terms), 1)), copy=False)
+            return self._matrix
+
+    def transform(self, counts: Dict[str, int]) -> np.ndarray:
+        """
+        把查询的词频转换为归一化的 TF-IDF 向量，忽略词表外的词
+        Weight and normalize a query; unseen terms are ignored.
+
+        Args:
+            counts: 词 -> 词频
+
+        Returns:
+            np.ndarray: 长度为词表大小的 float32 向量
+        """
+        with self._lock:
+            if self._refresh_due():
+                self.refresh_idf()
+            vector = np.zeros(max(len(self.terms), 1), dtype=np.float32)
+            for term, count in counts.items():
+                term_id = self.vocabulary.get(term)
+                if term_id is not None:
+                    vector[term_id] = count * self._idf[term_id]
+            norm = float(np.sqrt(np.dot(vector, vector)))
+            if norm > 0:
+                vector /= norm
+            return vector
+
+    def query(self, counts: Dict[str, int]) -> np.ndarray:
+        """
+        计算查询与每一行的余弦相似度
+        Cosine similarity of a query against every row.
+
+        Args:
+            counts: 查询的词频
+
+        Returns:
+            np.ndarray: 长度为行数的相似度
+        """
+        with self._lock:
+            vector = self.transform(counts)
+            return self.matrix().dot(vector)
+
+    def state(self, rows: Optional[int] = None) -> Dict:
+        """
+        前 rows 行的可持久化状态
+        Persistable state of the first rows rows.
+
+        包含原始词频、词表与文档频率；rows 为全部行时还包含当前的 IDF 与权重，恢复时不必重算。
+
+        Args:
+            rows: 行数，默认全部
+
+        Returns:
+            Dict: 可用 from_state 恢复的状态
+        """
+        with self._lock:
+            rows = self._n if rows is None else rows
+            nnz = int(self._indptr[rows])
+            indices = self._indices[:nnz].copy()
+            # 词号按首次出现的顺序分配，前 rows 行用到的词正好是词表的前缀
+            # Term ids follow first appearance, so the first rows rows use a prefix of the vocabulary
+            vocab_size = int(indices.max()) + 1 if nnz else 0
+            state = {
+                "rows": rows,
+                "terms": self.terms[:vocab_size],
+                "df": np.bincount(indices, minlength=vocab_size).astype(np.int64),
+                "indptr": self._indptr[:rows + 1].copy(),
+                "indices": indices,
+                "counts": self._counts[:nnz].copy(),
+            }
+            if rows == self._n:
+                state.update({
+                    "idf": self._idf[:vocab_size].copy(),
+                    "weights": self._weights[:nnz].copy(),
+                    "idf_rows": self._idf_rows,
+                })
+            return state
+
+    @classmethod
+    def from_state(cls, state: Dict, idf_refresh_ratio: float = 0.1) -> "TfidfIndex":
+        """
+        由 state() 的结果恢复索引，数组不复制（可以是只读的内存映射，第一次写入时才复制）
+        Rebuild an index from state(); arrays are used as-is and copied on first write.
+        """
+        index = cls(idf_refresh_ratio=idf_refresh_ratio)
+        index.terms = list(state["terms"])
+        index.vocabulary = {term: i for i, term in enumerate(index.terms)}
+        index._n = int(state["rows"])
+        index._nnz = len(state["indices"])
+        index._indptr = np.asarray(state["indptr"], dtype=np.int32)
+        index._indices = np.asarray(state["indices"], dtype=np.int32)
+        index._counts = np.asarray(state["counts"], dtype=np.float32)
+        index._df = np.asarray(state["df"], dtype=np.int64)
+        if state.get("weights") is not None:
+            index._weights = np.asarray(state["weights"], dtype=np.float32)
+            index._idf = np.asarray(state["idf"], dtype=np.float32)
+            index._idf_rows = int(state["idf_rows"])
+        else:
+            index._weights = np.zeros(index._nnz, dtype=np.float32)
+            index._idf = np.zeros(len(index._df), dtype=np.float32)
+            if index._n:
+                index.refresh_idf()
+        return index
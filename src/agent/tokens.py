@@ -0,0 +1,274 @@
+"""
+Token 计数  Pluggable token counters used for prompt budgeting.
+
+按模型厂商选择离线分词器计算真实的 token 数：DASHSCOPE 使用 dashscope 自带的 Qwen BPE 词表，
+OPENAI 使用 tiktoken；没有可用分词器时（如 ZHIPU，或分词器加载失败）退回按字符类别加权的估算器。
+估算器的系数按 Qwen 分词器在中英文混合文本上拟合得到，也可以用 calibrate 针对其他分词器重新拟合。
+所有计数器都带有按文本哈希的 LRU 缓存，同一段差异在判断分块、打包批次时只分词一次。
+
+Usage:
+    counter = get_token_counter("DASHSCOPE", "qwen-plus")
+    if counter.count(contentdiff) > budget:
+        ...
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.log import get_logger
+
+logger = get_logger("agent.tokens")
+
+# 中日韩文字及全角标点  CJK characters and full-width punctuation
+_CJK_RE = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿＀-￯]")
+_ALNUM_RE = re.compile(r"[A-Za-z0-9]")
+_SPACE_RE = re.compile(r"\s")
+
+# 各字符类别平均对应的 token 数（按 Qwen 分词器拟合，略偏保守）
+# Tokens per character of each class, fitted against the Qwen tokenizer and rounded up slightly
+DEFAULT_TOKEN_RATES = {
+    "cjk": 0.7,
+    "alnum": 0.22,
+    "space": 0.1,
+    "other": 0.85,
+}
+
+# 计数缓存条目数上限  Max cached counts per counter
+_CACHE_SIZE = 4096
+
+
+class TokenCounter:
+    """Token 计数器基类，子类实现 _count  Base class; subclasses implement _count
+
+    Args:
+        name: 计数器名称，用于日志
+        cache_size: 计数缓存条目数，0 表示不缓存
+    """
+
+    def __init__(self, name: str, cache_size: int = _CACHE_SIZE):
+        self.name = name
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count(self, text: str) -> int:
+        raise NotImplementedError
+
+    def count(self, text: str) -> int:
+        """
+        计算文本的 token 数，结果按文本哈希缓存
+        Count the tokens of a text, memoised by content hash.
+
+        Args:
+            text: 输入文本
+
+        Returns:
+            int: token 数
+        """
+        if not text:
+            return 0
+        if not self.cache_size:
+            return self._count(text)
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        tokens = self._count(text)
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        截断文本，使其不超过 max_tokens 个 token
+        Cut a text down to at most max_tokens tokens.
+
+        Args:
+            text: 输入文本
+            max_tokens: token 上限
+
+        Returns:
+            str: 截断后的文本（未超出时原样返回）
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        # 按字符二分查找最长的前缀  Binary search the longest fitting prefix
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self._count(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+
+class EstimateTokenCounter(TokenCounter):
+    """按字符类别加权估算 token 数  Character-class weighted estimator
+
+    Args:
+        rates: 各字符类别（cjk/alnum/space/other）每个字符对应的 token 数
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None, cache_size: int = _CACHE_SIZE):
+        super().__init__("estimate", cache_size)
+        self.rates = dict(DEFAULT_TOKEN_RATES)
+        if rates:
+            self.rates.update(rates)
+
+    @staticmethod
+    def _classes(text: str) -> Tuple[int, int, int, int]:
+        cjk = len(_CJK_RE.findall(text))
+        alnum = len(_ALNUM_RE.findall(text))
+        space = len(_SPACE_RE.findall(text))
+        return cjk, alnum, space, len(text) - cjk - alnum - space
+
+    def _count(self, text: str) -> int:
+        cjk, alnum, space, other = self._classes(text)
+        estimate = (cjk * self.rates["cjk"] + alnum * self.rates["alnum"]
+                    + space * self.rates["space"] + other * self.rates["other"])
+        return max(1, int(estimate + 0.5))
+
+    def calibrate(self, reference: TokenCounter, samples: Iterable[str]) -> Dict[str, float]:
+        """
+        用参考分词器的计数重新拟合各类字符的系数
+        Refit the per-class rates with least squares against a reference counter.
+
+        Args:
+            reference: 参考计数器（真实分词器）
+            samples: 样本文本
+
+        Returns:
+            Dict[str, float]: 新的系数
+        """
+        import numpy as np
+        rows, targets = [], []
+        for sample in samples:
+            if sample:
+                rows.append(self._classes(sample))
+                targets.append(reference.count(sample))
+        if len(rows) < len(DEFAULT_TOKEN_RATES):
+            logger.warning(f"校准样本不足 ({len(rows)} 条)，保留原系数")
+            return dict(self.rates)
+        coef, *_ = np.linalg.lstsq(np.array(rows, dtype=float), np.array(targets, dtype=float), rcond=None)
+        self.rates = {name: max(0.0, float(value)) for name, value in zip(DEFAULT_TOKEN_RATES, coef)}
+        with self._lock:
+            self._cache.clear()
+        logger.info(f"估算器已按 {reference.name} 校准: {self.rates}")
+        return dict(self.rates)
+
+
+class EncoderTokenCounter(TokenCounter):
+    """包装任意 encode(text) -> List[int] 的离线分词器  Wraps an offline tokenizer's encode()
+
+    Args:
+        name: 计数器名称
+        encode: 分词函数
+    """
+
+    def __init__(self, name: str, encode: Callable[[str], List[int]], cache_size: int = _CACHE_SIZE):
+        super().__init__(name, cache_size)
+        self._encode = encode
+
+    def _count(self, text: str) -> int:
+        return len(self._encode(text))
+
+
+def _qwen_counter(model: Optional[str]) -> TokenCounter:
+    """dashscope 自带的 Qwen 词表，qwen/qwq 系列共用  Qwen BPE shipped with the dashscope SDK"""
+    from dashscope import get_tokenizer
+    # 非 qwen 开头的型号（如 qwq）同样使用 Qwen 词表  Every Qwen-family model shares the vocabulary
+    tokenizer = get_tokenizer(model if model and model.startswith("qwen") else "qwen-turbo")
+    return EncoderTokenCounter("qwen", tokenizer.encode)
+
+
+def _tiktoken_counter(model: Optional[str]) -> TokenCounter:
+    """tiktoken 分词器，词表需已缓存在本地  tiktoken; the encoding must already be cached locally"""
+    import tiktoken
+    try:
+        encoding = tiktoken.encoding_for_model(model or "")
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return EncoderTokenCounter(f"tiktoken:{encoding.name}", lambda text: encoding.encode(text, disallowed_special=()))
+
+
+def _estimate_counter(model: Optional[str]) -> TokenCounter:
+    return EstimateTokenCounter()
+
+
+# 计数器注册表与各厂商默认使用的计数器  Registry of counter factories and per-provider defaults
+_COUNTER_FACTORIES: Dict[str, Callable[[Optional[str]], TokenCounter]] = {
+    "qwen": _qwen_counter,
+    "tiktoken": _tiktoken_counter,
+    "estimate": _estimate_counter,
+}
+PROVIDER_COUNTERS = {
+    "DASHSCOPE": "qwen",
+    "OPENAI": "tiktoken",
+}
+
+_counters: Dict[Tuple[str, Optional[str]], TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def register_token_counter(name: str, factory: Callable[[Optional[str]], TokenCounter],
+                           providers: Iterable[str] = ()):
+    """
+    注册自定义计数器
+    Register a counter factory, optionally as the default for some providers.
+
+    Args:
+        name: 计数器名称
+        factory: 接收模型名称并返回 TokenCounter 的函数
+        providers: 默认使用该计数器的厂商（大写）
+    """
+    _COUNTER_FACTORIES[name] = factory
+    for provider in providers:
+        PROVIDER_COUNTERS[provider.upper()] = name
+    with _counters_lock:
+        _counters.clear()
+
+
+def get_token_counter(provider: Optional[str] = None, model: Optional[str] = None,
+                      name: str = "auto") -> TokenCounter:
+    """
+    获取计数器，同一 (计数器, 模型) 复用同一实例及其缓存
+    Return a shared counter for the provider and model.
+
+    Args:
+        provider: 模型厂商，如 DASHSCOPE / ZHIPU
+        model: 模型名称
+        name: 计数器名称，auto 表示按厂商选择
+
+    Returns:
+        TokenCounter: 计数器，分词器不可用时为估算器
+    """
+    if not name or name == "auto":
+        name = PROVIDER_COUNTERS.get((provider or "").upper(), "estimate")
+    key = (name, model)
+    counter = _counters.get(key)
+    if counter is not None:
+        return counter
+    with _counters_lock:
+        counter = _counters.get(key)
+        if counter is None:
+            factory = _COUNTER_FACTORIES.get(name)
+            try:
+                if factory is None:
+                    raise KeyError(f"未知的计数器: {name}")
+                counter = factory(model)
+            except Exception as e:
+                logger.warning(f"加载分词器 {name} 失败，使用估算器: {e}")
+                counter = EstimateTokenCounter()
+            _counters[key] = counter
+            logger.debug(f"使用 token 计数器: {counter.name} ({provider} / {model})")
+    return counter
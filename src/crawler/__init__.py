@@ -9,6 +9,7 @@ from .arxiv import ArxivCrawler
 from .ieee import IEEECrawler
 from .web import WebCrawler
 from .registry import registry, CrawlerRegistry
+from .conditional import FetchError
 from . import utils
 
 # Register built-in crawlers with the registry
@@ -21,6 +22,7 @@ __all__ = [
     "IEEECrawler", 
     "WebCrawler", 
     "CrawlerRegistry",
+    "FetchError",
     "registry",
     "utils"
 ] 
\ No newline at end of file
@@ -48,6 +48,19 @@ class ArxivCrawler(BaseCrawler):
         
         return self._extract_papers(soup)
     
+    def parse_page(self, soup: BeautifulSoup) -> List[Dict[str, Any]]:
+        """
+        从已获取的列表页中提取论文
+        Extract papers from a fetched listing page.
+        
+        Args:
+            soup: BeautifulSoup object containing the parsed HTML
+            
+        Returns:
+            List of dictionaries containing paper information 包含论文信息的字典列表
+        """
+        return self._extract_papers(soup)
+    
     def _extract_papers(self, soup: BeautifulSoup) -> List[Dict[str, Any]]:
         """
         从解析后的HTML中提取论文信息
@@ -2,11 +2,15 @@
 Base crawler class that defines the common interface for all crawlers.
 """
 
+import asyncio
 import requests
+import httpx
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import json
 from bs4 import BeautifulSoup
+from src.net import get_transport, AsyncHttpTransport, async_transport_scope
+from .conditional import FetchError, FetchValidators, ConditionalResult, evaluate_response
 
 
 class BaseCrawler(ABC):
@@ -26,25 +30,181 @@ class BaseCrawler(ABC):
         """
         self.headers = {"User-Agent": user_agent}
         
-    def fetch_page(self, url: str, timeout: int = 20) -> Optional[BeautifulSoup]:
+    def fetch_page(self, url: str, timeout: Optional[float] = None) -> Optional[BeautifulSoup]:
         """
         Fetch a web page and return its parsed content.
         
+        Requests go through the shared keep-alive transport (see src.net).
+        
         Args:
             url: URL to fetch
-            timeout: Request timeout in seconds
+            timeout: Request timeout in seconds, defaults to the transport timeout
             
         Returns:
             BeautifulSoup object or None if request failed
         """
         try:
-            response = requests.get(url, headers=self.headers, timeout=timeout)
+            response = get_transport().get(url, headers=self.headers, timeout=timeout)
             response.raise_for_status()
             return BeautifulSoup(response.text, "html.parser")
         except requests.RequestException as e:
             print(f"Error fetching page {url}: {e}")
             return None
     
+    def fetch_conditional(self, url: str, validators: Optional[FetchValidators] = None,
+                          timeout: Optional[float] = None) -> ConditionalResult:
+        """
+        Fetch a web page with If-None-Match / If-Modified-Since headers.
+        
+        Args:
+            url: URL to fetch
+            validators: Validators saved from the previous fetch
+            timeout: Request timeout in seconds, defaults to the transport timeout
+            
+        Returns:
+            ConditionalResult telling whether the body changed
+            
+        Raises:
+            requests.RequestException: If the request failed
+        """
+        headers = dict(self.headers)
+        if validators:
+            headers.update(validators.to_headers())
+        response = get_transport().get(url, headers=headers, timeout=timeout)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return evaluate_response(response.status_code, response.headers, response.content, validators)
+    
+    def parse_page(self, soup: BeautifulSoup) -> List[Dict[str, Any]]:
+        """
+        Extract data from a parsed page. Specialized crawlers can implement this
+        so that conditional and asynchronous fetching reuse the fetched body;
+        crawlers that only implement crawl are re-crawled instead.
+        
+        Args:
+            soup: BeautifulSoup object containing the parsed HTML
+            
+        Returns:
+            List of dictionaries containing the extracted data
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not implement parse_page")
+    
+    def _parses_pages(self) -> bool:
+        """Whether the subclass overrides parse_page"""
+        return type(self).parse_page is not BaseCrawler.parse_page
+    
+    def crawl_if_changed(self, url: str, validators: Optional[FetchValidators] = None
+                         ) -> Tuple[Optional[List[Dict[str, Any]]], FetchValidators]:
+        """
+        Crawl the URL only if it changed since the previous fetch.
+        
+        Args:
+            url: URL to crawl
+            validators: Validators saved from the previous fetch
+            
+        Returns:
+            Tuple of (extracted data or None if unchanged, validators to store)
+            
+        Raises:
+            FetchError: If the page could not be fetched
+        """
+        try:
+            result = self.fetch_conditional(url, validators)
+        except requests.RequestException as e:
+            raise FetchError(f"Error fetching page {url}: {e}") from e
+        
+        if not result.changed:
+            return None, result.validators
+        return self._extract_changed(url, result.content), result.validators
+    
+    def _extract_changed(self, url: str, content: bytes) -> List[Dict[str, Any]]:
+        """
+        Extract data from a changed page, falling back to crawl when the
+        crawler does not implement parse_page.
+        
+        Args:
+            url: URL of the page
+            content: Raw response bytes
+            
+        Returns:
+            List of dictionaries containing the extracted data
+        """
+        if self._parses_pages():
+            return self._parse_content(content)
+        return self.crawl(url)
+    
+    def _parse_content(self, content: bytes) -> List[Dict[str, Any]]:
+        """
+        Parse a raw page body with parse_page.
+        
+        Args:
+            content: Raw response bytes
+            
+        Returns:
+            List of dictionaries containing the extracted data
+        """
+        return self.parse_page(BeautifulSoup(content, "html.parser"))
+    
+    async def acrawl(self, url: Optional[str] = None,
+                     client: Optional[AsyncHttpTransport] = None) -> List[Dict[str, Any]]:
+        """
+        Asynchronously crawl the URL on an event loop.
+        
+        HTML parsing runs in a worker thread so the event loop can keep
+        other fetches in flight.
+        
+        Args:
+            url: URL to crawl, uses default_url if not provided
+            client: Shared async transport; a temporary one is created if omitted
+            
+        Returns:
+            List of dictionaries containing the extracted data
+        """
+        target_url = url or getattr(self, "default_url", None)
+        if not self._parses_pages():
+            return await asyncio.to_thread(self.crawl, target_url)
+        async with async_transport_scope(client) as transport:
+            try:
+                response = await transport.get(target_url, headers=self.headers)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                print(f"Error fetching page {target_url}: {e}")
+                return []
+        return await asyncio.to_thread(self._parse_content, response.content)
+    
+    async def acrawl_if_changed(self, url: str, validators: Optional[FetchValidators] = None,
+                                client: Optional[AsyncHttpTransport] = None
+                                ) -> Tuple[Optional[List[Dict[str, Any]]], FetchValidators]:
+        """
+        Asynchronous counterpart of crawl_if_changed.
+        
+        Args:
+            url: URL to crawl
+            validators: Validators saved from the previous fetch
+            client: Shared async transport; a temporary one is created if omitted
+            
+        Returns:
+            Tuple of (extracted data or None if unchanged, validators to store)
+            
+        Raises:
+            FetchError: If the page could not be fetched
+        """
+        headers = dict(self.headers)
+        if validators:
+            headers.update(validators.to_headers())
+        async with async_transport_scope(client) as transport:
+            try:
+                response = await transport.get(url, headers=headers)
+                if response.status_code != 304:
+                    response.raise_for_status()
+            except httpx.HTTPError as e:
+                raise FetchError(f"Error fetching page {url}: {e}") from e
+        
+        result = evaluate_response(response.status_code, response.headers, response.content, validators)
+        if not result.changed:
+            return None, result.validators
+        return await asyncio.to_thread(self._extract_changed, url, result.content), result.validators
+    
     @abstractmethod
     def crawl(self, url: str) -> List[Dict[str, Any]]:
         """
@@ -3,9 +3,10 @@ Command-line interface for the UPick crawler.
 """
 
 import argparse
+import asyncio
 import sys
 import os
-from typing import Optional
+from typing import Optional, List
 import json
 from datetime import datetime
 
@@ -14,6 +15,7 @@ from .arxiv import ArxivCrawler
 from .ieee import IEEECrawler
 from .web import WebCrawler
 from . import utils
+from src.net import AsyncHttpTransport
 
 
 def parse_args():
@@ -23,8 +25,8 @@ def parse_args():
     parser.add_argument("--source", "-s", type=str, choices=["arxiv", "ieee", "web"], 
                         default="arxiv", help="Source to crawl (default: arxiv)")
     
-    parser.add_argument("--url", "-u", type=str,
-                        help="URL to crawl (default: use the crawler's default URL)")
+    parser.add_argument("--url", "-u", type=str, action="append",
+                        help="URL to crawl, can be repeated (default: use the crawler's default URL)")
     
     parser.add_argument("--output", "-o", type=str,
                         help="Output filename (default: <source>_content_<timestamp>.json)")
@@ -38,6 +40,12 @@ def parse_args():
     parser.add_argument("--retries", "-r", type=int, default=3,
                         help="Number of retries for failed requests (default: 3)")
     
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Fetch all URLs concurrently on one event loop")
+    
+    parser.add_argument("--concurrency", "-c", type=int, default=4,
+                        help="Maximum concurrent requests per host in async mode (default: 4)")
+    
     return parser.parse_args()
 
 
@@ -62,6 +70,29 @@ def get_crawler(source: str) -> BaseCrawler:
         raise ValueError(f"Unknown source: {source}")
 
 
+async def crawl_all(crawler, urls: List[Optional[str]], concurrency: int,
+                    max_retries: int) -> List[dict]:
+    """
+    Crawl several URLs concurrently with a shared async transport.
+    
+    Args:
+        crawler: Crawler providing acrawl
+        urls: URLs to crawl (None uses the crawler's default URL)
+        concurrency: Maximum concurrent requests per host
+        max_retries: Number of retries for failed requests (web source only)
+        
+    Returns:
+        Merged list of extracted items
+    """
+    async with AsyncHttpTransport.from_config(per_host_limit=concurrency) as client:
+        if isinstance(crawler, WebCrawler):
+            jobs = [crawler.acrawl(url, client=client, max_retries=max_retries) for url in urls]
+        else:
+            jobs = [crawler.acrawl(url, client=client) for url in urls]
+        results = await asyncio.gather(*jobs)
+    return utils.merge_results(results)
+
+
 def main():
     """Main entry point for the crawler CLI."""
     args = parse_args()
@@ -76,6 +107,28 @@ def main():
     else:
         args.output = os.path.join(args.output_dir, args.output)
     
+    # Async mode: crawl every URL concurrently on one event loop
+    if args.use_async:
+        if args.source == "web" and not args.url:
+            print("Error: URL is required for web source.")
+            return 1
+        crawler = WebCrawler() if args.source == "web" else get_crawler(args.source)
+        urls = args.url or [None]
+        print(f"Starting async {args.source} crawler for {len(urls)} URL(s)...")
+        try:
+            items = asyncio.run(crawl_all(crawler, urls, args.concurrency, args.retries))
+        except Exception as e:
+            print(f"Error: {e}")
+            return 1
+        if not items:
+            print("No content found.")
+            return 1
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False, indent=4)
+        print(f"Crawl complete! Found {len(items)} items.")
+        print(f"Results saved to: {args.output}")
+        return 0
+    
     # Handle web crawler specially
     if args.source == "web":
         if not args.url:
@@ -83,19 +136,20 @@ def main():
             return 1
             
         web_crawler = WebCrawler()
-        print(f"Starting web crawler for: {args.url}")
+        url = args.url[0]
+        print(f"Starting web crawler for: {url}")
         
         try:
             if args.text_only:
                 # Just get clean text
-                content = web_crawler.fetch_and_clean_content(args.url, max_retries=args.retries)
+                content = web_crawler.fetch_and_clean_content(url, max_retries=args.retries)
                 
                 # Save raw text
                 with open(args.output, "w", encoding="utf-8") as f:
                     f.write(content)
             else:
                 # Get structured content
-                result = web_crawler.fetch_structured_content(args.url, max_retries=args.retries)
+                result = web_crawler.fetch_structured_content(url, max_retries=args.retries)
                 
                 # Save as JSON
                 with open(args.output, "w", encoding="utf-8") as f:
@@ -112,7 +166,7 @@ def main():
         crawler = get_crawler(args.source)
         print(f"Starting {args.source} crawler...")
         
-        papers = crawler.crawl(args.url)
+        papers = crawler.crawl(args.url[0] if args.url else None)
         
         if papers:
             crawler.save_to_file(papers, args.output)
@@ -0,0 +1,121 @@
+"""
+条件请求工具  Helpers for conditional HTTP fetching.
+
+保存每个订阅的 ETag / Last-Modified / 原始内容哈希，
+在下一次抓取时发送 If-None-Match / If-Modified-Since，
+服务器返回 304 或内容哈希未变化时即可跳过解析与差异计算。
+Stores per-subscription validators and decides whether a response carries new content.
+"""
+
+import hashlib
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional, Mapping, Any
+
+
+class FetchError(Exception):
+    """
+    条件抓取失败（重试后仍无法获取页面）
+    Raised by crawl_if_changed when the page could not be fetched; the stored content
+    and validators must be left as they are.
+    """
+
+
+@dataclass
+class FetchValidators:
+    """
+    一次抓取得到的缓存校验信息
+    Cache validators captured from the last successful fetch.
+    """
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+
+    def to_headers(self) -> Dict[str, str]:
+        """
+        生成条件请求头
+        Build the conditional request headers for these validators.
+
+        Returns:
+            Dictionary of conditional request headers
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class ConditionalResult:
+    """
+    条件请求的结果
+    Outcome of a conditional fetch.
+    """
+    changed: bool
+    validators: FetchValidators
+    status_code: int
+    content: Optional[bytes] = None
+
+
+def body_hash(content: bytes) -> str:
+    """
+    计算原始响应内容的哈希
+    Hash the raw response body.
+
+    Args:
+        content: Raw response bytes
+
+    Returns:
+        Hex digest of the body
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def evaluate_response(status_code: int,
+                      headers: Mapping[str, str],
+                      content: Optional[bytes],
+                      previous: Optional[FetchValidators] = None) -> ConditionalResult:
+    """
+    根据响应判断内容是否变化
+    Decide whether a response carries new content and compute the next validators.
+
+    Args:
+        status_code: HTTP status code
+        headers: Response headers
+        content: Raw response body (ignored for 304)
+        previous: Validators sent with the request
+
+    Returns:
+        ConditionalResult describing the response
+    """
+    previous = previous or FetchValidators()
+
+    if status_code == 304:
+        # 服务器确认未修改，沿用原有的内容哈希
+        # Server confirmed nothing changed, keep the previous body hash
+        return ConditionalResult(
+            changed=False,
+            validators=FetchValidators(
+                etag=headers.get("ETag") or previous.etag,
+                last_modified=headers.get("Last-Modified") or previous.last_modified,
+                content_hash=previous.content_hash,
+            ),
+            status_code=status_code,
+        )
+
+    digest = body_hash(content or b"")
+    validators = FetchValidators(
+        etag=headers.get("ETag"),
+        last_modified=headers.get("Last-Modified"),
+        content_hash=digest,
+    )
+    return ConditionalResult(
+        changed=digest != previous.content_hash,
+        validators=validators,
+        status_code=status_code,
+        content=content,
+    )
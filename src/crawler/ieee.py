@@ -47,6 +47,18 @@ class IEEECrawler(BaseCrawler):
         
         return self._extract_papers(soup)
     
+    def parse_page(self, soup: BeautifulSoup) -> List[Dict[str, Any]]:
+        """
+        Extract papers from a fetched listing page.
+        
+        Args:
+            soup: BeautifulSoup object containing the parsed HTML
+            
+        Returns:
+            List of dictionaries containing paper information
+        """
+        return self._extract_papers(soup)
+    
     def _extract_papers(self, soup: BeautifulSoup) -> List[Dict[str, Any]]:
         """
         Extract paper information from the parsed HTML.
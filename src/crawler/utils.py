@@ -3,7 +3,8 @@ Utility functions for web crawling.
 """
 
 import time
-from typing import Optional, Callable, Any, TypeVar, Dict, List
+import asyncio
+from typing import Optional, Callable, Any, TypeVar, Dict, List, Awaitable
 import logging
 import os
 from datetime import datetime
@@ -38,6 +39,31 @@ def retry(func: Callable[..., T], max_retries: int = 3, delay: float = 2.0) -> O
                 return None
 
 
+async def aretry(func: Callable[[], Awaitable[T]], max_retries: int = 3, delay: float = 2.0) -> Optional[T]:
+    """
+    Retry a coroutine function with exponential backoff without blocking the event loop.
+    
+    Args:
+        func: Coroutine function to retry
+        max_retries: Maximum number of retries
+        delay: Initial delay between retries in seconds
+        
+    Returns:
+        Result of the coroutine or None if all retries failed
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return await func()
+        except Exception as e:
+            if attempt < max_retries:
+                wait_time = delay * (2 ** attempt)
+                logger.warning(f"Attempt {attempt + 1} failed: {e}. Retrying in {wait_time:.2f}s")
+                await asyncio.sleep(wait_time)
+            else:
+                logger.error(f"All {max_retries + 1} attempts failed: {e}")
+                return None
+
+
 def ensure_directory(directory: str) -> None:
     """
     Ensure that a directory exists, creating it if necessary.
@@ -50,6 +76,24 @@ def ensure_directory(directory: str) -> None:
         logger.info(f"Created directory: {directory}")
 
 
+# 每次抓取都会变化、不代表内容更新的字段
+# Fields that change on every crawl and say nothing about the content
+VOLATILE_FIELDS = ("timestamp",)
+
+
+def item_key(item: Dict[str, Any]) -> Optional[str]:
+    """
+    Get the identity of a crawled item.
+    
+    Args:
+        item: Crawled item
+        
+    Returns:
+        The arxiv_id, doi, url or title of the item, or None if it has none
+    """
+    return item.get("arxiv_id") or item.get("doi") or item.get("url") or item.get("title")
+
+
 def merge_results(results_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Merge multiple crawl results, removing duplicates based on a key.
@@ -65,7 +109,7 @@ def merge_results(results_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     for results in results_list:
         for item in results:
             # Use a unique identifier if available, or fallback to title
-            key = item.get("arxiv_id") or item.get("doi") or item.get("url") or item.get("title")
+            key = item_key(item)
             if key and key not in merged:
                 merged[key] = item
     
@@ -2,14 +2,39 @@
 General web crawler implementation for extracting clean text content from websites.
 """
 
+import asyncio
 import requests
+import httpx
 from bs4 import BeautifulSoup
-from typing import Optional, Dict, Any, List
+from requests.structures import CaseInsensitiveDict
+from typing import Optional, Dict, Any, List, Tuple, Type
+from src.net import get_transport, AsyncHttpTransport, async_transport_scope
 from .base import BaseCrawler
 from . import utils
+from .conditional import FetchError, FetchValidators, evaluate_response
 from .registry import registry
 
 
+def _as_requests_response(response: httpx.Response) -> requests.Response:
+    """
+    Wrap an httpx response so encoding detection and cleaning can be shared
+    between the synchronous and asynchronous paths.
+    
+    Args:
+        response: httpx response object
+        
+    Returns:
+        Equivalent requests.Response
+    """
+    converted = requests.Response()
+    converted.status_code = response.status_code
+    converted.headers = CaseInsensitiveDict(response.headers)
+    converted.url = str(response.url)
+    converted._content = response.content
+    converted._content_consumed = True
+    return converted
+
+
 class WebCrawler(BaseCrawler):
     """
     General-purpose web crawler for fetching and cleaning content from any website.
@@ -28,6 +53,27 @@ class WebCrawler(BaseCrawler):
             'User-Agent': user_agent or default_user_agent,
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
         }
+        # 专用爬虫实例按类缓存，避免每个URL都重新创建
+        # Specialized crawlers are cached per class instead of re-instantiated per URL
+        self._specialized_crawlers: Dict[Type[BaseCrawler], BaseCrawler] = {}
+
+    def _get_specialized_crawler(self, url: str) -> Optional[BaseCrawler]:
+        """
+        Get the cached specialized crawler registered for the URL.
+        
+        Args:
+            url: URL to crawl
+            
+        Returns:
+            Specialized crawler instance or None if no crawler matches
+        """
+        crawler_class = registry.get_crawler(url)
+        if crawler_class is None:
+            return None
+        crawler = self._specialized_crawlers.get(crawler_class)
+        if crawler is None:
+            crawler = self._specialized_crawlers.setdefault(crawler_class, crawler_class())
+        return crawler
 
     def detect_encoding(self, response: requests.Response, content: bytes) -> str:
         """
@@ -100,6 +146,22 @@ class WebCrawler(BaseCrawler):
         lines = [line.strip() for line in text.splitlines() if line.strip()]
         return '\n'.join(lines)
 
+    def _clean_response(self, response: requests.Response) -> str:
+        """
+        Decode a response with the detected encoding and clean its HTML.
+        
+        Args:
+            response: HTTP response object
+            
+        Returns:
+            Clean text content with preserved links
+        """
+        encoding = self.detect_encoding(response, response.content)
+        response.encoding = encoding
+        
+        soup = BeautifulSoup(response.text, 'html.parser')
+        return self.clean_html(soup)
+
     def fetch_and_clean_content(self, url: str, max_retries: int = 3) -> str:
         """
         Fetch webpage content and clean it to extract readable text.
@@ -116,14 +178,9 @@ class WebCrawler(BaseCrawler):
             Clean text content or error message
         """
         def fetch_operation():
-            response = requests.get(url, headers=self.headers)
+            response = get_transport().get(url, headers=self.headers)
             response.raise_for_status()
-            
-            encoding = self.detect_encoding(response, response.content)
-            response.encoding = encoding
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            return self.clean_html(soup)
+            return self._clean_response(response)
         
         try:
             # Use the retry utility function
@@ -172,17 +229,159 @@ class WebCrawler(BaseCrawler):
             List of dictionaries containing the extracted data 返回包含提取数据的列表
         """
         # Check if there's a specialized crawler for this URL
-        specialized_crawler_class = registry.get_crawler(url)
+        specialized_crawler = self._get_specialized_crawler(url)
         
-        if specialized_crawler_class:
+        if specialized_crawler:
             # Use the specialized crawler
-            crawler = specialized_crawler_class()
-            return crawler.crawl(url)
+            return specialized_crawler.crawl(url)
         
         # Fall back to general web crawler
         result = self.fetch_structured_content(url)
         return [result] 
+
+    def crawl_if_changed(self, url: str, validators: Optional[FetchValidators] = None,
+                         max_retries: int = 3) -> Tuple[Optional[List[Dict[str, Any]]], FetchValidators]:
+        """
+        Crawl the URL only if it changed since the previous fetch.
+        - 发送 If-None-Match / If-Modified-Since 条件请求
+        - 服务器返回 304 或原始内容哈希未变化时，跳过解析，返回 None
+        - 如果存在专门的爬虫，则交给专门的爬虫处理
+        
+        Args:
+            url: URL to crawl
+            validators: Validators saved from the previous fetch
+            max_retries: Maximum number of retries on failure
+            
+        Returns:
+            Tuple of (extracted data or None if unchanged, validators to store)
+            
+        Raises:
+            FetchError: If the page could not be fetched after max_retries attempts
+        """
+        specialized_crawler = self._get_specialized_crawler(url)
+        if specialized_crawler:
+            return specialized_crawler.crawl_if_changed(url, validators)
+        
+        def fetch_operation():
+            headers = dict(self.headers)
+            if validators:
+                headers.update(validators.to_headers())
+            response = get_transport().get(url, headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status()
+            return response
+        
+        response = utils.retry(fetch_operation, max_retries=max_retries)
+        if response is None:
+            raise FetchError(f"Failed to retrieve content from {url} after {max_retries} attempts")
+        
+        result = evaluate_response(response.status_code, response.headers, response.content, validators)
+        if not result.changed:
+            return None, result.validators
+        
+        return [{
+            "url": url,
+            "content": self._clean_response(response),
+            "timestamp": utils.get_current_timestamp()
+        }], result.validators
     
+    async def _afetch(self, url: str, client: AsyncHttpTransport,
+                      validators: Optional[FetchValidators], max_retries: int) -> Optional[httpx.Response]:
+        """
+        Fetch a URL asynchronously with retries.
+        
+        Args:
+            url: URL to fetch
+            client: Async transport
+            validators: Validators used for conditional headers, if any
+            max_retries: Maximum number of retries on failure
+            
+        Returns:
+            httpx response or None if all attempts failed
+        """
+        headers = dict(self.headers)
+        if validators:
+            headers.update(validators.to_headers())
+        
+        async def fetch_operation():
+            response = await client.get(url, headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status()
+            return response
+        
+        return await utils.aretry(fetch_operation, max_retries=max_retries)
+
+    async def acrawl(self, url: str, client: Optional[AsyncHttpTransport] = None,
+                     max_retries: int = 3) -> List[Dict[str, Any]]:
+        """
+        Asynchronously crawl the specified URL and extract data.
+        - 异步版本的 crawl，可在一个事件循环中同时抓取大量URL
+        - 如果存在专门的爬虫，则使用专门的爬虫
+        - HTML 清理在线程中执行，不阻塞事件循环
+        
+        Args:
+            url: URL to crawl
+            client: Shared async transport; a temporary one is created if omitted
+            max_retries: Maximum number of retries on failure
+            
+        Returns:
+            List of dictionaries containing the extracted data 返回包含提取数据的列表
+        """
+        specialized_crawler = self._get_specialized_crawler(url)
+        if specialized_crawler:
+            return await specialized_crawler.acrawl(url, client=client)
+        
+        async with async_transport_scope(client) as transport:
+            response = await self._afetch(url, transport, None, max_retries)
+        if response is None:
+            error = f"Failed to retrieve content from {url} after {max_retries} attempts"
+            return [{"url": url, "error": error, "content": None}]
+        
+        content = await asyncio.to_thread(self._clean_response, _as_requests_response(response))
+        return [{
+            "url": url,
+            "content": content,
+            "timestamp": utils.get_current_timestamp()
+        }]
+
+    async def acrawl_if_changed(self, url: str, validators: Optional[FetchValidators] = None,
+                                client: Optional[AsyncHttpTransport] = None,
+                                max_retries: int = 3) -> Tuple[Optional[List[Dict[str, Any]]], FetchValidators]:
+        """
+        Asynchronous counterpart of crawl_if_changed.
+        
+        Args:
+            url: URL to crawl
+            validators: Validators saved from the previous fetch
+            client: Shared async transport; a temporary one is created if omitted
+            max_retries: Maximum number of retries on failure
+            
+        Returns:
+            Tuple of (extracted data or None if unchanged, validators to store)
+            
+        Raises:
+            FetchError: If the page could not be fetched after max_retries attempts
+        """
+        specialized_crawler = self._get_specialized_crawler(url)
+        if specialized_crawler:
+            return await specialized_crawler.acrawl_if_changed(url, validators, client=client)
+        
+        async with async_transport_scope(client) as transport:
+            response = await self._afetch(url, transport, validators, max_retries)
+        if response is None:
+            raise FetchError(f"Failed to retrieve content from {url} after {max_retries} attempts")
+        
+        result = evaluate_response(response.status_code, response.headers, response.content, validators)
+        if not result.changed:
+            return None, result.validators
+        
+        content = await asyncio.to_thread(self._clean_response, _as_requests_response(response))
+        return [{
+            "url": url,
+            "content": content,
+            "timestamp": utils.get_current_timestamp()
+        }], result.validators
+
 
 if __name__ == "__main__":
     crawler = WebCrawler()
@@ -0,0 +1,129 @@
+"""
+SQLite 连接管理  Thread-local pooled SQLite connections in WAL mode.
+
+所有数据库访问都通过 get_connection 获取连接：每个线程对每个数据库文件复用同一个连接，
+连接创建时统一设置 PRAGMA：
+
+- journal_mode=WAL：读操作不再被刷新写线程阻塞，写操作也不会阻塞界面读取；
+- synchronous=NORMAL：WAL 模式下只在检查点时同步磁盘，提交更快且掉电不会损坏数据库；
+- busy_timeout：并发写入时等待锁而不是立即抛出 database is locked；
+- mmap_size / cache_size：用内存映射和更大的页缓存加速读取。
+
+调用方仍然按原来的方式使用 conn.close()：池化连接的 close() 只回滚未提交的事务并把连接
+留给本线程下次使用，真正关闭使用 close_connection。
+
+Usage:
+    conn = get_connection()
+    c = conn.cursor()
+    ...
+    conn.close()  # 归还连接
+"""
+
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+from src.log import get_logger
+from .config import SUBSCRIPTIONS_DB_PATH
+
+logger = get_logger("db.connection")
+
+# 默认连接配置，可在 config.yaml 的 sqlite 节点中覆盖
+# Default connection settings, can be overridden by the `sqlite` section of config.yaml
+DEFAULT_SQLITE_CONFIG = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout_ms": 10000,     # 等待写锁的时间（毫秒）
+    "mmap_size_mb": 256,          # 内存映射读取的大小上限（MB），0 表示关闭
+    "cache_size_mb": 64,          # 每个连接的页缓存大小（MB）
+}
+
+_local = threading.local()
+_settings: Optional[Dict[str, Any]] = None
+_settings_lock = threading.Lock()
+
+
+def load_sqlite_config() -> Dict[str, Any]:
+    """读取连接配置  Load connection settings merged with defaults
+
+    Returns:
+        Dict[str, Any]: 连接配置
+    """
+    settings = dict(DEFAULT_SQLITE_CONFIG)
+    try:
+        from src.services import ConfigManager
+        config = ConfigManager().get_config() or {}
+        for key, value in (config.get("sqlite") or {}).items():
+            if key in settings and value is not None:
+                settings[key] = type(DEFAULT_SQLITE_CONFIG[key])(value)
+    except Exception as e:
+        logger.warning(f"读取数据库连接配置失败，使用默认配置: {e}")
+    return settings
+
+
+def _get_settings() -> Dict[str, Any]:
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = load_sqlite_config()
+    return _settings
+
+
+class PooledConnection(sqlite3.Connection):
+    """close() 只归还连接的 sqlite3 连接  A connection whose close() returns it to the thread's pool"""
+
+    def close(self):
+        # 归还前丢弃未提交的事务，与真正关闭连接的效果一致  Uncommitted work is discarded, as a real close would
+        if self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        super().close()
+
+
+def _open(db_path: str) -> PooledConnection:
+    settings = _get_settings()
+    conn = sqlite3.connect(db_path, timeout=settings["busy_timeout_ms"] / 1000, factory=PooledConnection)
+    c = conn.cursor()
+    c.execute(f"PRAGMA journal_mode={settings['journal_mode']}")
+    c.execute(f"PRAGMA synchronous={settings['synchronous']}")
+    c.execute(f"PRAGMA busy_timeout={int(settings['busy_timeout_ms'])}")
+    c.execute(f"PRAGMA mmap_size={int(settings['mmap_size_mb']) * 1024 * 1024}")
+    # 负数表示以 KiB 为单位  A negative cache_size is in KiB
+    c.execute(f"PRAGMA cache_size={-int(settings['cache_size_mb']) * 1024}")
+    c.close()
+    return conn
+
+
+def get_connection(db_path: str = SUBSCRIPTIONS_DB_PATH) -> sqlite3.Connection:
+    """
+    获取当前线程的数据库连接，首次使用时创建
+    Return this thread's connection to db_path, opening it on first use.
+
+    Args:
+        db_path: 数据库路径
+
+    Returns:
+        sqlite3.Connection: 已设置 WAL 等 PRAGMA 的连接，close() 仅归还连接
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = _open(db_path)
+        logger.debug(f"打开数据库连接: {db_path} ({threading.current_thread().name})")
+    elif conn.in_transaction:
+        # 上次使用者既没有提交也没有归还  The previous user neither committed nor released
+        conn.rollback()
+    return conn
+
+
+def close_connection(db_path: str = SUBSCRIPTIONS_DB_PATH):
+    """关闭当前线程的连接，长期运行的线程退出前调用  Really close this thread's connection"""
+    connections = getattr(_local, "connections", None)
+    if connections:
+        conn = connections.pop(db_path, None)
+        if conn is not None:
+            conn.really_close()
@@ -1,15 +1,51 @@
-from typing import List,Tuple
+from typing import List, Optional, Tuple
 import sqlite3
-from src.agent import SubscriptionAgent
+from src.agent import get_agent
 from src.log import get_logger
 from src.crawler import WebCrawler
+from src.crawler.conditional import FetchError, FetchValidators
 from datetime import datetime, timedelta
 import json
 from .config import SUBSCRIPTIONS_DB_PATH
+from .connection import get_connection
+from .snapshots import gc_snapshots, load_content, store_snapshot
+from .summary_queue import enqueue_summary, notify_summary_workers
 logger = get_logger("db.db_operate")
 
 
 
+def get_fetch_validators(c: sqlite3.Cursor, subscription_id: int) -> FetchValidators:
+    """读取订阅的条件请求校验信息  Load the conditional request validators of a subscription
+
+    Args:
+        c (sqlite3.Cursor): 数据库游标
+        subscription_id (int): 订阅ID
+    Returns:
+        FetchValidators: 上一次抓取保存的校验信息，没有则为空
+    """
+    c.execute("SELECT etag, last_modified, content_hash FROM fetch_validators WHERE subscription_id = ?",
+              (subscription_id,))
+    row = c.fetchone()
+    return FetchValidators(*row) if row else FetchValidators()
+
+def save_fetch_validators(c: sqlite3.Cursor, subscription_id: int, validators: FetchValidators) -> None:
+    """保存订阅的条件请求校验信息  Upsert the conditional request validators of a subscription
+
+    Args:
+        c (sqlite3.Cursor): 数据库游标
+        subscription_id (int): 订阅ID
+        validators (FetchValidators): 本次抓取得到的校验信息
+    """
+    c.execute("""
+        INSERT INTO fetch_validators (subscription_id, etag, last_modified, content_hash, checked_at)
+        VALUES (?, ?, ?, ?, datetime('now', 'localtime'))
+        ON CONFLICT(subscription_id) DO UPDATE SET
+            etag = excluded.etag,
+            last_modified = excluded.last_modified,
+            content_hash = excluded.content_hash,
+            checked_at = excluded.checked_at
+    """, (subscription_id, validators.etag, validators.last_modified, validators.content_hash))
+
 def add_subscription(url:str, check_interval:int)->str:
     """添加订阅   Add new subscription to database and fetch initial content or update check interval if URL exists
     flowchart TD
@@ -35,14 +71,11 @@ def add_subscription(url:str, check_interval:int)->str:
         P -->|否| Q[提交事务并关闭连接]
         Q --> R[返回获取内容失败消息]
         
-        P -->|是| S[生成摘要]
-        S -->src.agent.generate_summary -->S
-        S --> T{摘要是否生成成功?}
-        T -->|是| U[存储摘要到数据库]
-        T -->|否| V[记录未生成摘要日志]
-        U --> W[提交事务并关闭连接]
-        V --> W
-        W --> X[返回添加成功消息]
+        P -->|是| S[加入摘要队列]
+        S --> W[提交事务并关闭连接]
+        W --> Y[唤醒摘要工作线程]
+        Y -->src.db.summary_queue -->Y
+        Y --> X[返回添加成功消息]
   
     Args:
         url (str): The URL of the subscription.
@@ -59,7 +92,7 @@ def add_subscription(url:str, check_interval:int)->str:
     if not url.startswith(('http://', 'https://')):
         return "Invalid URL format. URL must start with http:// or https://"
 
-    conn = sqlite3.connect(SUBSCRIPTIONS_DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
 
     # Check if URL already exists
@@ -84,13 +117,21 @@ def add_subscription(url:str, check_interval:int)->str:
         # Fetch initial content
         crawler = WebCrawler()
         # content = crawler.fetch_and_clean_content(url)
-        content = crawler.crawl(url)  # this is a list of dicts
+        try:
+            content, validators = crawler.crawl_if_changed(url)  # this is a list of dicts
+        except FetchError as e:
+            # 首次抓取失败时与之前一样记录错误内容，校验信息为空，下一轮完整抓取
+            # Record the error as the initial content; empty validators force a full fetch next time
+            logger.error(f"首次抓取失败: {url} - {e}")
+            content, validators = [{"url": url, "error": str(e), "content": None}], FetchValidators()
+        save_fetch_validators(c, subscription_id, validators)
         content_json = json.dumps(content, ensure_ascii=False)
 
         logger.info(f"爬取内容content_json前100字符: {content_json[:100]}")
 
-        c.execute("INSERT INTO contents (subscription_id, content) VALUES (?, ?)",
-                (subscription_id, content_json))
+        from src.services.fingerprint import content_fingerprint
+        c.execute("INSERT INTO contents (subscription_id, content, content_hash, fingerprint) VALUES (?, '', ?, ?)",
+                (subscription_id, store_snapshot(c, content_json), content_fingerprint(content_json)))
         content_id = c.lastrowid
         # Update last_updated_at timestamp
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -120,24 +161,35 @@ def add_subscription(url:str, check_interval:int)->str:
             
             content_update_id = c.lastrowid
 
-            # summary when first adding a subscription, generate a summary  第一次添加订阅时，生成摘要
-            summary = SubscriptionAgent().generate_summary(content_json)
-
-            if summary.content is not None and len(summary.content) > 0:
-                logger.info(f"生成摘要并插入数据库... {url} --- {summary}")
-                c.execute("INSERT INTO summaries (content_update_id, summary) VALUES (?, ?)",
-                        (content_update_id, json.dumps(summary.model_dump(), ensure_ascii=False)))
-            else:
-                logger.info(f"没有生成摘要... {url}")
+            # summary when first adding a subscription: queued for the summary workers  第一次添加订阅时，加入摘要队列
+            enqueue_summary(c, content_update_id)
     
             logger.info(f"成功添加订阅并获取初始内容: {url}")
             conn.commit()
             conn.close()
+            notify_summary_workers()
+
+            # 提示与已有订阅内容几乎相同（不同 URL 指向同一内容）
+            duplicates = []
+            for id_a, url_a, id_b, url_b, _ in find_duplicate_subscriptions():
+                if id_a == subscription_id:
+                    duplicates.append(url_b)
+                elif id_b == subscription_id:
+                    duplicates.append(url_a)
+            if duplicates:
+                logger.info(f"新订阅与已有订阅内容几乎相同: {url} ~ {duplicates}")
+                return (f"Successfully added subscription and fetched initial content: {url} "
+                        f"(content is nearly identical to: {', '.join(duplicates)})")
             return f"Successfully added subscription and fetched initial content: {url}"
 
 def refresh_content(similarity_threshold:float=0.95)->str:
     """ 刷新内容,根据订阅的url  Refresh content for all subscriptions that need updating based on check_interval
 
+    抓取与差异计算由 RefreshEngine 并发执行，需要摘要的更新加入摘要队列，由摘要工作线程异步生成。
+    并发参数见 config.yaml 的 refresh 与 summary_queue 节点。
+    Fetching and diffing run concurrently in RefreshEngine; significant updates are queued for the
+    summary workers. See the `refresh` and `summary_queue` sections of config.yaml.
+
     Args:
         similarity_threshold (float): The threshold for similarity.
         default is 0.95
@@ -145,126 +197,91 @@ def refresh_content(similarity_threshold:float=0.95)->str:
         str: A message indicating the number of subscriptions that were refreshed.
 
     """
-    from src.services.contentdiff import get_content_diff, has_significant_changes
+    from .refresh_engine import run_refresh
 
     logger.info("开始刷新内容...")
 
-    conn = sqlite3.connect(SUBSCRIPTIONS_DB_PATH)
-    c = conn.cursor()
+    report = run_refresh(similarity_threshold)
+    updated_count = report.refreshed
 
-    # Get all subscriptions with their last update time and check interval
-    c.execute("""
-        SELECT id, url, last_updated_at, check_interval 
-        FROM subscriptions
-    """)
-    subscriptions = c.fetchall() # 获取所有订阅 主要是url  Get all subscriptions
+    logger.info(f"成功刷新内容... {updated_count} 个订阅, {report.enqueued} 个摘要已入队")
 
-    current_time = datetime.now() # 当前时间  Current time
-    crawler = WebCrawler() # 爬虫对象  WebCrawler object
-    updated_count = 0 # 更新计数  Update count
-    
-    # 遍历所有订阅  Traverse all subscriptions
-    logger.debug(f"开始遍历所有订阅...订阅长度: {len(subscriptions)}")
-    for sub_id, url, last_updated, interval in subscriptions:
-        last_updated = datetime.strptime(last_updated, '%Y-%m-%d %H:%M:%S') # 将last_updated转换为datetime对象  Convert last_updated to datetime object
-        time_diff = current_time - last_updated # 计算时间差  Calculate time difference
-        
-        # 检查是否足够时间  Check if enough time has passed (interval is in minutes)
-        if time_diff > timedelta(minutes=interval): # 如果时间差大于间隔时间  If the time difference is greater than the interval
-            # 获取最新内容  Get most recent content for this subscription
-            c.execute("""
-                SELECT id, content FROM contents 
-                WHERE subscription_id = ? 
-                ORDER BY fetched_at DESC LIMIT 1
-            """, (sub_id,))
-            old_content_row = c.fetchone() # 获取最新内容  Get most recent content for this subscription
-            old_content_id = old_content_row[0] # 获取内容id  Get content id
-            old_content = old_content_row[1] # 获取内容  Get content
-            
-            # 获取新内容  Fetch new content
-            new_content = crawler.crawl(url)
-            new_content = json.dumps(new_content, ensure_ascii=False)
-            
-            # 存储新内容  Store new content
-            c.execute("""
-                INSERT INTO contents (subscription_id, content) 
-                VALUES (?, ?)
-            """, (sub_id, new_content))
-            new_content_id = c.lastrowid # 获取新内容id  Get new content id
-            
-            # 计算差异并存储在content_updates中  Calculate differences and store in content_updates
-            similarity, diffs = get_content_diff(old_content, new_content)
-            
-            # 如果相似度低于阈值，则生成摘要   if similarity is less than the threshold, generate a summary
-            if similarity < similarity_threshold and len(diffs)>0:
-                # Insert into content_updates (without summary field)
-                c.execute("""
-                    INSERT INTO content_updates 
-                    (subscription_id, old_content_id, new_content_id, similarity_ratio, diff_details)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (sub_id, old_content_id, new_content_id, similarity, json.dumps(diffs,ensure_ascii=False)))
-                
-                content_update_id = c.lastrowid
-                
-                # Generate summary
-                summary = SubscriptionAgent().generate_summary(diffs)
-                if summary.content is not None and len(summary.content) > 0:
-                    logger.info(f"生成摘要并插入数据库... {url} --- {summary}")
-                    
-                    # Store summary in the summaries table
-                    c.execute("""
-                        INSERT INTO summaries 
-                        (content_update_id, summary)
-                        VALUES (?, ?)
-                    """, (content_update_id, json.dumps(summary.model_dump(), ensure_ascii=False)))
-                else:
-                    logger.info(f"没有生成摘要... {url}")
-                
-            # 更新最后检查时间,无论是否生成摘要  "Update last_updated_at timestamp, whether a summary is generated or not"
-            c.execute("""
-                UPDATE subscriptions 
-                SET last_updated_at = ? 
-                WHERE id = ?
-            """, (current_time.strftime('%Y-%m-%d %H:%M:%S'), sub_id))
-            
-            updated_count += 1
+    return f"Successfully refreshed content for {updated_count} subscriptions ({report.enqueued} summaries queued)"
 
-            conn.commit()
-    conn.close()
-    logger.info(f"成功刷新内容... {updated_count} 个订阅")
+def query_updates(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                  subscription_ids: Optional[List[int]] = None, limit: Optional[int] = 20,
+                  cursor: Optional[Tuple[str, int]] = None,
+                  include_diff: bool = False) -> Tuple[List[list], Optional[Tuple[str, int]]]:
+    """ 分页查询内容更新  Query content updates with SQL-side filters and keyset pagination
 
-    return f"Successfully refreshed content for {updated_count} subscriptions"
+    结果按 (updated_at, id) 倒序排列，下一页从上一页最后一条之后继续，翻页不随页数变慢。
+    Rows are ordered newest first by (updated_at, id); each page continues after the last row of the previous one.
 
-def get_updates() -> List[Tuple[str, str, str, str]]:
-    """ 获取内容更新  Get content updates from database.
-    
+    Args:
+        since (datetime, optional): 只返回该时间之后（含）的更新
+        until (datetime, optional): 只返回该时间之前的更新
+        subscription_ids (List[int], optional): 只返回这些订阅的更新
+        limit (int, optional): 每页条数，None 表示不分页
+        cursor (Tuple[str, int], optional): 上一页返回的 next_cursor，None 表示第一页
+        include_diff (bool): 是否返回 diff_details，默认不读取以减少数据量
     Returns:
-        List[List[str, str, str, str]]: A list of updates, where each update contains
-                                        [url, updated_at, summary, diff_details]
+        Tuple[List[list], Optional[Tuple[str, int]]]: (更新列表, next_cursor)，每条更新为
+            [url, updated_at, summary, diff_details, content_update_id, summary_id]，未读取的 diff_details 为 None；
+            没有下一页时 next_cursor 为 None
     """
-    # Connect to database
-    conn = sqlite3.connect(SUBSCRIPTIONS_DB_PATH)
+    conditions = []
+    params: list = []
+    if since is not None:
+        conditions.append("cu.updated_at >= ?")
+        params.append(since.strftime('%Y-%m-%d %H:%M:%S'))
+    if until is not None:
+        conditions.append("cu.updated_at < ?")
+        params.append(until.strftime('%Y-%m-%d %H:%M:%S'))
+    if subscription_ids:
+        conditions.append(f"cu.subscription_id IN ({','.join(['?'] * len(subscription_ids))})")
+        params.extend(subscription_ids)
+    if cursor is not None:
+        conditions.append("(cu.updated_at < ? OR (cu.updated_at = ? AND cu.id < ?))")
+        params.extend([cursor[0], cursor[0], cursor[1]])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    page = ""
+    if limit is not None:
+        # 多取一条判断是否还有下一页  One extra row tells whether another page exists
+        page = "LIMIT ?"
+        params.append(limit + 1)
+
+    conn = get_connection()
     c = conn.cursor()
-    
-    # Query for content updates joined with subscription information and summaries
-    c.execute("""
-        SELECT cu.diff_details, s.summary, cu.updated_at, sub.url, cu.id, s.id
+    c.execute(f"""
+        SELECT sub.url, cu.updated_at, s.summary, {'cu.diff_details' if include_diff else 'NULL'}, cu.id, s.id
         FROM content_updates cu
         JOIN subscriptions sub ON cu.subscription_id = sub.id
         JOIN summaries s ON s.content_update_id = cu.id
-        ORDER BY cu.updated_at DESC
-    """)
-    
-    # Fetch all results
-    updates = c.fetchall()
+        {where}
+        ORDER BY cu.updated_at DESC, cu.id DESC
+        {page}
+    """, params)
+    rows = [list(row) for row in c.fetchall()]
     conn.close()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][1], rows[-1][4])
+    return rows, next_cursor
+
+def get_updates() -> List[list]:
+    """ 获取内容更新  Get content updates from database.
+
+    读取全部历史，界面请使用分页的 query_updates。
+    Loads the whole history; the UI pages through query_updates instead.
     
-    # Format updates into a more readable structure
-    formatted_updates = []
-    for diff_details, summary, updated_at, url, content_update_id, summary_id in updates:
-        formatted_updates.append([url, updated_at, summary, diff_details, content_update_id, summary_id])
-    
-    return formatted_updates
+    Returns:
+        List[list]: A list of updates, newest first, where each update contains
+                    [url, updated_at, summary, diff_details, content_update_id, summary_id]
+    """
+    updates, _ = query_updates(limit=None, include_diff=True)
+    return updates
 
 def delete_subscription(subscription_id: int) -> str:
     """删除订阅   Delete a subscription and all associated data
@@ -275,7 +292,7 @@ def delete_subscription(subscription_id: int) -> str:
     Returns:
         str: A message indicating the result of the operation.
     """
-    conn = sqlite3.connect(SUBSCRIPTIONS_DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     try:
@@ -306,6 +323,10 @@ def delete_subscription(subscription_id: int) -> str:
                 DELETE FROM summaries 
                 WHERE content_update_id IN ({placeholders})
             """, content_update_ids)
+            c.execute(f"""
+                DELETE FROM summary_jobs 
+                WHERE content_update_id IN ({placeholders})
+            """, content_update_ids)
         
         # Delete from content_updates table
         c.execute("""
@@ -319,6 +340,15 @@ def delete_subscription(subscription_id: int) -> str:
             WHERE subscription_id = ?
         """, (subscription_id,))
         
+        # Delete snapshots no longer referenced by any content
+        gc_snapshots(c)
+        
+        # Delete conditional request validators
+        c.execute("""
+            DELETE FROM fetch_validators 
+            WHERE subscription_id = ?
+        """, (subscription_id,))
+        
         # Finally delete the subscription
         c.execute("""
             DELETE FROM subscriptions 
@@ -346,7 +376,7 @@ def get_subscriptions() -> List[Tuple[int, str, str, int]]:
         List[Tuple[int, str, str, int]]: A list of subscriptions, where each subscription contains
                                         [id, url, last_updated_at, check_interval]
     """
-    conn = sqlite3.connect(SUBSCRIPTIONS_DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     c.execute("""
@@ -360,6 +390,39 @@ def get_subscriptions() -> List[Tuple[int, str, str, int]]:
     
     return subscriptions
 
+def find_duplicate_subscriptions(max_distance: int = 3) -> List[Tuple[int, str, int, str, int]]:
+    """查找内容几乎相同的订阅   Find subscriptions at different URLs whose latest content is nearly identical
+
+    Compares the SimHash fingerprints of each subscription's latest content.
+
+    Args:
+        max_distance (int): The maximum Hamming distance between fingerprints.
+    Returns:
+        List[Tuple[int, str, int, str, int]]: A list of pairs, where each pair contains
+                                              [id_a, url_a, id_b, url_b, distance]
+    """
+    from src.services.fingerprint import content_fingerprint, find_near_duplicates
+
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("""
+        SELECT s.id, s.url, c.content, c.content_hash, c.fingerprint
+        FROM subscriptions s
+        JOIN contents c ON c.id = (
+            SELECT id FROM contents WHERE subscription_id = s.id
+            ORDER BY fetched_at DESC, id DESC LIMIT 1
+        )
+    """)
+    rows = c.fetchall()
+
+    urls = {sub_id: url for sub_id, url, _, _, _ in rows}
+    # 旧数据没有指纹时现算  Rows stored before fingerprints existed are fingerprinted on the fly
+    fingerprints = {sub_id: fingerprint or content_fingerprint(load_content(c, content, snapshot_hash))
+                    for sub_id, _, content, snapshot_hash, fingerprint in rows}
+    conn.close()
+    pairs = find_near_duplicates(fingerprints, max_distance)
+    return [(a, urls[a], b, urls[b], distance) for a, b, distance in sorted(pairs)]
+
 def delete_old_content(days_to_keep: int = 30) -> str:
     """删除旧内容   Delete old content from the database to optimize storage
     
@@ -372,7 +435,7 @@ def delete_old_content(days_to_keep: int = 30) -> str:
     Returns:
         str: A message indicating the result of the operation.
     """
-    conn = sqlite3.connect(SUBSCRIPTIONS_DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     try:
@@ -414,6 +477,10 @@ def delete_old_content(days_to_keep: int = 30) -> str:
             WHERE content_update_id IN ({placeholders})
         """, old_content_update_ids)
         summaries_deleted = c.rowcount
+        c.execute(f"""
+            DELETE FROM summary_jobs 
+            WHERE content_update_id IN ({placeholders})
+        """, old_content_update_ids)
         
         # Delete old content updates
         c.execute(f"""
@@ -422,7 +489,9 @@ def delete_old_content(days_to_keep: int = 30) -> str:
         """, old_content_update_ids)
         updates_deleted = c.rowcount
         
-        # Find and delete content not referenced by any content_update
+        # Find and delete content not referenced by any content_update, keeping the newest
+        # content of each subscription: unchanged refreshes insert nothing, so it may be old
+        # but it is still the baseline the next refresh diffs against
         c.execute("""
             DELETE FROM contents
             WHERE id NOT IN (
@@ -430,15 +499,19 @@ def delete_old_content(days_to_keep: int = 30) -> str:
                 UNION
                 SELECT new_content_id FROM content_updates
             )
+            AND id NOT IN (SELECT MAX(id) FROM contents GROUP BY subscription_id)
             AND fetched_at < ?
         """, (threshold_date,))
         contents_deleted = c.rowcount
         
+        # Delete snapshots no longer referenced by any content
+        snapshots_deleted = gc_snapshots(c)
+        
         # Commit transaction
         conn.commit()
         conn.close()
         
-        logger.info(f"成功删除过期内容: {updates_deleted} 更新, {summaries_deleted} 摘要, {contents_deleted} 内容")
+        logger.info(f"成功删除过期内容: {updates_deleted} 更新, {summaries_deleted} 摘要, {contents_deleted} 内容, {snapshots_deleted} 快照")
         return f"Successfully deleted old content: {updates_deleted} updates, {summaries_deleted} summaries, {contents_deleted} contents"
         
     except Exception as e:
@@ -462,7 +535,7 @@ def save_summary_feedback(summary_id: int, feedback_score: float, feedback_comme
     if not isinstance(feedback_score, (int, float)) or feedback_score < 0 or feedback_score > 1:
         return "Feedback score must be a number between 0 and 1"
     
-    conn = sqlite3.connect(SUBSCRIPTIONS_DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     try:
@@ -497,8 +570,6 @@ def save_summary_feedback(summary_id: int, feedback_score: float, feedback_comme
         conn.commit()
         
         # Call the incremental learning function with the feedback
-        from src.agent.summary import SubscriptionAgent
-        
         # Get the summary content
         c.execute("SELECT summary FROM summaries WHERE id = ?", (summary_id,))
         summary_content = c.fetchone()[0]
@@ -518,7 +589,7 @@ def save_summary_feedback(summary_id: int, feedback_score: float, feedback_comme
             }
             
             # Save to incremental learning system
-            agent = SubscriptionAgent()
+            agent = get_agent()
             agent.save_feedback(
                 input_text=diff_details,
                 output_text=key_points_text,
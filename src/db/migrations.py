@@ -0,0 +1,233 @@
+"""
+数据库结构迁移  Versioned schema migrations for the subscriptions database.
+
+数据库的结构版本保存在 PRAGMA user_version 中，MIGRATIONS 按版本号依次列出每一步变更。
+init_db 启动时调用 migrate：每个未执行的迁移在单独的 BEGIN IMMEDIATE 事务中执行并写入新版本号，
+多个进程同时启动时后到者会在事务内重新读取版本号并跳过已完成的迁移，重复执行没有副作用。
+
+新增表或索引时在 MIGRATIONS 末尾追加一个函数，不要修改已经发布的迁移。
+
+Usage:
+    migrate(get_connection())
+"""
+
+import sqlite3
+from typing import Callable, List, Tuple
+
+from src.log import get_logger
+
+logger = get_logger("db.migrations")
+
+
+def _baseline(c: sqlite3.Cursor):
+    """版本 1：迁移框架引入之前由 init_db 创建的全部表  Tables created by init_db before versioning"""
+    # Create subscriptions table
+    c.execute('''CREATE TABLE IF NOT EXISTS subscriptions
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  url TEXT NOT NULL,
+                  description TEXT,
+                  check_interval INTEGER NOT NULL,
+                  created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                  last_updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')))''')
+    
+    # Create contents table
+    c.execute('''CREATE TABLE IF NOT EXISTS contents
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  subscription_id INTEGER NOT NULL,
+                  content TEXT NOT NULL,
+                  fetched_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                  fingerprint TEXT,
+                  FOREIGN KEY (subscription_id) REFERENCES subscriptions (id))''')
+    
+    # Add the SimHash fingerprint column to contents tables created before it existed
+    c.execute("PRAGMA table_info(contents)")
+    if "fingerprint" not in [column[1] for column in c.fetchall()]:
+        c.execute("ALTER TABLE contents ADD COLUMN fingerprint TEXT")
+    
+    # Create content_updates table
+    c.execute('''CREATE TABLE IF NOT EXISTS content_updates
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  subscription_id INTEGER NOT NULL,
+                  old_content_id INTEGER NOT NULL,
+                  new_content_id INTEGER NOT NULL,
+                  similarity_ratio REAL NOT NULL,
+                  diff_details TEXT NOT NULL,
+                  updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                  FOREIGN KEY (subscription_id) REFERENCES subscriptions (id),
+                  FOREIGN KEY (old_content_id) REFERENCES contents (id),
+                  FOREIGN KEY (new_content_id) REFERENCES contents (id))''')
+    
+    # Create summaries table with all columns including feedback columns
+    c.execute('''CREATE TABLE IF NOT EXISTS summaries
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  content_update_id INTEGER NOT NULL,
+                  summary TEXT NOT NULL,
+                  feedback_score REAL DEFAULT 0.0,
+                  feedback_comment TEXT,
+                  feedback_at TIMESTAMP,
+                  created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                  FOREIGN KEY (content_update_id) REFERENCES content_updates (id))''')
+    
+    # Create fetch_validators table for conditional requests (ETag / Last-Modified / body hash)
+    c.execute('''CREATE TABLE IF NOT EXISTS fetch_validators
+                 (subscription_id INTEGER PRIMARY KEY,
+                  etag TEXT,
+                  last_modified TEXT,
+                  content_hash TEXT,
+                  checked_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                  FOREIGN KEY (subscription_id) REFERENCES subscriptions (id))''')
+    
+    # Create summary_jobs table, the durable queue consumed by the summary workers
+    c.execute('''CREATE TABLE IF NOT EXISTS summary_jobs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  content_update_id INTEGER NOT NULL UNIQUE,
+                  status TEXT NOT NULL DEFAULT 'pending',
+                  attempts INTEGER NOT NULL DEFAULT 0,
+                  available_at REAL NOT NULL DEFAULT 0,
+                  lease_owner TEXT,
+                  lease_expires_at REAL,
+                  last_error TEXT,
+                  created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                  FOREIGN KEY (content_update_id) REFERENCES content_updates (id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_summary_jobs_status ON summary_jobs (status, available_at)")
+    
+    # Move summaries deferred by the circuit breaker into the queue
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'summary_backlog'")
+    if c.fetchone():
+        c.execute("""INSERT OR IGNORE INTO summary_jobs (content_update_id, last_error)
+                     SELECT content_update_id, reason FROM summary_backlog""")
+        c.execute("DROP TABLE summary_backlog")
+
+
+def _dedupe_subscriptions(c: sqlite3.Cursor) -> int:
+    """合并 URL 相同的订阅，保留最早创建的一条  Merge subscriptions sharing a URL into the oldest one
+
+    Returns:
+        int: 删除的重复订阅数
+    """
+    c.execute("""
+        SELECT url, MIN(id), GROUP_CONCAT(id)
+        FROM subscriptions
+        GROUP BY url
+        HAVING COUNT(*) > 1
+    """)
+    removed = 0
+    for url, keep_id, ids in c.fetchall():
+        duplicates = [int(sub_id) for sub_id in ids.split(",") if int(sub_id) != keep_id]
+        placeholders = ','.join(['?'] * len(duplicates))
+        # 历史内容与更新挂到保留的订阅上  History moves to the kept subscription
+        c.execute(f"UPDATE contents SET subscription_id = ? WHERE subscription_id IN ({placeholders})",
+                  [keep_id] + duplicates)
+        c.execute(f"UPDATE content_updates SET subscription_id = ? WHERE subscription_id IN ({placeholders})",
+                  [keep_id] + duplicates)
+        # 校验信息只对应单个订阅，重复订阅的直接丢弃（下次抓取为完整请求）
+        # Validators belong to a single subscription; the duplicates' are dropped and refetched in full
+        c.execute(f"DELETE FROM fetch_validators WHERE subscription_id IN ({placeholders})", duplicates)
+        c.execute("""
+            UPDATE subscriptions SET
+                check_interval = (SELECT MIN(check_interval) FROM subscriptions WHERE url = ?),
+                last_updated_at = (SELECT MAX(last_updated_at) FROM subscriptions WHERE url = ?)
+            WHERE id = ?
+        """, (url, url, keep_id))
+        c.execute(f"DELETE FROM subscriptions WHERE id IN ({placeholders})", duplicates)
+        removed += len(duplicates)
+        logger.warning(f"合并重复订阅: {url} -> {keep_id}，删除 {duplicates}")
+    return removed
+
+
+def _indexes(c: sqlite3.Cursor):
+    """版本 2：订阅 URL 唯一约束与常用查询的索引  UNIQUE url and indexes for the hot queries"""
+    _dedupe_subscriptions(c)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_subscriptions_url ON subscriptions (url)")
+    # 每个订阅的最新内容  Latest content of a subscription
+    c.execute("CREATE INDEX IF NOT EXISTS idx_contents_subscription_fetched "
+              "ON contents (subscription_id, fetched_at DESC, id DESC)")
+    # 订阅的更新历史与按时间排序的更新列表  Update history per subscription and the global timeline
+    c.execute("CREATE INDEX IF NOT EXISTS idx_content_updates_subscription_updated "
+              "ON content_updates (subscription_id, updated_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_content_updates_updated ON content_updates (updated_at)")
+    # get_updates 与删除时按内容更新查找摘要  Summaries of an update, used by the get_updates join
+    c.execute("CREATE INDEX IF NOT EXISTS idx_summaries_content_update ON summaries (content_update_id)")
+
+
+def _snapshots(c: sqlite3.Cursor):
+    """版本 3：按内容哈希去重的压缩快照存储  Content-addressed snapshot store for contents"""
+    from .snapshots import migrate_inline_contents
+    c.execute('''CREATE TABLE IF NOT EXISTS snapshots
+                 (hash TEXT PRIMARY KEY,
+                  codec TEXT NOT NULL,
+                  dict_id INTEGER,
+                  base_hash TEXT,
+                  size INTEGER NOT NULL,
+                  stored_size INTEGER NOT NULL,
+                  data BLOB NOT NULL,
+                  created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+                  FOREIGN KEY (dict_id) REFERENCES snapshot_dictionaries (id),
+                  FOREIGN KEY (base_hash) REFERENCES snapshots (hash))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_base ON snapshots (base_hash)")
+    c.execute('''CREATE TABLE IF NOT EXISTS snapshot_dictionaries
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  data BLOB NOT NULL,
+                  samples INTEGER NOT NULL,
+                  created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')))''')
+    c.execute("PRAGMA table_info(contents)")
+    if "content_hash" not in [column[1] for column in c.fetchall()]:
+        c.execute("ALTER TABLE contents ADD COLUMN content_hash TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_contents_hash ON contents (content_hash)")
+    migrated = migrate_inline_contents(c)
+    if migrated:
+        logger.info(f"已把 {migrated} 条内容迁移到快照存储，执行 VACUUM 可回收空间")
+
+
+# (版本号, 说明, 迁移函数)，版本号从 1 开始连续递增
+# (version, description, function); versions start at 1 and increase by one
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "baseline tables", _baseline),
+    (2, "unique subscription url and query indexes", _indexes),
+    (3, "content-addressed snapshot store", _snapshots),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """当前数据库的结构版本  Schema version stored in PRAGMA user_version"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    执行所有未执行的迁移
+    Apply pending migrations, each in its own transaction.
+
+    Args:
+        conn: 数据库连接
+
+    Returns:
+        int: 迁移后的结构版本
+
+    Raises:
+        RuntimeError: 数据库版本高于程序支持的版本
+    """
+    current = schema_version(conn)
+    if current > LATEST_VERSION:
+        raise RuntimeError(f"数据库结构版本 {current} 高于程序支持的版本 {LATEST_VERSION}，请升级程序")
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            # 持有写锁后再确认一次，其他进程可能已经完成该迁移  Another process may have got here first
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            apply(c)
+            c.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"数据库迁移 {version} ({description}) 失败")
+            raise
+        logger.info(f"数据库已迁移到版本 {version}: {description}")
+    return schema_version(conn)
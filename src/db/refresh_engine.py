@@ -0,0 +1,476 @@
+"""
+并发刷新引擎  Concurrent refresh engine for subscriptions.
+
+刷新流程被拆分为两个阶段，每个阶段有独立的线程池：
+    fetch (按域名限流，条件请求) -> diff
+
+抓取阶段使用 ETag / Last-Modified / 内容哈希做条件请求，内容未变化时直接跳过后续阶段。
+需要摘要的内容更新只写入持久化的摘要队列（summary_jobs），由摘要工作线程异步调用大模型，
+刷新不再等待任何大模型调用。
+
+所有数据库写操作由单独的写线程完成，工作线程之间不共享 sqlite 连接。
+The refresh is split into fetch / diff stages, each with its own worker pool.
+A single writer thread owns the database connection and commits one short
+transaction per subscription; significant updates are enqueued for the
+summary workers instead of being summarized inline.
+"""
+
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from src.log import get_logger
+from src.crawler.conditional import FetchValidators
+from .config import SUBSCRIPTIONS_DB_PATH
+from .connection import close_connection, get_connection
+from .db_operate import get_fetch_validators, save_fetch_validators
+from .snapshots import load_content, store_snapshot
+from .summary_queue import enqueue_summary, format_queue_stats, get_summary_queue_stats, notify_summary_workers
+
+logger = get_logger("db.refresh_engine")
+
+# 默认并发配置，可在 config.yaml 的 refresh 节点中覆盖
+# Default concurrency settings, can be overridden by the `refresh` section of config.yaml
+DEFAULT_REFRESH_CONFIG = {
+    "backend": "thread",        # 抓取后端: thread（线程池）或 async（asyncio 事件循环）
+    "fetch_workers": 8,
+    "per_host_limit": 2,
+    "async_max_in_flight": 200,  # async 后端同时在途的请求数上限
+    "diff_workers": 2,
+    "diff_mode": "auto",         # 差异粒度: auto / structured / line / paragraph / char（旧的逐字符比较）
+    "fingerprint_distance": 3,   # 新旧 SimHash 汉明距离不超过该值时跳过差异计算与摘要，负数关闭
+}
+
+
+def load_refresh_config() -> Dict[str, Any]:
+    """读取刷新引擎配置  Load refresh engine settings merged with defaults
+
+    Returns:
+        Dict[str, Any]: 刷新引擎配置
+    """
+    settings = dict(DEFAULT_REFRESH_CONFIG)
+    try:
+        from src.services import ConfigManager
+        config = ConfigManager().get_config() or {}
+        for key, value in (config.get("refresh") or {}).items():
+            if key in settings and value is not None:
+                settings[key] = type(DEFAULT_REFRESH_CONFIG[key])(value)
+    except Exception as e:
+        logger.warning(f"读取刷新配置失败，使用默认配置: {e}")
+    return settings
+
+
+@dataclass
+class RefreshTask:
+    """单个订阅的刷新任务  State of one subscription flowing through the pipeline"""
+    sub_id: int
+    url: str
+    old_content_id: Optional[int]
+    old_content: Optional[str]
+    old_fingerprint: Optional[str] = None
+    old_content_hash: Optional[str] = None
+    validators: FetchValidators = field(default_factory=FetchValidators)
+    new_content: Optional[str] = None
+    fingerprint: Optional[str] = None
+    unchanged: bool = False
+    similarity: float = 1.0
+    diffs: List[str] = field(default_factory=list)
+    significant: bool = False
+    error: Optional[str] = None
+
+
+@dataclass
+class StageStats:
+    """单个阶段的统计信息  Per-stage counters used to report throughput"""
+    name: str
+    processed: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+    first_start: Optional[float] = None
+    last_end: Optional[float] = None
+
+    @property
+    def wall_seconds(self) -> float:
+        if self.first_start is None or self.last_end is None:
+            return 0.0
+        return self.last_end - self.first_start
+
+    @property
+    def throughput(self) -> float:
+        """每秒处理的订阅数  Items per second over the stage's wall time"""
+        wall = self.wall_seconds
+        return self.processed / wall if wall > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.name}: {self.processed} 个, 错误 {self.errors}, "
+                f"耗时 {self.wall_seconds:.2f}s, 吞吐 {self.throughput:.2f}/s")
+
+
+class _StageTimer:
+    """线程安全地记录阶段耗时  Context manager that records items into a StageStats"""
+
+    def __init__(self, stats: StageStats, lock: threading.Lock, items: int = 1):
+        self.stats = stats
+        self.lock = lock
+        self.items = items
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        with self.lock:
+            if self.stats.first_start is None or self.start < self.stats.first_start:
+                self.stats.first_start = self.start
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.monotonic()
+        with self.lock:
+            self.stats.processed += self.items
+            if exc_type is not None:
+                self.stats.errors += self.items
+            self.stats.busy_seconds += end - self.start
+            if self.stats.last_end is None or end > self.stats.last_end:
+                self.stats.last_end = end
+        return False
+
+
+class HostLimiter:
+    """按域名限制并发数  Caps the number of in-flight requests per host"""
+
+    def __init__(self, per_host_limit: int):
+        self.per_host_limit = max(1, per_host_limit)
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._semaphores[host]
+
+
+@dataclass
+class RefreshReport:
+    """一次刷新的结果  Outcome of one refresh run"""
+    refreshed: int
+    stages: List[StageStats]
+    elapsed: float
+    enqueued: int = 0
+
+    def format_stats(self) -> str:
+        return "; ".join(str(stage) for stage in self.stages)
+
+
+class _ResultWriter(threading.Thread):
+    """唯一的写线程，按订阅提交事务  Single writer committing one transaction per subscription"""
+
+    _STOP = object()
+
+    def __init__(self, db_path: str, current_time: datetime, stats: StageStats, stats_lock: threading.Lock):
+        super().__init__(name="refresh-writer", daemon=True)
+        self.db_path = db_path
+        self.current_time = current_time
+        self.stats = stats
+        self.stats_lock = stats_lock
+        self.queue: "queue.Queue" = queue.Queue()
+        self.written = 0
+        self.enqueued = 0
+
+    def submit(self, task: RefreshTask):
+        self.queue.put(task)
+
+    def close(self):
+        self.queue.put(self._STOP)
+        self.join()
+
+    def run(self):
+        conn = get_connection(self.db_path)
+        try:
+            while True:
+                task = self.queue.get()
+                if task is self._STOP:
+                    break
+                try:
+                    with _StageTimer(self.stats, self.stats_lock):
+                        self._write(conn, task)
+                    if task.error is None:
+                        self.written += 1
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"写入刷新结果失败: {task.url} - {e}")
+        finally:
+            close_connection(self.db_path)
+
+    def _write(self, conn: sqlite3.Connection, task: RefreshTask):
+        if task.error is not None:
+            # 差异计算失败时不写入快照、校验信息和检查时间，下一轮重新抓取并重试
+            # On a failed diff keep content, validators and last_updated_at untouched so the next tick retries
+            logger.debug(f"刷新失败，保留原有内容等待重试: {task.url}")
+            return
+        c = conn.cursor()
+        save_fetch_validators(c, task.sub_id, task.validators)
+        # 内容未变化时（304 或哈希一致）不写入 contents，也不做差异计算
+        # Unchanged pages (304 or same body hash) skip the contents insert entirely
+        if task.new_content is not None and not task.unchanged:
+            # 存储新内容，相同快照只保存一次  Store new content; identical snapshots are stored once
+            snapshot_hash = store_snapshot(c, task.new_content, base_hash=task.old_content_hash)
+            c.execute("""
+                INSERT INTO contents (subscription_id, content, content_hash, fingerprint)
+                VALUES (?, '', ?, ?)
+            """, (task.sub_id, snapshot_hash, task.fingerprint))
+            new_content_id = c.lastrowid
+
+            if task.significant:
+                # 没有历史内容时与 add_subscription 一致，用 "None" 占位
+                # Mirror add_subscription and use a "None" placeholder when there is no previous content
+                old_content_id = task.old_content_id if task.old_content_id is not None else "None"
+                c.execute("""
+                    INSERT INTO content_updates
+                    (subscription_id, old_content_id, new_content_id, similarity_ratio, diff_details)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (task.sub_id, old_content_id, new_content_id, task.similarity,
+                      json.dumps(task.diffs, ensure_ascii=False)))
+                # 摘要由摘要工作线程生成，这里只入队  Summaries are produced by the summary workers
+                enqueue_summary(c, c.lastrowid)
+                logger.debug(f"摘要任务已入队... {task.url}")
+
+        # 更新最后检查时间,无论是否生成摘要  Update last_updated_at whether a summary is generated or not
+        c.execute("""
+            UPDATE subscriptions
+            SET last_updated_at = ?
+            WHERE id = ?
+        """, (self.current_time.strftime('%Y-%m-%d %H:%M:%S'), task.sub_id))
+        conn.commit()
+        if task.significant and not task.unchanged and task.new_content is not None:
+            self.enqueued += 1
+
+
+class RefreshEngine:
+    """并发刷新引擎  Runs fetch/diff concurrently for all due subscriptions and enqueues summaries
+
+    Args:
+        similarity_threshold: 相似度低于该阈值时加入摘要队列
+        backend: 抓取后端，"thread" 使用线程池，"async" 在单个事件循环中抓取
+        fetch_workers: 抓取线程数（thread 后端）
+        per_host_limit: 每个域名同时进行的请求数上限
+        async_max_in_flight: 同时在途的请求数上限（async 后端）
+        diff_workers: 差异计算线程数
+        diff_mode: 差异粒度，auto / structured / line / paragraph / char
+        fingerprint_distance: 新旧指纹的汉明距离不超过该值时视为未变化，负数关闭
+        db_path: 数据库路径
+    """
+
+    def __init__(self,
+                 similarity_threshold: float = 0.95,
+                 backend: str = DEFAULT_REFRESH_CONFIG["backend"],
+                 fetch_workers: int = DEFAULT_REFRESH_CONFIG["fetch_workers"],
+                 per_host_limit: int = DEFAULT_REFRESH_CONFIG["per_host_limit"],
+                 async_max_in_flight: int = DEFAULT_REFRESH_CONFIG["async_max_in_flight"],
+                 diff_workers: int = DEFAULT_REFRESH_CONFIG["diff_workers"],
+                 diff_mode: str = DEFAULT_REFRESH_CONFIG["diff_mode"],
+                 fingerprint_distance: int = DEFAULT_REFRESH_CONFIG["fingerprint_distance"],
+                 db_path: str = SUBSCRIPTIONS_DB_PATH):
+        if backend not in ("thread", "async"):
+            raise ValueError(f"Unknown refresh backend: {backend}")
+        self.similarity_threshold = similarity_threshold
+        self.backend = backend
+        self.fetch_workers = max(1, fetch_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.async_max_in_flight = max(1, async_max_in_flight)
+        self.diff_workers = max(1, diff_workers)
+        self.diff_mode = diff_mode
+        self.fingerprint_distance = fingerprint_distance
+        self.host_limiter = HostLimiter(per_host_limit)
+        self.db_path = db_path
+
+        self._stats_lock = threading.Lock()
+        self._futures_lock = threading.Lock()
+        self.fetch_stats = StageStats("fetch")
+        self.diff_stats = StageStats("diff")
+        self.write_stats = StageStats("write")
+
+    @classmethod
+    def from_config(cls, similarity_threshold: float = 0.95) -> "RefreshEngine":
+        """根据 config.yaml 创建引擎  Build an engine from the `refresh` config section"""
+        return cls(similarity_threshold=similarity_threshold, **load_refresh_config())
+
+    def _load_due_tasks(self, current_time: datetime) -> List[RefreshTask]:
+        """读取需要刷新的订阅及其最新内容  Load due subscriptions with their latest content"""
+        conn = get_connection(self.db_path)
+        c = conn.cursor()
+        c.execute("""
+            SELECT id, url, last_updated_at, check_interval
+            FROM subscriptions
+        """)
+        subscriptions = c.fetchall()
+
+        tasks = []
+        for sub_id, url, last_updated, interval in subscriptions:
+            last_updated = datetime.strptime(last_updated, '%Y-%m-%d %H:%M:%S')
+            if current_time - last_updated <= timedelta(minutes=interval):
+                continue
+            c.execute("""
+                SELECT id, content, content_hash, fingerprint FROM contents
+                WHERE subscription_id = ?
+                ORDER BY fetched_at DESC LIMIT 1
+            """, (sub_id,))
+            old_content_row = c.fetchone()
+            old_content_id, old_content, old_hash, old_fingerprint = old_content_row if old_content_row else (None, None, None, None)
+            tasks.append(RefreshTask(sub_id, url, old_content_id, load_content(c, old_content, old_hash),
+                                     old_fingerprint=old_fingerprint,
+                                     old_content_hash=old_hash,
+                                     validators=get_fetch_validators(c, sub_id)))
+        conn.close()
+        return tasks
+
+    def run(self) -> RefreshReport:
+        """执行一次刷新  Refresh all due subscriptions and return a report"""
+        started = time.monotonic()
+        current_time = datetime.now()
+        tasks = self._load_due_tasks(current_time)
+        logger.debug(f"开始并发刷新...待刷新订阅数: {len(tasks)}")
+
+        writer = _ResultWriter(self.db_path, current_time, self.write_stats, self._stats_lock)
+        writer.start()
+
+        from src.crawler import WebCrawler
+        from src.net import get_transport_stats
+        from src.agent import get_llm_cache_stats, get_prompt_stats
+
+        # 所有抓取线程共用一个爬虫实例与共享连接池  All fetch threads share one crawler and the pooled transport
+        self._crawler = WebCrawler()
+        self._writer = writer
+        self._diff_futures = []
+        with ThreadPoolExecutor(self.fetch_workers, thread_name_prefix="refresh-fetch") as fetch_pool, \
+                ThreadPoolExecutor(self.diff_workers, thread_name_prefix="refresh-diff") as diff_pool:
+            self._diff_pool = diff_pool
+
+            # 每个阶段在返回前提交下一阶段，因此按顺序等待即可覆盖所有任务
+            # Each stage schedules the next one before returning, so waiting stage by stage sees every task
+            if self.backend == "async":
+                # 在单个事件循环中完成全部抓取，diff 仍由线程池处理
+                # All fetches share one event loop; diffs still run on the pool
+                wait([fetch_pool.submit(asyncio.run, self._afetch_all(tasks))])
+            else:
+                wait([fetch_pool.submit(self._fetch_stage, task) for task in tasks])
+            wait(self._diff_futures)
+
+        writer.close()
+        if writer.enqueued:
+            # 一次唤醒，工作线程可以把本轮的任务打包成批量请求  One wakeup lets workers batch this run's jobs
+            notify_summary_workers()
+        report = RefreshReport(
+            refreshed=writer.written,
+            stages=[self.fetch_stats, self.diff_stats, self.write_stats],
+            elapsed=time.monotonic() - started,
+            enqueued=writer.enqueued,
+        )
+        logger.info(f"刷新阶段统计: {report.format_stats()}, 总耗时 {report.elapsed:.2f}s")
+        logger.info(f"摘要入队 {report.enqueued} 个, 摘要队列: {format_queue_stats(get_summary_queue_stats(self.db_path))}")
+        logger.info(f"HTTP连接统计: {get_transport_stats()}")
+        logger.info(f"LLM缓存统计: {get_llm_cache_stats()}")
+        logger.info(f"提示token统计: {get_prompt_stats()}")
+        return report
+
+    def _schedule(self, pool: ThreadPoolExecutor, futures: list, fn, task: RefreshTask):
+        with self._futures_lock:
+            futures.append(pool.submit(fn, task))
+
+    def _fetch_stage(self, task: RefreshTask):
+        try:
+            with _StageTimer(self.fetch_stats, self._stats_lock):
+                with self.host_limiter.for_url(task.url):
+                    new_content, task.validators = self._crawler.crawl_if_changed(task.url, task.validators)
+        except Exception as e:
+            self._on_fetch_error(task, e)
+            return
+        self._after_fetch(task, new_content)
+
+    async def _afetch_all(self, tasks: List[RefreshTask]):
+        """异步抓取全部订阅  Fetch every task on one event loop"""
+        from src.net import AsyncHttpTransport
+        async with AsyncHttpTransport.from_config(per_host_limit=self.per_host_limit,
+                                                  max_in_flight=self.async_max_in_flight) as client:
+            await asyncio.gather(*(self._afetch_stage(task, client) for task in tasks))
+        logger.info(f"异步抓取请求数: {client.stats().requests}")
+
+    async def _afetch_stage(self, task: RefreshTask, client):
+        try:
+            with _StageTimer(self.fetch_stats, self._stats_lock):
+                new_content, task.validators = await self._crawler.acrawl_if_changed(
+                    task.url, task.validators, client=client)
+        except Exception as e:
+            self._on_fetch_error(task, e)
+            return
+        self._after_fetch(task, new_content)
+
+    def _on_fetch_error(self, task: RefreshTask, error: Exception):
+        # 抓取失败时不更新 last_updated_at，下一轮会重试
+        # Leave last_updated_at untouched on fetch failure so the next tick retries
+        task.error = str(error)
+        logger.error(f"抓取失败: {task.url} - {error}")
+
+    def _after_fetch(self, task: RefreshTask, new_content: Optional[list]):
+        if new_content is None:
+            task.unchanged = True
+            logger.debug(f"内容未变化，跳过解析与差异计算: {task.url}")
+            self._writer.submit(task)
+            return
+        task.new_content = json.dumps(new_content, ensure_ascii=False)
+        self._schedule(self._diff_pool, self._diff_futures, self._diff_stage, task)
+
+    def _diff_stage(self, task: RefreshTask):
+        from src.services.contentdiff import get_content_diff
+        from src.services.fingerprint import content_fingerprint, hamming_distance, is_near_duplicate
+        try:
+            with _StageTimer(self.diff_stats, self._stats_lock):
+                task.fingerprint = content_fingerprint(task.new_content)
+                old_fingerprint = task.old_fingerprint
+                if old_fingerprint is None and task.old_content is not None:
+                    # 旧数据没有指纹时现算一次  Rows stored before fingerprints existed
+                    old_fingerprint = content_fingerprint(task.old_content)
+                if is_near_duplicate(old_fingerprint, task.fingerprint, self.fingerprint_distance):
+                    # 指纹几乎相同：跳过完整差异计算与摘要。不写入新快照，
+                    # 以上次保存的内容为基准，小改动累积后仍会超过阈值
+                    # Near-identical fingerprint: skip the diff and the LLM call, and keep the stored
+                    # snapshot as the baseline so small edits cannot drift past the threshold unnoticed
+                    distance = hamming_distance(old_fingerprint, task.fingerprint)
+                    logger.debug(f"指纹距离 {distance}，跳过差异计算: {task.url}")
+                    task.unchanged = True
+                    self._writer.submit(task)
+                    return
+                if task.old_content is not None:
+                    task.similarity, task.diffs = get_content_diff(task.old_content, task.new_content,
+                                                                      mode=self.diff_mode)
+                else:
+                    task.similarity, task.diffs = 0.0, [task.new_content]
+        except Exception as e:
+            task.error = str(e)
+            logger.error(f"差异计算失败: {task.url} - {e}")
+            self._writer.submit(task)
+            return
+
+        # 如果相似度低于阈值，则写入时加入摘要队列  If similarity is below the threshold, enqueue a summary on write
+        if task.similarity < self.similarity_threshold and len(task.diffs) > 0:
+            task.significant = True
+        self._writer.submit(task)
+
+
+def run_refresh(similarity_threshold: float = 0.95) -> RefreshReport:
+    """按配置运行一次并发刷新  Run one concurrent refresh with settings from config.yaml
+
+    Args:
+        similarity_threshold (float): 相似度阈值
+
+    Returns:
+        RefreshReport: 刷新结果与各阶段吞吐统计
+    """
+    return RefreshEngine.from_config(similarity_threshold).run()
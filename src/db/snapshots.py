@@ -0,0 +1,341 @@
+"""
+快照存储  Content-addressed, compressed snapshot store for `contents`.
+
+每个不同的页面快照只在 snapshots 表中保存一次，主键为内容的 SHA-256，contents 行通过
+content_hash 引用快照，content 列留空。快照按以下编码之一压缩：
+
+- zstd：默认编码（未安装 zstandard 时退回 zlib）；
+- zstd-dict：使用 train_snapshot_dictionary 训练出的字典压缩，小页面的压缩率明显更高；
+- zstd-delta / zlib-delta：以同一订阅的上一个快照为字典压缩，只保存变化部分（config.yaml 中 delta 开启时）。
+  为限制读取时的解码链长度，连续 max_delta_chain 个增量快照之后保存一个完整快照。
+
+读取方通过 load_content 取得原文，对是否压缩、是否为增量无感知；迁移之前写入的行 content 列仍有原文，
+load_content 直接返回。
+
+Usage:
+    content_hash = store_snapshot(c, content_json, base_hash=old_hash)
+    c.execute("INSERT INTO contents (subscription_id, content, content_hash) VALUES (?, '', ?)", ...)
+    text = load_content(c, content, content_hash)
+"""
+
+import hashlib
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from src.log import get_logger
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖  zstandard is optional
+    zstandard = None
+
+logger = get_logger("db.snapshots")
+
+# 默认快照配置，可在 config.yaml 的 snapshots 节点中覆盖
+# Default snapshot settings, can be overridden by the `snapshots` section of config.yaml
+DEFAULT_SNAPSHOT_CONFIG = {
+    "codec": "zstd",            # 压缩编码: zstd / zlib，未安装 zstandard 时使用 zlib
+    "level": 9,                 # 压缩级别
+    "use_dictionary": True,     # 存在训练好的字典时使用 zstd-dict
+    "delta": False,             # 以同一订阅的上一个快照为基准做增量压缩
+    "max_delta_chain": 8,       # 连续增量快照的最大数量，之后保存完整快照
+}
+
+# zlib 预置字典的窗口大小  zlib only uses the last 32 KiB of a preset dictionary
+_ZLIB_WINDOW = 32 * 1024
+
+_settings: Optional[Dict[str, Any]] = None
+_settings_lock = threading.Lock()
+_dictionaries: Dict[int, Any] = {}
+
+
+def load_snapshot_config() -> Dict[str, Any]:
+    """读取快照配置  Load snapshot settings merged with defaults
+
+    Returns:
+        Dict[str, Any]: 快照配置
+    """
+    settings = dict(DEFAULT_SNAPSHOT_CONFIG)
+    try:
+        from src.services import ConfigManager
+        config = ConfigManager().get_config() or {}
+        for key, value in (config.get("snapshots") or {}).items():
+            if key in settings and value is not None:
+                settings[key] = type(DEFAULT_SNAPSHOT_CONFIG[key])(value)
+    except Exception as e:
+        logger.warning(f"读取快照配置失败，使用默认配置: {e}")
+    if settings["codec"] == "zstd" and zstandard is None:
+        logger.warning("未安装 zstandard，快照使用 zlib 压缩")
+        settings["codec"] = "zlib"
+    return settings
+
+
+def _get_settings() -> Dict[str, Any]:
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = load_snapshot_config()
+    return _settings
+
+
+def content_hash(text: str) -> str:
+    """快照的内容哈希  SHA-256 hex digest of a snapshot"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _dictionary(c: sqlite3.Cursor, dict_id: int):
+    """读取训练好的字典（进程内缓存）  Load a trained dictionary, cached per process"""
+    dictionary = _dictionaries.get(dict_id)
+    if dictionary is None:
+        c.execute("SELECT data FROM snapshot_dictionaries WHERE id = ?", (dict_id,))
+        row = c.fetchone()
+        if row is None:
+            raise KeyError(f"快照字典 {dict_id} 不存在")
+        dictionary = _dictionaries[dict_id] = zstandard.ZstdCompressionDict(row[0])
+    return dictionary
+
+
+def _latest_dictionary(c: sqlite3.Cursor) -> Optional[int]:
+    c.execute("SELECT MAX(id) FROM snapshot_dictionaries")
+    row = c.fetchone()
+    return row[0] if row else None
+
+
+def _raw_dictionary(base: bytes):
+    return zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+
+def _compress(c: sqlite3.Cursor, raw: bytes, base: Optional[bytes]) -> Tuple[str, Optional[int], bytes]:
+    """按配置压缩，返回 (编码, 字典ID, 数据)  Compress raw bytes per the settings"""
+    settings = _get_settings()
+    level = settings["level"]
+    if settings["codec"] == "zstd":
+        if base is not None:
+            compressor = zstandard.ZstdCompressor(level=level, dict_data=_raw_dictionary(base))
+            return "zstd-delta", None, compressor.compress(raw)
+        dict_id = _latest_dictionary(c) if settings["use_dictionary"] else None
+        if dict_id is not None:
+            compressor = zstandard.ZstdCompressor(level=level, dict_data=_dictionary(c, dict_id))
+            return "zstd-dict", dict_id, compressor.compress(raw)
+        return "zstd", None, zstandard.ZstdCompressor(level=level).compress(raw)
+    if base is not None:
+        compressor = zlib.compressobj(level, zdict=base[-_ZLIB_WINDOW:])
+        return "zlib-delta", None, compressor.compress(raw) + compressor.flush()
+    return "zlib", None, zlib.compress(raw, level)
+
+
+def _decompress(c: sqlite3.Cursor, codec: str, dict_id: Optional[int], data: bytes,
+                base: Optional[bytes]) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zlib-delta":
+        decompressor = zlib.decompressobj(zdict=base[-_ZLIB_WINDOW:])
+        return decompressor.decompress(data) + decompressor.flush()
+    if zstandard is None:
+        raise RuntimeError(f"读取 {codec} 快照需要安装 zstandard")
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zstd-dict":
+        return zstandard.ZstdDecompressor(dict_data=_dictionary(c, dict_id)).decompress(data)
+    if codec == "zstd-delta":
+        return zstandard.ZstdDecompressor(dict_data=_raw_dictionary(base)).decompress(data)
+    raise ValueError(f"未知的快照编码: {codec}")
+
+
+def _read_raw(c: sqlite3.Cursor, snapshot_hash: str) -> Tuple[bytes, int]:
+    """读取快照原文及其增量链长度  Raw bytes of a snapshot and its delta chain depth"""
+    # 沿增量链向上找到完整快照，再依次解码  Walk up to the full snapshot, then decode downwards
+    chain = []
+    current = snapshot_hash
+    while current is not None:
+        c.execute("SELECT codec, dict_id, base_hash, data FROM snapshots WHERE hash = ?", (current,))
+        row = c.fetchone()
+        if row is None:
+            raise KeyError(f"快照 {current} 不存在")
+        chain.append(row)
+        current = row[2]
+    raw = None
+    for codec, dict_id, _, data in reversed(chain):
+        raw = _decompress(c, codec, dict_id, data, raw)
+    return raw, len(chain) - 1
+
+
+def store_snapshot(c: sqlite3.Cursor, text: str, base_hash: Optional[str] = None) -> str:
+    """
+    保存快照（已存在时不重复保存），应与写入 contents 处于同一事务
+    Store a snapshot once per distinct content, in the caller's transaction.
+
+    Args:
+        c: 数据库游标
+        text: 快照原文
+        base_hash: 同一订阅上一个快照的哈希，开启增量压缩时作为基准
+
+    Returns:
+        str: 快照哈希，写入 contents.content_hash
+    """
+    snapshot_hash = content_hash(text)
+    c.execute("SELECT 1 FROM snapshots WHERE hash = ?", (snapshot_hash,))
+    if c.fetchone():
+        return snapshot_hash
+
+    raw = text.encode("utf-8")
+    base = None
+    if _get_settings()["delta"] and base_hash is not None and base_hash != snapshot_hash:
+        try:
+            base, depth = _read_raw(c, base_hash)
+            if depth + 1 > _get_settings()["max_delta_chain"]:
+                base = None
+        except KeyError:
+            base = None
+    codec, dict_id, data = _compress(c, raw, base)
+    c.execute("""
+        INSERT INTO snapshots (hash, codec, dict_id, base_hash, size, stored_size, data)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (snapshot_hash, codec, dict_id, base_hash if base is not None else None, len(raw), len(data), data))
+    return snapshot_hash
+
+
+def read_snapshot(c: sqlite3.Cursor, snapshot_hash: str) -> str:
+    """
+    读取快照原文
+    Return the text of a stored snapshot.
+
+    Args:
+        c: 数据库游标
+        snapshot_hash: 快照哈希
+
+    Returns:
+        str: 快照原文
+    """
+    raw, _ = _read_raw(c, snapshot_hash)
+    return raw.decode("utf-8")
+
+
+def load_content(c: sqlite3.Cursor, content: Optional[str], snapshot_hash: Optional[str]) -> Optional[str]:
+    """
+    contents 行的原文：有快照时读取快照，否则为旧数据的 content 列
+    Text of a contents row, whether it references a snapshot or predates the store.
+
+    Args:
+        c: 数据库游标
+        content: contents.content
+        snapshot_hash: contents.content_hash
+
+    Returns:
+        Optional[str]: 原文
+    """
+    if snapshot_hash:
+        return read_snapshot(c, snapshot_hash)
+    return content
+
+
+def gc_snapshots(c: sqlite3.Cursor) -> int:
+    """
+    删除不再被 contents 引用、也不是其他快照增量基准的快照
+    Delete snapshots referenced neither by contents nor as a delta base.
+
+    Args:
+        c: 数据库游标
+
+    Returns:
+        int: 删除的快照数
+    """
+    deleted = 0
+    while True:
+        # 删除增量链末端后，其基准可能随之变为无引用，循环直到没有可删的快照
+        # Removing the tip of a delta chain can orphan its base, so repeat until stable
+        c.execute("""
+            DELETE FROM snapshots
+            WHERE hash NOT IN (SELECT content_hash FROM contents WHERE content_hash IS NOT NULL)
+              AND hash NOT IN (SELECT base_hash FROM snapshots WHERE base_hash IS NOT NULL)
+        """)
+        if c.rowcount <= 0:
+            return deleted
+        deleted += c.rowcount
+
+
+def train_snapshot_dictionary(conn: sqlite3.Connection, dict_size: int = 112640,
+                              sample_limit: int = 2000) -> Optional[int]:
+    """
+    用最近的快照训练 zstd 字典，之后写入的完整快照使用该字典压缩
+    Train a zstd dictionary on recent snapshots; later full snapshots are compressed with it.
+
+    Args:
+        conn: 数据库连接
+        dict_size: 字典大小（字节）
+        sample_limit: 最多使用的样本数
+
+    Returns:
+        Optional[int]: 新字典的ID，样本不足或未安装 zstandard 时为 None
+    """
+    if zstandard is None:
+        logger.warning("未安装 zstandard，无法训练快照字典")
+        return None
+    c = conn.cursor()
+    c.execute("SELECT hash FROM snapshots WHERE base_hash IS NULL ORDER BY created_at DESC LIMIT ?",
+              (sample_limit,))
+    samples = [_read_raw(c, snapshot_hash)[0] for snapshot_hash, in c.fetchall()]
+    if len(samples) < 8:
+        logger.warning(f"快照样本不足 ({len(samples)} 个)，不训练字典")
+        return None
+    dictionary = zstandard.train_dictionary(dict_size, samples)
+    c.execute("INSERT INTO snapshot_dictionaries (data, samples) VALUES (?, ?)",
+              (dictionary.as_bytes(), len(samples)))
+    conn.commit()
+    logger.info(f"已训练快照字典 {c.lastrowid}，样本 {len(samples)} 个，大小 {len(dictionary.as_bytes())} 字节")
+    return c.lastrowid
+
+
+def get_snapshot_stats(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """快照存储统计  Stored vs raw size of the snapshot store
+
+    Returns:
+        Dict[str, Any]: 快照数、原始大小、存储大小与压缩率
+    """
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM snapshots")
+    count, size, stored = c.fetchone()
+    c.execute("SELECT COUNT(*) FROM contents WHERE content_hash IS NOT NULL")
+    references = c.fetchone()[0]
+    return {
+        "snapshots": count,
+        "references": references,
+        "raw_bytes": size,
+        "stored_bytes": stored,
+        "ratio": round(size / stored, 2) if stored else 0.0,
+    }
+
+
+def migrate_inline_contents(c: sqlite3.Cursor, batch_size: int = 200) -> int:
+    """
+    把 contents 中旧的原文迁移到快照存储
+    Move inline contents into the snapshot store, oldest first per subscription.
+
+    Args:
+        c: 数据库游标
+        batch_size: 每次读取的行数
+
+    Returns:
+        int: 迁移的行数
+    """
+    migrated = 0
+    previous: Dict[int, str] = {}
+    last_id = 0
+    while True:
+        c.execute("""
+            SELECT id, subscription_id, content FROM contents
+            WHERE id > ? AND content_hash IS NULL
+            ORDER BY id LIMIT ?
+        """, (last_id, batch_size))
+        rows = c.fetchall()
+        if not rows:
+            return migrated
+        for content_id, subscription_id, content in rows:
+            snapshot_hash = store_snapshot(c, content or "", base_hash=previous.get(subscription_id))
+            previous[subscription_id] = snapshot_hash
+            c.execute("UPDATE contents SET content = '', content_hash = ? WHERE id = ?", (snapshot_hash, content_id))
+            migrated += 1
+            last_id = content_id
@@ -0,0 +1,507 @@
+"""
+持久化摘要任务队列  Durable SQLite-backed queue of summary jobs.
+
+刷新与添加订阅只把需要摘要的 content_update_id 写入 summary_jobs 表（与内容更新在同一个短事务中），
+大模型调用由独立的摘要工作线程（或 `python -m src.db.summary_queue` 启动的工作进程）完成：
+
+- 工作者在 BEGIN IMMEDIATE 事务中认领任务并写入租约（lease_owner / lease_expires_at）；
+- 摘要生成期间不持有数据库事务，完成后在一个事务中写入 summaries 并删除任务，
+  删除时校验租约归属，租约已被他人接管时放弃写入，避免重复摘要；
+- 进程崩溃后租约到期的任务会被重新认领，超过最大尝试次数的任务标记为 failed；
+- 大模型熔断（CircuitOpenError）时任务按熔断剩余时间推迟，不计入尝试次数。
+
+Usage:
+    start_summary_workers()          # 随应用启动
+    get_summary_queue_stats()        # {"pending": 3, "running": 1, "failed": 0, ...}
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.log import get_logger
+from .config import SUBSCRIPTIONS_DB_PATH
+from .connection import close_connection, get_connection
+
+logger = get_logger("db.summary_queue")
+
+# 默认队列配置，可在 config.yaml 的 summary_queue 节点中覆盖
+# Default queue settings, can be overridden by the `summary_queue` section of config.yaml
+DEFAULT_QUEUE_CONFIG = {
+    "workers": 2,              # 摘要工作线程数
+    "claim_size": 8,           # 每次认领的任务数，按 batch_tokens 打包成批量请求
+    "batch_tokens": 6000,      # 批量摘要时每个请求的差异 token 预算，0 表示逐个生成
+    "lease_seconds": 600.0,    # 租约时长（秒），超时未完成的任务可被其他工作者重新认领
+    "max_attempts": 5,         # 每个任务的最大尝试次数，超过后标记为 failed
+    "retry_delay": 30.0,       # 失败后首次重试的等待时间（秒），之后按 2 的指数增长
+    "poll_interval": 5.0,      # 队列为空时的轮询间隔（秒）
+}
+
+# 任务状态  Job states; finished jobs are deleted
+PENDING = "pending"
+RUNNING = "running"
+FAILED = "failed"
+
+# 单次重试等待上限（秒）  Cap of the retry delay
+_MAX_RETRY_DELAY = 3600.0
+
+
+def load_queue_config() -> Dict[str, Any]:
+    """读取摘要队列配置  Load summary queue settings merged with defaults
+
+    Returns:
+        Dict[str, Any]: 摘要队列配置
+    """
+    settings = dict(DEFAULT_QUEUE_CONFIG)
+    try:
+        from src.services import ConfigManager
+        config = ConfigManager().get_config() or {}
+        for key, value in (config.get("summary_queue") or {}).items():
+            if key in settings and value is not None:
+                settings[key] = type(DEFAULT_QUEUE_CONFIG[key])(value)
+    except Exception as e:
+        logger.warning(f"读取摘要队列配置失败，使用默认配置: {e}")
+    return settings
+
+
+def enqueue_summary(c: sqlite3.Cursor, content_update_id: int) -> None:
+    """
+    把内容更新加入摘要队列，应与写入 content_updates 处于同一事务
+    Enqueue a content update; meant to share the transaction that inserted it.
+
+    Args:
+        c: 数据库游标
+        content_update_id: 内容更新ID
+    """
+    c.execute("""
+        INSERT OR IGNORE INTO summary_jobs (content_update_id, status, available_at)
+        VALUES (?, ?, ?)
+    """, (content_update_id, PENDING, time.time()))
+
+
+def claim_summary_jobs(conn: sqlite3.Connection, worker_id: str, limit: int = 1,
+                       lease_seconds: float = DEFAULT_QUEUE_CONFIG["lease_seconds"],
+                       max_attempts: int = DEFAULT_QUEUE_CONFIG["max_attempts"]) -> List[Tuple[int, int]]:
+    """
+    认领可执行的任务并写入租约
+    Claim due jobs, including running jobs whose lease has expired.
+
+    Args:
+        conn: 数据库连接
+        worker_id: 工作者标识，写入 lease_owner
+        limit: 最多认领的任务数
+        lease_seconds: 租约时长（秒）
+        max_attempts: 最大尝试次数，租约过期且已用尽次数的任务标记为 failed
+
+    Returns:
+        List[Tuple[int, int]]: [(任务ID, 内容更新ID)]
+    """
+    now = time.time()
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        # 反复在处理中崩溃的任务不再认领  Jobs that keep crashing their worker are given up
+        c.execute("""
+            UPDATE summary_jobs
+            SET status = ?, lease_owner = NULL, lease_expires_at = NULL,
+                last_error = COALESCE(last_error, '租约多次过期')
+            WHERE status = ? AND lease_expires_at < ? AND attempts >= ?
+        """, (FAILED, RUNNING, now, max_attempts))
+        c.execute("""
+            SELECT id, content_update_id FROM summary_jobs
+            WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?)
+            ORDER BY available_at, id
+            LIMIT ?
+        """, (PENDING, now, RUNNING, now, limit))
+        jobs = c.fetchall()
+        if jobs:
+            placeholders = ','.join(['?'] * len(jobs))
+            c.execute(f"""
+                UPDATE summary_jobs
+                SET status = ?, lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1
+                WHERE id IN ({placeholders})
+            """, [RUNNING, worker_id, now + lease_seconds] + [job_id for job_id, _ in jobs])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return jobs
+
+
+def complete_summary_job(conn: sqlite3.Connection, job_id: int, worker_id: str,
+                         content_update_id: int, summary: Optional[Any]) -> bool:
+    """
+    写入摘要并删除任务；租约已不属于该工作者时放弃写入
+    Store the summary and delete the job, fenced by lease ownership.
+
+    Args:
+        conn: 数据库连接
+        job_id: 任务ID
+        worker_id: 工作者标识
+        content_update_id: 内容更新ID
+        summary: SummaryResponse，为 None 时（没有实质性更新）只删除任务
+
+    Returns:
+        bool: 是否写入成功
+    """
+    c = conn.cursor()
+    try:
+        c.execute("DELETE FROM summary_jobs WHERE id = ? AND lease_owner = ?", (job_id, worker_id))
+        if c.rowcount == 0:
+            conn.rollback()
+            logger.warning(f"任务 {job_id} 的租约已被接管，放弃写入摘要")
+            return False
+        if summary is not None:
+            c.execute("INSERT INTO summaries (content_update_id, summary) VALUES (?, ?)",
+                      (content_update_id, json.dumps(summary.model_dump(), ensure_ascii=False)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def release_summary_job(conn: sqlite3.Connection, job_id: int, worker_id: str, error: str,
+                        delay: Optional[float] = None,
+                        retry_delay: float = DEFAULT_QUEUE_CONFIG["retry_delay"],
+                        max_attempts: int = DEFAULT_QUEUE_CONFIG["max_attempts"]) -> None:
+    """
+    归还失败或推迟的任务
+    Return a job to the queue after a failure, or mark it failed.
+
+    Args:
+        conn: 数据库连接
+        job_id: 任务ID
+        worker_id: 工作者标识
+        error: 失败原因
+        delay: 推迟的秒数（熔断时使用），不为 None 时不计入尝试次数
+        retry_delay: 失败后首次重试的等待时间（秒）
+        max_attempts: 最大尝试次数
+    """
+    c = conn.cursor()
+    c.execute("SELECT attempts FROM summary_jobs WHERE id = ? AND lease_owner = ?", (job_id, worker_id))
+    row = c.fetchone()
+    if row is None:
+        conn.rollback()
+        return
+    attempts = row[0]
+    if delay is not None:
+        attempts = max(0, attempts - 1)
+    elif attempts >= max_attempts:
+        logger.error(f"摘要任务 {job_id} 已失败 {attempts} 次，不再重试: {error}")
+        c.execute("""
+            UPDATE summary_jobs
+            SET status = ?, lease_owner = NULL, lease_expires_at = NULL, last_error = ?
+            WHERE id = ?
+        """, (FAILED, error, job_id))
+        conn.commit()
+        return
+    else:
+        delay = min(_MAX_RETRY_DELAY, retry_delay * (2 ** (attempts - 1)))
+    c.execute("""
+        UPDATE summary_jobs
+        SET status = ?, lease_owner = NULL, lease_expires_at = NULL,
+            attempts = ?, available_at = ?, last_error = ?
+        WHERE id = ?
+    """, (PENDING, attempts, time.time() + delay, error, job_id))
+    conn.commit()
+
+
+def retry_failed_summary_jobs(db_path: str = SUBSCRIPTIONS_DB_PATH) -> int:
+    """把失败的任务重新放回队列  Requeue every failed job
+
+    Returns:
+        int: 重新排队的任务数
+    """
+    conn = get_connection(db_path)
+    c = conn.cursor()
+    c.execute("""
+        UPDATE summary_jobs SET status = ?, attempts = 0, available_at = ?
+        WHERE status = ?
+    """, (PENDING, time.time(), FAILED))
+    requeued = c.rowcount
+    conn.commit()
+    conn.close()
+    return requeued
+
+
+def get_summary_queue_stats(db_path: str = SUBSCRIPTIONS_DB_PATH) -> Dict[str, Any]:
+    """
+    队列深度  Queue depth by state.
+
+    Returns:
+        Dict[str, Any]: pending / running / failed 各状态的任务数，due 为当前可执行的任务数，
+                        oldest_age 为最早的待处理任务已等待的秒数
+    """
+    now = time.time()
+    conn = get_connection(db_path)
+    c = conn.cursor()
+    c.execute("SELECT status, COUNT(*) FROM summary_jobs GROUP BY status")
+    stats: Dict[str, Any] = {PENDING: 0, RUNNING: 0, FAILED: 0}
+    stats.update(dict(c.fetchall()))
+    c.execute("""
+        SELECT COUNT(*), MIN(available_at) FROM summary_jobs
+        WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?)
+    """, (PENDING, now, RUNNING, now))
+    due, oldest = c.fetchone()
+    conn.close()
+    stats["due"] = due
+    stats["oldest_age"] = round(now - oldest, 1) if oldest is not None else 0.0
+    return stats
+
+
+def format_queue_stats(stats: Dict[str, Any]) -> str:
+    return (f"待处理 {stats[PENDING]} 个（可执行 {stats['due']} 个，最早已等待 {stats['oldest_age']:.0f}s）, "
+            f"处理中 {stats[RUNNING]} 个, 失败 {stats[FAILED]} 个")
+
+
+class SummaryWorker(threading.Thread):
+    """摘要工作线程：认领任务、调用大模型、写入摘要  Claims jobs, summarizes and stores the results
+
+    Args:
+        index: 工作者序号
+        settings: 队列配置
+        wakeup: 有新任务时被设置的事件
+        db_path: 数据库路径
+    """
+
+    def __init__(self, index: int, settings: Dict[str, Any], wakeup: threading.Event,
+                 db_path: str = SUBSCRIPTIONS_DB_PATH):
+        super().__init__(name=f"summary-worker-{index}", daemon=True)
+        # 进程内外唯一的租约持有者标识  Lease owner unique across processes and hosts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        self.settings = settings
+        self.wakeup = wakeup
+        self.db_path = db_path
+        self.stopping = threading.Event()
+        self.processed = 0
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+
+    def run(self):
+        conn = get_connection(self.db_path)
+        try:
+            while not self.stopping.is_set():
+                try:
+                    handled = self.run_once(conn)
+                except Exception as e:
+                    logger.error(f"摘要工作线程出错: {e}")
+                    handled = 0
+                if not handled:
+                    self.wakeup.wait(self.settings["poll_interval"])
+                    self.wakeup.clear()
+        finally:
+            close_connection(self.db_path)
+
+    def run_once(self, conn: sqlite3.Connection) -> int:
+        """
+        认领并处理一批任务
+        Claim and process one batch of jobs.
+
+        Args:
+            conn: 本线程的数据库连接
+
+        Returns:
+            int: 认领的任务数，0 表示队列中没有可执行的任务
+        """
+        claim_size = self.settings["claim_size"] if self.settings["batch_tokens"] > 0 else 1
+        jobs = claim_summary_jobs(conn, self.worker_id, max(1, claim_size),
+                                  self.settings["lease_seconds"], self.settings["max_attempts"])
+        if not jobs:
+            return 0
+        job_ids = {content_update_id: job_id for job_id, content_update_id in jobs}
+        c = conn.cursor()
+        placeholders = ','.join(['?'] * len(jobs))
+        c.execute(f"""
+            SELECT cu.id, cu.diff_details, sub.url
+            FROM content_updates cu
+            JOIN subscriptions sub ON sub.id = cu.subscription_id
+            WHERE cu.id IN ({placeholders})
+        """, list(job_ids))
+        details = {content_update_id: (diff_details, url) for content_update_id, diff_details, url in c.fetchall()}
+        conn.commit()
+
+        # 订阅或内容更新已被删除的任务直接丢弃  Jobs whose update has been deleted are dropped
+        orphans = [job_ids[content_update_id] for content_update_id in job_ids if content_update_id not in details]
+        if orphans:
+            c.execute(f"DELETE FROM summary_jobs WHERE id IN ({','.join(['?'] * len(orphans))})", orphans)
+            conn.commit()
+        if details:
+            self._summarize(conn, job_ids, details)
+        return len(jobs)
+
+    def _summarize(self, conn: sqlite3.Connection, job_ids: Dict[int, int],
+                   details: Dict[int, Tuple[str, str]]):
+        from src.agent import CircuitOpenError, get_agent, get_live_feed
+        feed = get_live_feed()
+        agent = get_agent()
+        if self.settings["batch_tokens"] > 0 and len(details) > 1:
+            batches = agent.pack_batches({key: diff for key, (diff, _) in details.items()},
+                                         self.settings["batch_tokens"])
+        else:
+            batches = [{key: diff} for key, (diff, _) in details.items()]
+
+        for index, batch in enumerate(batches):
+            urls = {key: details[key][1] for key in batch}
+            try:
+                if len(batch) > 1:
+                    summaries = agent.summarize_batch(
+                        batch, on_partial=lambda key, key_points: feed.update(urls[key], key_points))
+                else:
+                    (key, diff), = batch.items()
+                    summaries = {key: agent.generate_summary(
+                        diff, on_partial=lambda key_points: feed.update(urls[key], key_points))}
+            except CircuitOpenError as e:
+                # 熔断：剩余任务全部推迟，不计入尝试次数  Defer every remaining job without spending an attempt
+                logger.warning(f"摘要推迟生成: {e}")
+                for rest in batches[index:]:
+                    for key in rest:
+                        feed.update(details[key][1], [], "deferred")
+                        # 半开状态下探测请求未返回时 retry_after 为 0，至少等待 retry_delay，避免反复认领
+                        # retry_after is 0 while a half-open probe is in flight; wait at least retry_delay
+                        release_summary_job(conn, job_ids[key], self.worker_id, str(e),
+                                            delay=max(e.retry_after, self.settings["retry_delay"]))
+                return
+            except Exception as e:
+                logger.error(f"摘要生成失败: {list(urls.values())} - {e}")
+                summaries = {}
+                error = str(e)
+            else:
+                error = "没有生成摘要"
+
+            for key in batch:
+                summary = summaries.get(key)
+                if summary is not None and summary.status == "success":
+                    if summary.content:
+                        logger.info(f"生成摘要并插入数据库... {urls[key]} --- {summary}")
+                        feed.update(urls[key], summary.key_points, "done")
+                    else:
+                        # 模型判断没有实质性更新，与之前一样不保存摘要，也不重试
+                        # No substantive update: nothing to store and nothing to retry
+                        logger.info(f"没有生成摘要... {urls[key]}")
+                        feed.finish(urls[key], "done")
+                    if complete_summary_job(conn, job_ids[key], self.worker_id, key,
+                                            summary if summary.content else None):
+                        self.processed += 1
+                else:
+                    reason = summary.error_message if summary is not None and summary.error_message else error
+                    logger.info(f"没有生成摘要... {urls[key]}")
+                    feed.finish(urls[key], "error")
+                    release_summary_job(conn, job_ids[key], self.worker_id, reason,
+                                        retry_delay=self.settings["retry_delay"],
+                                        max_attempts=self.settings["max_attempts"])
+
+
+class SummaryWorkerPool:
+    """一组摘要工作线程  A set of summary workers sharing one wakeup event
+
+    Args:
+        workers: 工作线程数
+        settings: 队列配置，为 None 时读取 config.yaml
+        db_path: 数据库路径
+    """
+
+    def __init__(self, workers: Optional[int] = None, settings: Optional[Dict[str, Any]] = None,
+                 db_path: str = SUBSCRIPTIONS_DB_PATH):
+        self.settings = dict(settings or load_queue_config())
+        if workers is not None:
+            self.settings["workers"] = workers
+        self.db_path = db_path
+        self.wakeup = threading.Event()
+        self.workers: List[SummaryWorker] = []
+
+    @property
+    def running(self) -> bool:
+        return any(worker.is_alive() for worker in self.workers)
+
+    def start(self):
+        if self.running:
+            return
+        self.workers = [SummaryWorker(index, self.settings, self.wakeup, self.db_path)
+                        for index in range(max(1, self.settings["workers"]))]
+        for worker in self.workers:
+            worker.start()
+        logger.info(f"已启动 {len(self.workers)} 个摘要工作线程")
+
+    def notify(self):
+        """有新任务时唤醒空闲的工作线程  Wake idle workers after enqueueing"""
+        self.wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None):
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            worker.join(timeout)
+        logger.info("摘要工作线程已停止")
+
+
+_pool: Optional[SummaryWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def start_summary_workers() -> SummaryWorkerPool:
+    """启动进程内的摘要工作线程（已启动时直接返回）  Start the in-process workers once
+
+    Returns:
+        SummaryWorkerPool: 工作线程池
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SummaryWorkerPool()
+        _pool.start()
+        return _pool
+
+
+def notify_summary_workers():
+    """唤醒摘要工作线程，未启动时先启动  Wake the workers, starting them if needed"""
+    start_summary_workers().notify()
+
+
+def stop_summary_workers(timeout: Optional[float] = None):
+    """停止进程内的摘要工作线程，未完成的任务在租约到期后由其他工作者接管  Stop the in-process workers"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.stop(timeout)
+
+
+def main():
+    """独立的摘要工作进程  Run summary workers as a standalone process"""
+    parser = argparse.ArgumentParser(description="UPick summary queue worker")
+    parser.add_argument("--workers", "-w", type=int, help="Number of worker threads (default: from config.yaml)")
+    parser.add_argument("--once", action="store_true", help="Process due jobs until the queue is empty, then exit")
+    args = parser.parse_args()
+
+    from . import init_db
+    init_db()
+    pool = SummaryWorkerPool(args.workers)
+    if args.once:
+        worker = SummaryWorker(0, pool.settings, pool.wakeup, pool.db_path)
+        conn = get_connection(pool.db_path)
+        try:
+            while worker.run_once(conn):
+                pass
+        finally:
+            conn.close()
+        logger.info(f"摘要队列: {format_queue_stats(get_summary_queue_stats())}")
+        return
+    pool.start()
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f"摘要队列: {format_queue_stats(get_summary_queue_stats())}")
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+from .transport import HttpTransport, TransportStats, get_transport, get_transport_stats
+from .async_transport import AsyncHttpTransport, async_transport_scope
+
+__all__ = [
+    "HttpTransport",
+    "TransportStats",
+    "get_transport",
+    "get_transport_stats",
+    "AsyncHttpTransport",
+    "async_transport_scope",
+]
@@ -0,0 +1,313 @@
+"""
+进程级共享 HTTP 传输层  Process-wide pooled HTTP transport.
+
+所有爬虫、research 搜索以及 services.apis 客户端共用同一组连接池，
+保持 keep-alive 连接，避免每次请求都重新进行 DNS 解析、TCP 与 TLS 握手。
+安装了 httpx 与 h2 且配置 http2: true 时，https 请求走 HTTP/2。
+
+Usage:
+    from src.net import get_transport
+    response = get_transport().get(url, headers=headers)
+"""
+
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter, BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from src.log import get_logger
+
+logger = get_logger("net.transport")
+
+# 默认连接池配置，可在 config.yaml 的 http 节点中覆盖
+# Default pool settings, can be overridden by the `http` section of config.yaml
+DEFAULT_HTTP_CONFIG = {
+    "pool_connections": 32,   # 缓存的主机连接池数量  number of per-host pools kept
+    "pool_maxsize": 16,       # 每个主机保持的连接数  keep-alive connections per host
+    "connect_timeout": 5.0,   # 连接超时（秒）
+    "read_timeout": 20.0,     # 读取超时（秒）
+    "max_retries": 0,         # 连接级重试次数
+    "http2": False,           # 是否在 https 上启用 HTTP/2
+}
+
+
+def load_http_config() -> Dict:
+    """读取 HTTP 传输层配置  Load transport settings merged with defaults
+
+    Returns:
+        Dict: HTTP 传输层配置
+    """
+    settings = dict(DEFAULT_HTTP_CONFIG)
+    try:
+        from src.services import ConfigManager
+        config = ConfigManager().get_config() or {}
+        for key, value in (config.get("http") or {}).items():
+            if key in settings and value is not None:
+                settings[key] = type(DEFAULT_HTTP_CONFIG[key])(value)
+    except Exception as e:
+        logger.warning(f"读取HTTP配置失败，使用默认配置: {e}")
+    return settings
+
+
+@dataclass
+class HostStats:
+    """单个主机的连接复用统计  Connection reuse counters of one host"""
+    requests: int = 0
+    connections: int = 0
+
+    @property
+    def reuse_ratio(self) -> float:
+        """复用已有连接的请求比例  Share of requests served on an existing connection"""
+        if self.requests == 0:
+            return 0.0
+        return max(0.0, 1 - self.connections / self.requests)
+
+
+@dataclass
+class TransportStats:
+    """传输层统计  Snapshot of connection reuse across all hosts"""
+    requests: int = 0
+    connections: int = 0
+    http2_requests: int = 0
+    hosts: Dict[str, HostStats] = field(default_factory=dict)
+
+    @property
+    def reuse_ratio(self) -> float:
+        if self.requests == 0:
+            return 0.0
+        return max(0.0, 1 - self.connections / self.requests)
+
+    def __str__(self) -> str:
+        return (f"请求 {self.requests} 次, 新建连接 {self.connections} 个, "
+                f"HTTP/2 请求 {self.http2_requests} 次, 连接复用率 {self.reuse_ratio:.1%}")
+
+
+class _StatsRecorder:
+    """线程安全的统计记录器  Thread-safe collector shared by the adapters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, HostStats] = {}
+        self._http2_requests = 0
+        # host -> (连接池对象id, 上次读取的 num_connections)
+        self._pool_marks: Dict[str, Tuple[int, int]] = {}
+
+    def record(self, host: str, new_connections: int = 0, http2: bool = False):
+        with self._lock:
+            stats = self._hosts.setdefault(host, HostStats())
+            stats.requests += 1
+            stats.connections += new_connections
+            if http2:
+                self._http2_requests += 1
+
+    def connections_delta(self, host: str, pool) -> int:
+        """根据 urllib3 连接池计数得到新建连接数  New connections opened by a pool since the last look"""
+        with self._lock:
+            pool_id, seen = self._pool_marks.get(host, (None, 0))
+            current = getattr(pool, "num_connections", 0)
+            # 连接池被淘汰后重新创建时计数从0开始
+            # A recreated pool (after eviction) restarts counting from zero
+            delta = current - seen if pool_id == id(pool) else current
+            self._pool_marks[host] = (id(pool), current)
+            return max(0, delta)
+
+    def snapshot(self) -> TransportStats:
+        with self._lock:
+            hosts = {host: HostStats(s.requests, s.connections) for host, s in self._hosts.items()}
+            return TransportStats(
+                requests=sum(s.requests for s in hosts.values()),
+                connections=sum(s.connections for s in hosts.values()),
+                http2_requests=self._http2_requests,
+                hosts=hosts,
+            )
+
+
+class _PooledAdapter(HTTPAdapter):
+    """记录连接复用情况的 urllib3 连接池适配器  HTTPAdapter that records connection reuse"""
+
+    def __init__(self, recorder: _StatsRecorder, **kwargs):
+        self.recorder = recorder
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        host = urlparse(request.url).netloc.lower()
+        try:
+            # 与 HTTPAdapter.send 使用相同的连接池键  Same pool key as HTTPAdapter.send uses
+            pool = self.get_connection_with_tls_context(
+                request, kwargs.get("verify", True), kwargs.get("proxies"), kwargs.get("cert"))
+            new_connections = self.recorder.connections_delta(host, pool)
+        except Exception:
+            new_connections = 0
+        self.recorder.record(host, new_connections)
+        return response
+
+
+class _Http2Adapter(BaseAdapter):
+    """基于 httpx 的 HTTP/2 适配器，返回标准的 requests.Response
+    Adapter that sends requests through an HTTP/2-capable httpx client."""
+
+    def __init__(self, recorder: _StatsRecorder, pool_maxsize: int, pool_connections: int):
+        super().__init__()
+        import httpx
+        self.recorder = recorder
+        self._httpx = httpx
+        self.client = httpx.Client(
+            http2=True,
+            follow_redirects=False,  # 重定向交给 requests.Session 处理
+            limits=httpx.Limits(max_connections=pool_maxsize * pool_connections,
+                                max_keepalive_connections=pool_maxsize * pool_connections),
+        )
+        self._known_connections = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            httpx_timeout = self._httpx.Timeout(read, connect=connect)
+        else:
+            httpx_timeout = self._httpx.Timeout(timeout)
+        try:
+            r = self.client.request(request.method, request.url, headers=dict(request.headers),
+                                    content=request.body, timeout=httpx_timeout)
+        except self._httpx.TimeoutException as e:
+            raise requests.Timeout(e, request=request)
+        except self._httpx.HTTPError as e:
+            raise requests.ConnectionError(e, request=request)
+
+        response = requests.Response()
+        response.status_code = r.status_code
+        response.headers = CaseInsensitiveDict(r.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.reason = r.reason_phrase
+        response.url = str(r.url)
+        response.request = request
+        response.connection = self
+        response.elapsed = r.elapsed
+        response._content = r.content
+        response._content_consumed = True
+
+        host = urlparse(request.url).netloc.lower()
+        self.recorder.record(host, self._new_connections(), http2=r.http_version == "HTTP/2")
+        return response
+
+    def _new_connections(self) -> int:
+        """httpx 连接池中新出现的连接数（近似值）  Approximate new connections in the httpx pool"""
+        try:
+            current = len(self.client._transport._pool.connections)
+        except AttributeError:
+            return 0
+        delta = max(0, current - self._known_connections)
+        self._known_connections = current
+        return delta
+
+    def close(self):
+        self.client.close()
+
+
+def _http2_available() -> bool:
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpTransport:
+    """共享的 HTTP 传输层  Keep-alive connection pools shared by every HTTP client in the process
+
+    Args:
+        pool_connections: 缓存的主机连接池数量
+        pool_maxsize: 每个主机保持的连接数
+        connect_timeout: 连接超时（秒）
+        read_timeout: 读取超时（秒）
+        max_retries: 连接级重试次数
+        http2: 是否在 https 上启用 HTTP/2（需要 httpx 与 h2）
+    """
+
+    def __init__(self,
+                 pool_connections: int = DEFAULT_HTTP_CONFIG["pool_connections"],
+                 pool_maxsize: int = DEFAULT_HTTP_CONFIG["pool_maxsize"],
+                 connect_timeout: float = DEFAULT_HTTP_CONFIG["connect_timeout"],
+                 read_timeout: float = DEFAULT_HTTP_CONFIG["read_timeout"],
+                 max_retries: int = DEFAULT_HTTP_CONFIG["max_retries"],
+                 http2: bool = DEFAULT_HTTP_CONFIG["http2"]):
+        self.timeout = (connect_timeout, read_timeout)
+        self._recorder = _StatsRecorder()
+        self.adapter = _PooledAdapter(
+            self._recorder,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+        )
+        self.https_adapter: BaseAdapter = self.adapter
+        if http2:
+            if _http2_available():
+                self.https_adapter = _Http2Adapter(self._recorder, pool_maxsize, pool_connections)
+                logger.info("已启用 HTTP/2 传输")
+            else:
+                logger.warning("配置了 http2 但未安装 httpx/h2，使用 HTTP/1.1 连接池")
+        self.session = self.new_session()
+
+    def mount(self, session: requests.Session) -> requests.Session:
+        """将共享连接池挂载到会话上  Mount the shared pools on a session
+
+        Args:
+            session: 需要共享连接池的会话
+
+        Returns:
+            requests.Session: 挂载后的会话
+        """
+        session.mount("https://", self.https_adapter)
+        session.mount("http://", self.adapter)
+        return session
+
+    def new_session(self) -> requests.Session:
+        """创建共享连接池的新会话（独立的请求头与 cookies）
+        Create a session with its own headers/cookies that reuses the shared pools."""
+        return self.mount(requests.Session())
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """使用共享会话发送请求，未指定超时时使用默认超时
+        Send a request on the shared session, applying the default timeout."""
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def stats(self) -> TransportStats:
+        """连接复用统计  Connection reuse statistics"""
+        return self._recorder.snapshot()
+
+    def close(self):
+        self.session.close()
+        self.adapter.close()
+        if self.https_adapter is not self.adapter:
+            self.https_adapter.close()
+
+
+_transport: Optional[HttpTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    """获取进程级共享传输层（首次调用时按配置创建）
+    Return the process-wide transport, creating it from config.yaml on first use."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HttpTransport(**load_http_config())
+    return _transport
+
+
+def get_transport_stats() -> TransportStats:
+    """获取连接复用统计  Connection reuse statistics of the shared transport"""
+    return get_transport().stats()
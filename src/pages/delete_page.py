@@ -1,14 +1,14 @@
 import gradio as gr
-import sqlite3
 from typing import List, Tuple
-from src.db.config import SUBSCRIPTIONS_DB_PATH
+from src.db.connection import get_connection
+from src.db.snapshots import gc_snapshots
 from src.log import get_logger
 
 logger = get_logger("pages.delete_page")
 
 def get_table_names() -> List[str]:
     """Get all table names from the database"""
-    conn = sqlite3.connect(SUBSCRIPTIONS_DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     c.execute("SELECT name FROM sqlite_master WHERE type='table'")
     tables = [row[0] for row in c.fetchall()]
@@ -17,7 +17,7 @@ def get_table_names() -> List[str]:
 
 def get_table_columns(table_name: str) -> List[str]:
     """Get column names for a specific table"""
-    conn = sqlite3.connect(SUBSCRIPTIONS_DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     c.execute(f"PRAGMA table_info({table_name})")
     columns = [row[1] for row in c.fetchall()]
@@ -26,7 +26,7 @@ def get_table_columns(table_name: str) -> List[str]:
 
 def get_table_data(table_name: str) -> List[Tuple]:
     """Get all data from a specific table"""
-    conn = sqlite3.connect(SUBSCRIPTIONS_DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     c.execute(f"SELECT * FROM {table_name}")
     data = c.fetchall()
@@ -35,7 +35,7 @@ def get_table_data(table_name: str) -> List[Tuple]:
 
 def delete_record(table_name: str, record_id: int) -> str:
     """Delete a record from a table with proper foreign key handling"""
-    conn = sqlite3.connect(SUBSCRIPTIONS_DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     try:
@@ -56,6 +56,12 @@ def delete_record(table_name: str, record_id: int) -> str:
                 WHERE subscription_id = ?
             """, (record_id,))
             
+            # Delete related conditional request validators
+            c.execute("""
+                DELETE FROM fetch_validators 
+                WHERE subscription_id = ?
+            """, (record_id,))
+            
             # Delete the subscription
             c.execute("""
                 DELETE FROM subscriptions 
@@ -89,6 +95,10 @@ def delete_record(table_name: str, record_id: int) -> str:
                 WHERE id = ?
             """, (record_id,))
         
+        if table_name in ("subscriptions", "contents"):
+            # Delete snapshots no longer referenced by any content
+            gc_snapshots(c)
+        
         conn.commit()
         return f"Successfully deleted record {record_id} from {table_name}"
         
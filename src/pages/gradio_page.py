@@ -1,18 +1,13 @@
 import gradio as gr
 import sqlite3
 from datetime import datetime
-from src.db import add_subscription, refresh_content, get_updates, save_summary_feedback
+from src.db import add_subscription, refresh_content, query_updates, get_subscriptions, save_summary_feedback, get_summary_queue_stats
 import json
 from src.log import get_logger
-from src.agent.incremental_learning import IncrementalLearner
-from src.agent.summary import SubscriptionAgent
+from src.agent import get_agent, get_learner, get_live_feed
 
 logger = get_logger("pages.gradio_page")
 
-# Initialize the learner and agent
-learner = IncrementalLearner()
-subscription_agent = SubscriptionAgent()
-
 def create_ui():
     """Create Gradio interface for subscription management"""
     with gr.Blocks(css="""
@@ -104,6 +99,27 @@ def create_ui():
             justify-content: space-between;
             margin-bottom: 12px;
         }
+        .live-status {
+            display: inline-block;
+            font-size: 0.75rem;
+            padding: 2px 8px;
+            border-radius: 9999px;
+            margin-left: 8px;
+            background-color: #e0e7ff;
+            color: #3730a3;
+        }
+        .live-status.done {
+            background-color: #dcfce7;
+            color: #166534;
+        }
+        .live-status.error {
+            background-color: #fee2e2;
+            color: #991b1b;
+        }
+        .live-status.deferred {
+            background-color: #fef3c7;
+            color: #92400e;
+        }
     """) as app:
         gr.Markdown("# Subscription Manager")
         
@@ -135,10 +151,28 @@ def create_ui():
                         label="显示时间范围",
                         value="最近24小时"
                     )
+                    subscription_filter = gr.Dropdown(
+                        choices=[("全部订阅", 0)],
+                        label="订阅",
+                        value=0
+                    )
                     view_btn = gr.Button("View Updates", variant="primary")
                 
+                # 正在生成的摘要：流式解析出的关键点实时显示
+                with gr.Accordion("实时摘要", open=True):
+                    live_container = gr.HTML()
+                    live_timer = gr.Timer(2)
+
                 updates_container = gr.HTML(label="Content Updates")
                 
+                # 分页：每页的起始游标与下一页游标  Pager: the start cursor of each visited page and the next one
+                with gr.Row():
+                    prev_page_btn = gr.Button("上一页", interactive=False)
+                    page_info = gr.Markdown("")
+                    next_page_btn = gr.Button("下一页", interactive=False)
+                page_cursors_state = gr.State([None])
+                next_cursor_state = gr.State(None)
+                
                 # State to store the current updates data
                 updates_data_state = gr.State([])
                 
@@ -242,12 +276,14 @@ def create_ui():
                     html += "</div>"
                     return html
                 
-                def get_updates_as_cards(time_range_selection):
+                UPDATES_PAGE_SIZE = 20
+
+                def get_updates_page(time_range_selection, subscription_id, page_cursors):
                     from datetime import timedelta
                     
-                    logger.debug(f"点击获取更新内容 : click get updates with range {time_range_selection}")
+                    logger.debug(f"点击获取更新内容 : click get updates with range {time_range_selection}, page {len(page_cursors)}")
                     
-                    # 根据选择确定时间范围
+                    # 根据选择确定时间范围，在数据库中过滤
                     now = datetime.now()
                     if time_range_selection == "最近1小时":
                         time_filter = now - timedelta(hours=1)
@@ -260,24 +296,13 @@ def create_ui():
                     else:  # "全部"
                         time_filter = None
                     
-                    # 获取更新数据
-                    updates_data = get_updates()
-                    
-                    # 过滤时间范围
-                    if time_filter:
-                        filtered_updates = []
-                        for update in updates_data:
-                            if isinstance(update, (list, tuple)) and len(update) >= 2:
-                                updated_at = update[1]
-                                try:
-                                    update_time = datetime.fromisoformat(updated_at)
-                                    if update_time >= time_filter:
-                                        filtered_updates.append(update)
-                                except (ValueError, TypeError):
-                                    continue
-                        updates_data = filtered_updates
-
-
+                    # 获取当前页的更新数据（不读取 diff_details）
+                    updates_data, next_cursor = query_updates(
+                        since=time_filter,
+                        subscription_ids=[subscription_id] if subscription_id else None,
+                        limit=UPDATES_PAGE_SIZE,
+                        cursor=page_cursors[-1],
+                    )
                     
                     # Update dropdown options for feedback
                     update_options = []
@@ -287,21 +312,96 @@ def create_ui():
                             label = f"{i+1}. {url[:40]}..." if len(url) > 40 else f"{i+1}. {url}"
                             update_options.append(label)
                     
-                    return format_updates_as_cards(updates_data), updates_data, gr.update(choices=update_options)
+                    page_number = len(page_cursors)
+                    return (format_updates_as_cards(updates_data), updates_data, gr.update(choices=update_options),
+                            page_cursors, next_cursor, f"第 {page_number} 页",
+                            gr.update(interactive=page_number > 1), gr.update(interactive=next_cursor is not None))
+
+                def get_first_page(time_range_selection, subscription_id):
+                    return get_updates_page(time_range_selection, subscription_id, [None])
+
+                def get_next_page(time_range_selection, subscription_id, page_cursors, next_cursor):
+                    if next_cursor is None:
+                        return get_updates_page(time_range_selection, subscription_id, page_cursors)
+                    return get_updates_page(time_range_selection, subscription_id, page_cursors + [next_cursor])
+
+                def get_previous_page(time_range_selection, subscription_id, page_cursors):
+                    return get_updates_page(time_range_selection, subscription_id, page_cursors[:-1] or [None])
+
+                def load_subscription_choices(subscription_id):
+                    choices = [("全部订阅", 0)] + [(url, sub_id) for sub_id, url, _, _ in get_subscriptions()]
+                    if subscription_id not in [value for _, value in choices]:
+                        subscription_id = 0
+                    return gr.update(choices=choices, value=subscription_id)
+
+                page_outputs = [updates_container, updates_data_state, update_selector,
+                                page_cursors_state, next_cursor_state, page_info, prev_page_btn, next_page_btn]
                 
                 view_btn.click(
-                    fn=get_updates_as_cards,
-                    inputs=time_range,
-                    outputs=[updates_container, updates_data_state, update_selector]
+                    fn=load_subscription_choices,
+                    inputs=subscription_filter,
+                    outputs=subscription_filter
+                ).then(
+                    fn=get_first_page,
+                    inputs=[time_range, subscription_filter],
+                    outputs=page_outputs
                 )
                 
-                # 使时间范围选择实时更新
+                # 使时间范围与订阅选择实时更新，并回到第一页
                 time_range.change(
-                    fn=get_updates_as_cards,
-                    inputs=time_range,
-                    outputs=[updates_container, updates_data_state, update_selector]
+                    fn=get_first_page,
+                    inputs=[time_range, subscription_filter],
+                    outputs=page_outputs
+                )
+                subscription_filter.input(
+                    fn=get_first_page,
+                    inputs=[time_range, subscription_filter],
+                    outputs=page_outputs
                 )
                 
+                next_page_btn.click(
+                    fn=get_next_page,
+                    inputs=[time_range, subscription_filter, page_cursors_state, next_cursor_state],
+                    outputs=page_outputs
+                )
+                prev_page_btn.click(
+                    fn=get_previous_page,
+                    inputs=[time_range, subscription_filter, page_cursors_state],
+                    outputs=page_outputs
+                )
+                
+                def format_live_summaries():
+                    entries = get_live_feed().snapshot()
+                    try:
+                        stats = get_summary_queue_stats()
+                        queue_html = (f"<div class='timestamp'>摘要队列: 待处理 {stats['pending']} 个, "
+                                      f"处理中 {stats['running']} 个, 失败 {stats['failed']} 个</div>")
+                    except Exception as e:
+                        logger.error(f"读取摘要队列状态失败: {e}")
+                        queue_html = ""
+                    if not entries:
+                        return queue_html + "<div class='empty-state'><p>暂无正在生成的摘要</p></div>"
+                    status_text = {"streaming": "生成中", "done": "已完成", "error": "失败", "deferred": "已推迟"}
+                    html = queue_html + "<div class='updates-container'>"
+                    for entry in entries:
+                        points_html = "".join(f"<li>{point}</li>" for point in entry["key_points"])
+                        html += f"""
+                        <div class='card'>
+                            <div class='card-header'>
+                                <a href="{entry['label']}" target="_blank">{entry['label']}</a>
+                                <span class='live-status {entry['status']}'>{status_text.get(entry['status'], entry['status'])}</span>
+                            </div>
+                            <div class='card-body'>
+                                <div class='timestamp'>{entry['updated_at']}</div>
+                                <div class='content'><ol>{points_html}</ol></div>
+                            </div>
+                        </div>
+                        """
+                    html += "</div>"
+                    return html
+
+                live_timer.tick(fn=format_live_summaries, outputs=live_container)
+
                 # Handle feedback submission
                 def submit_feedback(selection, rating, comment, updates_data):
                     if not selection or not updates_data:
@@ -316,7 +416,6 @@ def create_ui():
                         
                         update = updates_data[index]
                         url = update[0]
-                        diff_details = update[3]  # Get the diff_details from the updates_data
                         summary_id = update[5]  # Get the summary_id from the updates_data
                         
                         # Save feedback using the database function
@@ -353,7 +452,7 @@ def create_ui():
                 
                 # Get learning statistics
                 def get_learning_stats():
-                    stats = subscription_agent.get_learning_stats()
+                    stats = get_agent().get_learning_stats()
                     
                     return (
                         stats.get("total_examples", 0),
@@ -373,10 +472,8 @@ def create_ui():
                 
                 # Example retrieval
                 def get_high_quality_examples():
-                    examples = learner.examples
-                    
-                    # Sort by feedback score (highest first)
-                    examples.sort(key=lambda ex: ex.feedback_score, reverse=True)
+                    # Sort a copy by feedback score (highest first); the learner's list is aligned with its index
+                    examples = sorted(get_learner().examples, key=lambda ex: ex.feedback_score, reverse=True)
                     
                     # Take top 10 examples
                     top_examples = examples[:10] if len(examples) > 10 else examples
@@ -429,7 +526,7 @@ def create_ui():
                 gr.Markdown("### 反馈分数分布")
                 
                 def get_feedback_distribution():
-                    examples = learner.examples
+                    examples = get_learner().examples
                     if not examples:
                         return "暂无学习示例数据"
                     
@@ -3,6 +3,7 @@ from bs4 import BeautifulSoup
 from tavily import TavilyClient
 import os
 from src.crawler import WebCrawler
+from src.net import get_transport
 from typing import Dict, List, Optional, Any
 
 def search_and_list_results_tavily(api_key: str, query: str, num_results: int = 5, time_range: str = 'day', exclude_domains: List[str] = [], **kwargs) -> Dict[str, Any]:
@@ -36,7 +37,12 @@ def search_and_list_results_tavily(api_key: str, query: str, num_results: int =
         }
 
     try:
-        client = TavilyClient(api_key=api_key)
+        try:
+            # 复用共享连接池；独立会话避免 Tavily 的认证头泄漏到其他请求
+            client = TavilyClient(api_key=api_key, session=get_transport().new_session())
+        except TypeError:
+            # 旧版本 tavily-python 不支持传入 session
+            client = TavilyClient(api_key=api_key)
         response = client.search(
             query=query,
             search_depth="basic",
@@ -47,6 +53,7 @@ def search_and_list_results_tavily(api_key: str, query: str, num_results: int =
         )
         
         results = []
+        crawler = WebCrawler()
         if "results" in response and response["results"]:
             for result in response["results"]:
                 title = result.get("title", "N/A")
@@ -64,7 +71,7 @@ def search_and_list_results_tavily(api_key: str, query: str, num_results: int =
                     result_data["raw_content"] = raw_content
                 elif link and link != "N/A":
                     try:
-                        page_content = WebCrawler().fetch_and_clean_content(link)
+                        page_content = crawler.fetch_and_clean_content(link)
                         result_data["page_content"] = page_content
                     except Exception as e:
                         result_data["page_content_error"] = str(e)
@@ -11,6 +11,7 @@ from abc import ABC, abstractmethod
 
 
 from src.log import get_logger
+from src.net import get_transport
 logger = get_logger("services.apis.base")
 
 class BaseAPIClient(ABC):
@@ -28,7 +29,8 @@ class BaseAPIClient(ABC):
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
         self.timeout = timeout
-        self.session = requests.Session()
+        # 使用共享连接池的独立会话，请求头与认证信息只属于当前客户端
+        self.session = get_transport().new_session()
         
         # 设置默认请求头
         self.session.headers.update({
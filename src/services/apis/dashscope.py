@@ -13,17 +13,28 @@ class DashScopeAPIClient(BaseAPIClient):
         super().__init__(base_url, api_key, timeout)
 
 
+    def _get_auth_headers(self):
+        """获取认证请求头"""
+        return {'Authorization': f'Bearer {self.api_key}'}
+
     def get_langcahin_llm_model(self, model_name):
         """
         获取LangChain LLM模型对象
         """
         pass
 
-    def get_langcahin_embedding_model(self, model_name):
+    def get_langcahin_embedding_model(self, model_name="text-embedding-v3"):
         """
         获取LangChain Embedding模型对象
+
+        Args:
+            model_name: 文本向量模型名称
+
+        Returns:
+            DashScopeEmbeddings: 使用当前客户端API密钥的Embedding对象
         """
-        pass
+        from langchain_community.embeddings import DashScopeEmbeddings
+        return DashScopeEmbeddings(model=model_name or "text-embedding-v3", dashscope_api_key=self.api_key)
 
     def get_speech_synthesis_model(self, model_name="cosyvoice-v1",voice="longxiaochun"):
         """
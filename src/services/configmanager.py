@@ -20,6 +20,8 @@ class ConfigManager:
         self.yaml_path = os.path.join(self.ROOT_DIR, "config.yaml")
         self.last_modified_time = 0
         self.config_data = {}
+        # 每次加载或保存配置时递增，供缓存判断配置是否变化
+        self.version = 0
         self.load_config()
     
     def load_config(self):
@@ -28,6 +30,7 @@ class ConfigManager:
             with open(self.yaml_path, "r", encoding="utf-8") as file:
                 self.config_data = yaml.safe_load(file)
             self.last_modified_time = os.path.getmtime(self.yaml_path)
+            self.version += 1
             return True
         except Exception as e:
             print(f"加载配置文件失败: {e}")
@@ -69,6 +72,7 @@ class ConfigManager:
             
             # 更新最后修改时间
             self.last_modified_time = os.path.getmtime(self.yaml_path)
+            self.version += 1
             
             logger.info("配置已成功保存")
             return True
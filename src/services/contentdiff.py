@@ -1,11 +1,19 @@
+import json
 from difflib import SequenceMatcher
-from typing import Tuple, List,Literal
+from typing import Any, Dict, Tuple, List, Literal, Optional
 from src.log import get_logger
+from src.crawler.utils import item_key, VOLATILE_FIELDS
+from .linediff import tokenize, diff_lines, similarity_ratio
 logger = get_logger("services.contentdiff")
 
 # Define the allowed tag literals
 TagType = Literal["replace", "delete", "insert"]
-def get_content_diff(old_content:str, new_content:str,return_tags:List[TagType]=["insert"])->Tuple[float, List[str]]:
+# auto: 条目列表用 structured，否则用 line（默认）
+# structured: 按 url/doi/arxiv_id 对齐条目; line/paragraph: 行级/段落级差异; char: 旧的逐字符 SequenceMatcher
+DiffMode = Literal["auto", "structured", "line", "paragraph", "char"]
+
+def get_content_diff(old_content:str, new_content:str,return_tags:List[TagType]=["insert"],
+                     mode:DiffMode="auto")->Tuple[float, List[str]]:
     """
     Compare old and new content to find differences.
     Returns a similarity ratio and the differences.
@@ -14,9 +22,22 @@ def get_content_diff(old_content:str, new_content:str,return_tags:List[TagType]=
         old_content (str): The old content to compare.
         new_content (str): The new content to compare.
         return_tags (List[str]): The tags to return.
+        mode (str): "structured" diffs keyed crawler items, "line" / "paragraph" diff hashed lines or paragraphs,
+            "char" uses the character-level SequenceMatcher, "auto" picks structured when both sides are item lists.
     Returns:
         Tuple[float, List[str]]: A tuple containing the similarity ratio and the differences.
     """
+    if mode in ("auto", "structured"):
+        old_items, new_items = _parse_items(old_content), _parse_items(new_content)
+        if old_items is not None and new_items is not None:
+            return _get_structured_diff(old_items, new_items, return_tags)
+        if mode == "structured":
+            logger.debug("内容不是可按键对齐的条目列表，改用行级差异")
+        mode = "line"
+
+    if mode != "char":
+        return _get_block_diff(old_content, new_content, return_tags, mode)
+
     # Calculate similarity ratio
     matcher = SequenceMatcher(None, old_content, new_content)
     similarity = matcher.ratio()
@@ -40,6 +61,101 @@ def get_content_diff(old_content:str, new_content:str,return_tags:List[TagType]=
 
     return similarity, diffs
 
+def _get_block_diff(old_content:str, new_content:str, return_tags:List[TagType], unit:str)->Tuple[float, List[str]]:
+    """
+    行级/段落级差异，返回值与 get_content_diff 相同
+    Line- or paragraph-level diff with the same (similarity, diffs) contract.
+    """
+    old_lines = tokenize(old_content, unit)
+    new_lines = tokenize(new_content, unit)
+    opcodes = diff_lines(old_lines, new_lines)
+    similarity = similarity_ratio(old_lines, new_lines, opcodes)
+
+    diffs = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            continue
+        old_text = "\n".join(old_lines[i1:i2])
+        new_text = "\n".join(new_lines[j1:j2])
+        if tag == 'replace' and 'replace' in return_tags:
+            diffs.append(f"Changed: '{old_text}' -> '{new_text}'")
+        elif tag == 'replace' and 'insert' in return_tags:
+            # 整行被替换时新行就是新增内容  Replaced lines are new content at line granularity
+            diffs.append(f"Added: '{new_text}'")
+        elif tag == 'delete' and 'delete' in return_tags:
+            diffs.append(f"Deleted: '{old_text}'")
+        elif tag == 'insert' and 'insert' in return_tags:
+            diffs.append(f"Added: '{new_text}'")
+    logger.debug(f"差异块数: {sum(1 for op in opcodes if op[0] != 'equal')}")
+
+    return similarity, diffs
+
+def _parse_items(content:str)->Optional[Dict[Any, Dict[str, Any]]]:
+    """
+    把爬虫输出解析为 {键: 条目}，不是带键的条目列表时返回 None
+    Parse crawler output into {key: item}; None when it is not a list of keyed items.
+    """
+    try:
+        items = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return None
+
+    keyed = {}
+    for item in items:
+        key = item_key(item)
+        if key is None:
+            return None
+        # 同一页面内重复出现的键按出现次序区分  Repeated keys are told apart by occurrence
+        occurrence = 0
+        while (key, occurrence) in keyed:
+            occurrence += 1
+        keyed[(key, occurrence)] = {k: v for k, v in item.items() if k not in VOLATILE_FIELDS}
+    return keyed
+
+def _get_structured_diff(old_items:Dict[Any, Dict[str, Any]], new_items:Dict[Any, Dict[str, Any]],
+                         return_tags:List[TagType])->Tuple[float, List[str]]:
+    """
+    按条目对齐的差异：只报告新增、删除和内容变化的条目，忽略 timestamp 等易变字段
+    Item-aware diff: report added, removed and changed items only, ignoring volatile fields.
+    """
+    def dump(item):
+        return json.dumps(item, ensure_ascii=False, sort_keys=True)
+
+    def text(item):
+        return "\n".join(tokenize(dump(item)))
+
+    diffs = []
+    matched = 0.0
+    total = 0
+    for key, new_item in new_items.items():
+        old_item = old_items.get(key)
+        new_dump = dump(new_item)
+        total += len(new_dump)
+        if old_item is None:
+            if 'insert' in return_tags:
+                diffs.append(f"Added: '{text(new_item)}'")
+            continue
+        old_dump = dump(old_item)
+        if old_dump == new_dump:
+            matched += 2 * len(new_dump)
+            continue
+        # 同一条目内容有变化时，在条目内部做行级差异  Line-diff the fields of a changed item
+        item_similarity, item_diffs = _get_block_diff(old_dump, new_dump, return_tags, "line")
+        matched += item_similarity * (len(old_dump) + len(new_dump))
+        diffs.extend(item_diffs)
+
+    for key, old_item in old_items.items():
+        total += len(dump(old_item))
+        if key not in new_items and 'delete' in return_tags:
+            diffs.append(f"Deleted: '{text(old_item)}'")
+
+    similarity = matched / total if total else 1.0
+    logger.debug(f"条目差异: 新增 {len(new_items.keys() - old_items.keys())}, "
+                 f"删除 {len(old_items.keys() - new_items.keys())}")
+    return similarity, diffs
+
 def has_significant_changes(old_content, new_content, threshold=0.95):
     """
     Determine if content changes are significant based on similarity threshold.
@@ -0,0 +1,154 @@
+"""
+内容指纹  SimHash fingerprints of crawled content.
+
+在抓取时为清洗后的文本计算 64 位 SimHash，并随内容一起存入 contents.fingerprint。
+刷新时先比较新旧指纹的汉明距离，距离不超过阈值即认为页面没有实质变化，
+直接跳过完整的差异计算和大模型摘要。
+同一组指纹也用于发现不同 URL 之间内容几乎相同的订阅。
+
+Usage:
+    fingerprint = content_fingerprint(content_json)
+    if hamming_distance(old, fingerprint) <= 3:
+        ...  # 近似未变化
+"""
+
+import hashlib
+import json
+import re
+from collections import Counter
+from itertools import combinations
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from src.crawler.utils import VOLATILE_FIELDS
+from .linediff import tokenize
+
+FINGERPRINT_BITS = 64
+# 3 个词组成一个特征，对词序变化有一定敏感度  3-token shingles keep some word-order sensitivity
+SHINGLE_SIZE = 3
+
+# 英文/数字按词切分，中日韩文字按单字切分  Latin words, single CJK characters
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff]")
+
+
+def _clean_text(content: str) -> str:
+    """去掉 timestamp 等易变字段后的文本  Text of the content without volatile fields"""
+    try:
+        items = json.loads(content)
+    except (TypeError, ValueError):
+        return content
+    if isinstance(items, list):
+        items = [{k: v for k, v in item.items() if k not in VOLATILE_FIELDS} if isinstance(item, dict) else item
+                 for item in items]
+    return "\n".join(tokenize(json.dumps(items, ensure_ascii=False)))
+
+
+def _features(text: str) -> Counter:
+    tokens = _TOKEN_RE.findall(text.lower())
+    if len(tokens) < SHINGLE_SIZE:
+        return Counter(tokens)
+    return Counter(" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1))
+
+
+def simhash(text: str) -> int:
+    """
+    计算文本的 64 位 SimHash
+    Compute the 64-bit SimHash of a text.
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        int: 64 位指纹，空文本返回 0
+    """
+    features = _features(text)
+    if not features:
+        return 0
+    digests = b"".join(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                       for feature in features)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(features), FINGERPRINT_BITS)
+    # 次线性权重，避免 URL 前缀等重复模板淹没正文  Sublinear weights keep boilerplate from dominating
+    weights = 1.0 + np.log(np.fromiter(features.values(), dtype=np.float64, count=len(features)))
+    # 每一位按权重投票：1 加权重，0 减权重  Weighted vote per bit position
+    votes = (2.0 * bits - 1.0).T @ weights
+    packed = np.packbits(votes > 0)
+    return int.from_bytes(packed.tobytes(), "big")
+
+
+def content_fingerprint(content: str) -> str:
+    """
+    计算存储内容（json.dumps 后的爬虫结果或纯文本）的指纹
+    Fingerprint of stored content, returned as a 16-character hex string.
+
+    Args:
+        content: contents.content 中的内容
+
+    Returns:
+        str: 十六进制指纹
+    """
+    return f"{simhash(_clean_text(content)):016x}"
+
+
+def hamming_distance(a: str, b: str) -> int:
+    """
+    两个十六进制指纹之间的汉明距离
+    Hamming distance between two hex fingerprints.
+
+    Args:
+        a: 指纹
+        b: 指纹
+
+    Returns:
+        int: 不同的位数
+    """
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def is_near_duplicate(a: Optional[str], b: Optional[str], max_distance: int) -> bool:
+    """两个指纹是否足够接近，任一为空或阈值为负时返回 False
+    Whether two fingerprints are within max_distance; False if either is missing or the check is disabled."""
+    if not a or not b or max_distance < 0:
+        return False
+    return hamming_distance(a, b) <= max_distance
+
+
+def find_near_duplicates(fingerprints: Dict[Hashable, str], max_distance: int = 3
+                         ) -> List[Tuple[Hashable, Hashable, int]]:
+    """
+    找出指纹接近的条目对
+    Find pairs of near-duplicate fingerprints.
+
+    把 64 位指纹分成 max_distance + 1 段，距离不超过 max_distance 的两个指纹
+    至少有一段完全相同（抽屉原理），因此只需比较共享某一段的候选对。
+    Splits fingerprints into max_distance + 1 bands; any pair within the distance
+    shares at least one band exactly, so only bucket-mates are compared.
+
+    Args:
+        fingerprints: {标识: 十六进制指纹}
+        max_distance: 最大汉明距离
+
+    Returns:
+        List[Tuple]: (标识a, 标识b, 距离) 列表
+    """
+    bands = max(1, min(max_distance + 1, FINGERPRINT_BITS))
+    widths = [FINGERPRINT_BITS // bands + (1 if i < FINGERPRINT_BITS % bands else 0) for i in range(bands)]
+    buckets: Dict[Tuple[int, int], List[Hashable]] = {}
+    values = {key: int(fp, 16) for key, fp in fingerprints.items() if fp}
+    for key, value in values.items():
+        shift = 0
+        for band, width in enumerate(widths):
+            buckets.setdefault((band, (value >> shift) & ((1 << width) - 1)), []).append(key)
+            shift += width
+
+    seen = set()
+    pairs = []
+    for members in buckets.values():
+        for a, b in combinations(members, 2):
+            if (a, b) in seen:
+                continue
+            seen.add((a, b))
+            distance = bin(values[a] ^ values[b]).count("1")
+            if distance <= max_distance:
+                pairs.append((a, b, distance))
+    return pairs
@@ -0,0 +1,266 @@
+"""
+行级/段落级差异算法  Line- and paragraph-level diff engine.
+
+将内容切分为行（或段落），把每一行映射为整数编号后再做差异计算：
+先用 patience diff 以两侧都只出现一次的行作为锚点划分区间，
+锚点之间的区间再用 Myers O(ND) 算法比较。
+相比逐字符的 SequenceMatcher，耗时与行数（而不是字符数）相关，
+输出也是整行的增删，而不是零碎的字符片段。
+
+Usage:
+    opcodes = diff_lines(old_lines, new_lines)
+"""
+
+import json
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Literal, Sequence, Tuple
+
+Opcode = Tuple[str, int, int, int, int]
+UnitType = Literal["line", "paragraph"]
+
+# Myers 算法的最大编辑距离，超过后整个区间按替换处理，避免病态输入耗尽内存
+# Edit distance cap for Myers; beyond it the region is reported as one replace
+MAX_MYERS_COST = 2000
+
+
+def _flatten(value: Any, out: List[str]):
+    """把 JSON 值中的文本展开为行  Collect the text lines of a JSON value"""
+    if isinstance(value, dict):
+        for item in value.values():
+            _flatten(item, out)
+    elif isinstance(value, list):
+        for item in value:
+            _flatten(item, out)
+    elif isinstance(value, str):
+        out.extend(value.splitlines())
+    elif value is not None:
+        out.append(str(value))
+
+
+def tokenize(content: str, unit: UnitType = "line") -> List[str]:
+    """
+    将内容切分为行或段落
+    Split content into lines or paragraphs.
+
+    数据库中的内容是 json.dumps 后的单行字符串，这里先还原出其中的文本再切分。
+    Stored content is a single-line JSON dump, so JSON input is unpacked first.
+
+    Args:
+        content: 待切分的内容
+        unit: "line" 按行切分，"paragraph" 按空行分隔的段落切分
+
+    Returns:
+        List[str]: 去除首尾空白且非空的行或段落
+    """
+    try:
+        parsed = json.loads(content)
+    except (TypeError, ValueError):
+        parsed = None
+
+    lines: List[str] = []
+    if isinstance(parsed, (dict, list)):
+        _flatten(parsed, lines)
+    else:
+        lines = content.splitlines()
+
+    if unit == "paragraph":
+        paragraphs, current = [], []
+        for line in lines:
+            if line.strip():
+                current.append(line.strip())
+            elif current:
+                paragraphs.append("\n".join(current))
+                current = []
+        if current:
+            paragraphs.append("\n".join(current))
+        return paragraphs
+
+    return [line.strip() for line in lines if line.strip()]
+
+
+def _intern(old: Sequence[str], new: Sequence[str]) -> Tuple[List[int], List[int]]:
+    """把行映射为整数编号，相同的行编号相同  Map every distinct line to an integer id"""
+    ids: Dict[str, int] = {}
+    a = [ids.setdefault(line, len(ids)) for line in old]
+    b = [ids.setdefault(line, len(ids)) for line in new]
+    return a, b
+
+
+def _myers(a: Sequence[int], b: Sequence[int], a0: int, a1: int, b0: int, b1: int
+           ) -> List[Tuple[int, int]]:
+    """
+    Myers O(ND) 算法，返回区间内匹配的行对
+    Myers' greedy O(ND) algorithm; returns the matched (i, j) pairs of the region.
+    """
+    n, m = a1 - a0, b1 - b0
+    if n == 0 or m == 0:
+        return []
+    max_d = min(n + m, MAX_MYERS_COST)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    # trace[d] 保存第 d 步开始前 k∈[-d-1, d+1] 的 V 值  V around diagonals -d-1..d+1 before step d
+    trace: List[List[int]] = []
+    for d in range(max_d + 1):
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _myers_backtrack(trace, n, m, a0, b0)
+    return []
+
+
+def _myers_backtrack(trace: List[List[int]], n: int, m: int, a0: int, b0: int) -> List[Tuple[int, int]]:
+    """沿 trace 回溯出对角线上的匹配  Walk the trace backwards to recover the snakes"""
+    matches = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1 + d + 1] < v[k + 1 + d + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k + d + 1]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            matches.append((a0 + x, b0 + y))
+        x, y = prev_x, prev_y
+    matches.reverse()
+    return matches
+
+
+def _unique_anchors(a: Sequence[int], b: Sequence[int], a0: int, a1: int, b0: int, b1: int
+                    ) -> List[Tuple[int, int]]:
+    """
+    patience diff 的锚点：两侧都只出现一次的行，按最长递增子序列保留
+    Lines unique on both sides, reduced to their longest increasing subsequence.
+    """
+    counts: Dict[int, List[int]] = {}
+    for i in range(a0, a1):
+        entry = counts.setdefault(a[i], [0, 0, -1])
+        entry[0] += 1
+        entry[2] = i
+    positions: Dict[int, int] = {}
+    for j in range(b0, b1):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[1] += 1
+            positions[b[j]] = j
+    pairs = sorted((entry[2], positions[line]) for line, entry in counts.items()
+                   if entry[0] == 1 and entry[1] == 1)
+    if not pairs:
+        return []
+
+    # patience sorting 求最长递增子序列  Patience sorting for the LIS on j
+    tails: List[int] = []
+    tail_index: List[int] = []
+    back = [-1] * len(pairs)
+    for idx, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(idx)
+        else:
+            tails[pos] = j
+            tail_index[pos] = idx
+        back[idx] = tail_index[pos - 1] if pos else -1
+    result = []
+    idx = tail_index[-1]
+    while idx != -1:
+        result.append(pairs[idx])
+        idx = back[idx]
+    result.reverse()
+    return result
+
+
+def _match(a: Sequence[int], b: Sequence[int], a0: int, a1: int, b0: int, b1: int,
+           out: List[Tuple[int, int]]):
+    """递归匹配区间  Collect matched pairs of a region with patience + Myers"""
+    # 去掉公共前缀和后缀  Strip the common prefix and suffix
+    while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+        out.append((a0, b0))
+        a0 += 1
+        b0 += 1
+    suffix = []
+    while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+        a1 -= 1
+        b1 -= 1
+        suffix.append((a1, b1))
+
+    if a0 < a1 and b0 < b1:
+        anchors = _unique_anchors(a, b, a0, a1, b0, b1)
+        if anchors:
+            for i, j in anchors:
+                _match(a, b, a0, i, b0, j, out)
+                out.append((i, j))
+                a0, b0 = i + 1, j + 1
+            _match(a, b, a0, a1, b0, b1, out)
+        else:
+            out.extend(_myers(a, b, a0, a1, b0, b1))
+
+    out.extend(reversed(suffix))
+
+
+def diff_lines(old: Sequence[str], new: Sequence[str]) -> List[Opcode]:
+    """
+    比较两组行，返回与 SequenceMatcher.get_opcodes 相同格式的操作码
+    Diff two line sequences, returning difflib-style opcodes.
+
+    Args:
+        old: 旧内容的行
+        new: 新内容的行
+
+    Returns:
+        List[Opcode]: (tag, i1, i2, j1, j2) 列表，tag 为 equal/replace/delete/insert
+    """
+    a, b = _intern(old, new)
+    matches: List[Tuple[int, int]] = []
+    _match(a, b, 0, len(a), 0, len(b), matches)
+
+    opcodes: List[Opcode] = []
+    i = j = 0
+    for mi, mj in matches + [(len(a), len(b))]:
+        if i < mi and j < mj:
+            opcodes.append(("replace", i, mi, j, mj))
+        elif i < mi:
+            opcodes.append(("delete", i, mi, j, j))
+        elif j < mj:
+            opcodes.append(("insert", i, i, j, mj))
+        if mi < len(a) and mj < len(b):
+            if opcodes and opcodes[-1][0] == "equal" and opcodes[-1][2] == mi and opcodes[-1][4] == mj:
+                tag, i1, _, j1, _ = opcodes[-1]
+                opcodes[-1] = (tag, i1, mi + 1, j1, mj + 1)
+            else:
+                opcodes.append(("equal", mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+    return opcodes
+
+
+def similarity_ratio(old: Sequence[str], new: Sequence[str], opcodes: Iterable[Opcode]) -> float:
+    """
+    按字符数加权的相似度，取值含义与 SequenceMatcher.ratio 相同（2*M/T）
+    Character-weighted similarity, 2 * matched chars / total chars, like SequenceMatcher.ratio.
+
+    Args:
+        old: 旧内容的行
+        new: 新内容的行
+        opcodes: diff_lines 返回的操作码
+
+    Returns:
+        float: 0 到 1 之间的相似度
+    """
+    total = sum(len(line) for line in old) + sum(len(line) for line in new)
+    if total == 0:
+        return 1.0
+    matched = sum(len(old[i]) for tag, i1, i2, _, _ in opcodes if tag == "equal" for i in range(i1, i2))
+    return 2.0 * matched / total
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.db.connection import close_connection, get_connection
+from src.db.migrations import migrate
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """临时数据库路径，测试结束后关闭连接  Path of a throwaway database"""
+    path = str(tmp_path / "subscriptions.db")
+    yield path
+    close_connection(path)
+
+
+@pytest.fixture
+def conn(db_path):
+    """已迁移到最新结构的连接  Connection to a database migrated to the latest schema"""
+    connection = get_connection(db_path)
+    migrate(connection)
+    return connection
+
+
+def add_content_update(conn, url="https://example.com", old="old", new="new"):
+    """写入一个订阅及其一次内容更新  Insert a subscription with one content update
+
+    Returns:
+        int: 内容更新ID
+    """
+    c = conn.cursor()
+    c.execute("INSERT INTO subscriptions (url, check_interval) VALUES (?, 60)", (url,))
+    subscription_id = c.lastrowid
+    content_ids = []
+    for text in (old, new):
+        c.execute("INSERT INTO contents (subscription_id, content) VALUES (?, ?)", (subscription_id, text))
+        content_ids.append(c.lastrowid)
+    c.execute("""
+        INSERT INTO content_updates (subscription_id, old_content_id, new_content_id, similarity_ratio, diff_details)
+        VALUES (?, ?, ?, 0.5, '{}')
+    """, (subscription_id, *content_ids))
+    conn.commit()
+    return c.lastrowid
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import httpx
+
+from src.net import AsyncHttpTransport
+
+DELAY = 0.1
+
+
+async def _slow_handler(request):
+    await asyncio.sleep(DELAY)
+    return httpx.Response(200, text=request.url.host)
+
+
+async def _fetch_all(urls, per_host_limit, max_in_flight):
+    transport = AsyncHttpTransport(per_host_limit=per_host_limit, max_in_flight=max_in_flight)
+    async with transport:
+        await transport.client.aclose()
+        transport.client = httpx.AsyncClient(transport=httpx.MockTransport(_slow_handler))
+        started = time.monotonic()
+        finished = {}
+
+        async def fetch(url):
+            response = await transport.get(url)
+            finished[url] = time.monotonic() - started
+            return response.text
+
+        results = await asyncio.gather(*(fetch(url) for url in urls))
+    return results, finished, transport.stats()
+
+
+def test_saturated_host_does_not_delay_other_hosts():
+    busy = [f"https://busy.example.com/{i}" for i in range(8)]
+    other = "https://other.example.com/"
+    results, finished, stats = asyncio.run(_fetch_all(busy + [other], per_host_limit=1, max_in_flight=4))
+    assert results == ["busy.example.com"] * 8 + ["other.example.com"]
+    # 另一主机的请求与繁忙主机的第一个请求同时完成  The other host is served alongside the first busy request
+    assert finished[other] < 3 * DELAY
+    assert finished[busy[-1]] >= 8 * DELAY
+    assert stats.requests == 9
+
+
+def test_global_limit_caps_requests_in_flight():
+    urls = [f"https://host{i}.example.com/" for i in range(6)]
+    _, finished, _ = asyncio.run(_fetch_all(urls, per_host_limit=4, max_in_flight=2))
+    assert max(finished.values()) >= 3 * DELAY
@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.crawler import BaseCrawler, WebCrawler, registry
+from src.crawler import base
+
+URL = "https://plugin.example.com/page"
+
+
+class FakeTransport:
+    """按 URL 返回固定内容的传输层  Transport serving a fixed body per URL"""
+
+    def __init__(self, body=b"<html><body><h1>v1</h1></body></html>"):
+        self.body = body
+        self.requests = []
+
+    def _response(self, url, headers):
+        self.requests.append((url, headers))
+        return httpx.Response(200, content=self.body, request=httpx.Request("GET", url))
+
+    def get(self, url, headers=None, timeout=None):
+        return self._response(url, headers)
+
+
+class AsyncFakeTransport(FakeTransport):
+    async def get(self, url, headers=None, timeout=None):
+        return self._response(url, headers)
+
+
+class CrawlOnlyCrawler(BaseCrawler):
+    """只实现 crawl 的插件爬虫，符合 README 中的插件约定  A plugin written to the crawl-only contract"""
+
+    def __init__(self):
+        super().__init__()
+        self.crawled = []
+
+    def crawl(self, url):
+        self.crawled.append(url)
+        return [{"url": url, "content": f"crawled {len(self.crawled)}"}]
+
+
+class ParsingCrawler(CrawlOnlyCrawler):
+    def parse_page(self, soup):
+        return [{"title": soup.h1.get_text()}]
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    fake = FakeTransport()
+    monkeypatch.setattr(base, "get_transport", lambda: fake)
+    return fake
+
+
+def test_crawl_only_plugin_crawls_when_changed(transport):
+    crawler = CrawlOnlyCrawler()
+    content, validators = crawler.crawl_if_changed(URL)
+    assert content == [{"url": URL, "content": "crawled 1"}]
+    assert validators.content_hash
+
+    # 内容未变化时不再调用 crawl  An unchanged body skips the crawl
+    assert crawler.crawl_if_changed(URL, validators) == (None, validators)
+    transport.body = b"<html><body><h1>v2</h1></body></html>"
+    content, _ = crawler.crawl_if_changed(URL, validators)
+    assert content == [{"url": URL, "content": "crawled 2"}]
+    assert crawler.crawled == [URL, URL]
+
+
+def test_crawl_only_plugin_async():
+    crawler = CrawlOnlyCrawler()
+    client = AsyncFakeTransport()
+    content, validators = asyncio.run(crawler.acrawl_if_changed(URL, client=client))
+    assert content == [{"url": URL, "content": "crawled 1"}]
+    assert asyncio.run(crawler.acrawl_if_changed(URL, validators, client=client)) == (None, validators)
+    assert asyncio.run(crawler.acrawl(URL, client=client)) == [{"url": URL, "content": "crawled 2"}]
+
+
+def test_parse_page_reuses_fetched_body(transport):
+    crawler = ParsingCrawler()
+    content, _ = crawler.crawl_if_changed(URL)
+    assert content == [{"title": "v1"}]
+    assert asyncio.run(crawler.acrawl(URL, client=AsyncFakeTransport())) == [{"title": "v1"}]
+    assert crawler.crawled == []
+
+
+def test_registered_crawl_only_plugin_refreshes(transport, monkeypatch):
+    monkeypatch.setattr(registry, "_crawlers", list(registry._crawlers))
+    registry.register(r"https?://plugin\.example\.com/.*", CrawlOnlyCrawler)
+    crawler = WebCrawler()
+    content, _ = crawler.crawl_if_changed(URL)
+    assert content == [{"url": URL, "content": "crawled 1"}]
+    content, _ = asyncio.run(crawler.acrawl_if_changed(URL, client=AsyncFakeTransport()))
+    assert content == [{"url": URL, "content": "crawled 2"}]
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from src.crawler import WebCrawler
+from src.crawler.conditional import FetchValidators
+from src.db import db_operate, refresh_engine
+from src.db.connection import get_connection
+from src.db.refresh_engine import RefreshEngine
+from src.db.snapshots import load_content, store_snapshot
+
+URL = "https://example.com/news"
+PAGES = [[{"url": URL, "content": f"第 {version} 版页面内容 " + "正文段落 " * 20 * version}] for version in (1, 2, 3)]
+
+
+def _add_content(c, subscription_id, page, days_ago):
+    text = json.dumps(page, ensure_ascii=False)
+    c.execute("""
+        INSERT INTO contents (subscription_id, content, content_hash, fetched_at)
+        VALUES (?, '', ?, datetime('now', 'localtime', ?))
+    """, (subscription_id, store_snapshot(c, text), f"-{days_ago} days"))
+    return c.lastrowid
+
+
+@pytest.fixture
+def aged_subscription(conn, db_path, monkeypatch):
+    """60 天前添加、50 天前生成过一次更新、45 天前的修改没有生成更新，之后一直未变化的订阅
+    A subscription added 60 days ago, updated 50 days ago, changed without an update 45 days ago
+    and unchanged since"""
+    monkeypatch.setattr(db_operate, "get_connection", lambda: get_connection(db_path))
+    monkeypatch.setattr(refresh_engine, "notify_summary_workers", lambda: None)
+    c = conn.cursor()
+    c.execute("""
+        INSERT INTO subscriptions (url, check_interval, last_updated_at)
+        VALUES (?, 60, datetime('now', 'localtime', '-1 days'))
+    """, (URL,))
+    subscription_id = c.lastrowid
+    content_ids = [_add_content(c, subscription_id, page, days_ago) for page, days_ago in zip(PAGES, (60, 50, 45))]
+    for old_content_id, new_content_id, days_ago in (("None", content_ids[0], 60),
+                                                      (content_ids[0], content_ids[1], 50)):
+        c.execute("""
+            INSERT INTO content_updates (subscription_id, old_content_id, new_content_id, similarity_ratio,
+                                         diff_details, updated_at)
+            VALUES (?, ?, ?, 0.5, '[]', datetime('now', 'localtime', ?))
+        """, (subscription_id, old_content_id, new_content_id, f"-{days_ago} days"))
+    conn.commit()
+    return subscription_id
+
+
+def test_cleanup_keeps_latest_baseline(conn, db_path, aged_subscription, monkeypatch):
+    subscription_id = aged_subscription
+    assert db_operate.delete_old_content(days_to_keep=30).startswith("Successfully")
+
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM content_updates")
+    assert c.fetchone()[0] == 1
+    c.execute("""
+        SELECT content, content_hash FROM contents
+        WHERE subscription_id = ? ORDER BY fetched_at DESC LIMIT 1
+    """, (subscription_id,))
+    assert json.loads(load_content(c, *c.fetchone())) == PAGES[2]
+
+    # 页面仍未变化：下一次刷新不应生成更新  The unchanged page must not come back as an update
+    monkeypatch.setattr(WebCrawler, "crawl_if_changed",
+                        lambda self, url, validators=None: (PAGES[2], FetchValidators()))
+    report = RefreshEngine(db_path=db_path, backend="thread", fetch_workers=1, diff_workers=1).run()
+    assert (report.refreshed, report.enqueued) == (1, 0)
+    c.execute("SELECT COUNT(*) FROM content_updates")
+    assert c.fetchone()[0] == 1
@@ -0,0 +1,142 @@
+import sqlite3
+
+import pytest
+
+from src.db.migrations import LATEST_VERSION, MIGRATIONS, migrate, schema_version
+from src.db.snapshots import load_content
+
+# 迁移框架引入之前 init_db 创建的结构，外加熔断期间的 summary_backlog 表
+# Schema created by init_db before versioning, plus the circuit breaker's summary_backlog table
+LEGACY_SCHEMA = """
+CREATE TABLE subscriptions
+    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+     url TEXT NOT NULL,
+     description TEXT,
+     check_interval INTEGER NOT NULL,
+     created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+     last_updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')));
+CREATE TABLE contents
+    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+     subscription_id INTEGER NOT NULL,
+     content TEXT NOT NULL,
+     fetched_at TIMESTAMP DEFAULT (datetime('now', 'localtime')));
+CREATE TABLE content_updates
+    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+     subscription_id INTEGER NOT NULL,
+     old_content_id INTEGER NOT NULL,
+     new_content_id INTEGER NOT NULL,
+     similarity_ratio REAL NOT NULL,
+     diff_details TEXT NOT NULL,
+     updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')));
+CREATE TABLE summaries
+    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+     content_update_id INTEGER NOT NULL,
+     summary TEXT NOT NULL,
+     feedback_score REAL DEFAULT 0.0,
+     feedback_comment TEXT,
+     feedback_at TIMESTAMP,
+     created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')));
+CREATE TABLE summary_backlog
+    (content_update_id INTEGER PRIMARY KEY,
+     provider TEXT,
+     reason TEXT,
+     attempts INTEGER DEFAULT 0,
+     created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+     last_attempt_at TIMESTAMP);
+"""
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """带数据的旧版数据库  A populated database from before schema versioning"""
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany("INSERT INTO subscriptions (id, url, check_interval, last_updated_at) VALUES (?, ?, ?, ?)", [
+        (1, "https://example.com/a", 60, "2024-01-01 00:00:00"),
+        (2, "https://example.com/b", 30, "2024-01-02 00:00:00"),
+        (3, "https://example.com/a", 15, "2024-01-03 00:00:00"),
+    ])
+    conn.executemany("INSERT INTO contents (id, subscription_id, content) VALUES (?, ?, ?)", [
+        (1, 1, "a v1"), (2, 1, "a v2"), (3, 2, "b v1"), (4, 3, "a v3"),
+    ])
+    conn.execute("""INSERT INTO content_updates (id, subscription_id, old_content_id, new_content_id,
+                                                 similarity_ratio, diff_details)
+                    VALUES (1, 3, 2, 4, 0.9, '{}')""")
+    conn.execute("INSERT INTO summary_backlog (content_update_id, reason) VALUES (1, 'circuit open')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _columns(conn, table):
+    return {column[1] for column in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _indexes(conn):
+    return {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_fresh_database(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "fresh.db"))
+    assert migrate(conn) == LATEST_VERSION
+    tables = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"subscriptions", "contents", "content_updates", "summaries", "fetch_validators",
+            "summary_jobs", "snapshots", "snapshot_dictionaries"} <= tables
+    conn.close()
+
+
+def test_upgrade_from_legacy_database(legacy_db):
+    conn = legacy_db
+    assert schema_version(conn) == 0
+    assert migrate(conn) == LATEST_VERSION
+
+    assert {"fingerprint", "content_hash"} <= _columns(conn, "contents")
+    assert {"idx_subscriptions_url", "idx_contents_subscription_fetched", "idx_content_updates_updated",
+            "idx_summaries_content_update", "idx_summary_jobs_status", "idx_contents_hash"} <= _indexes(conn)
+
+    # 熔断积压的摘要转入任务队列  The deferred backlog moves into the job queue
+    assert conn.execute("SELECT content_update_id, status, last_error FROM summary_jobs").fetchall() == \
+        [(1, "pending", "circuit open")]
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'summary_backlog'").fetchone() is None
+
+    # 重复订阅合并到最早的一条，历史随之迁移  Duplicates merge into the oldest subscription with their history
+    assert conn.execute("SELECT id, url, check_interval, last_updated_at FROM subscriptions ORDER BY id").fetchall() == [
+        (1, "https://example.com/a", 15, "2024-01-03 00:00:00"),
+        (2, "https://example.com/b", 30, "2024-01-02 00:00:00"),
+    ]
+    assert conn.execute("SELECT subscription_id FROM content_updates").fetchone() == (1,)
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO subscriptions (url, check_interval) VALUES ('https://example.com/a', 60)")
+
+    # 原文迁移到快照存储，读取结果不变  Inline contents move to snapshots and read back unchanged
+    rows = conn.execute("SELECT id, subscription_id, content, content_hash FROM contents ORDER BY id").fetchall()
+    assert all(content == "" and snapshot_hash for _, _, content, snapshot_hash in rows)
+    c = conn.cursor()
+    assert {content_id: load_content(c, content, snapshot_hash) for content_id, _, content, snapshot_hash in rows} == \
+        {1: "a v1", 2: "a v2", 3: "b v1", 4: "a v3"}
+    assert [subscription_id for _, subscription_id, _, _ in rows] == [1, 1, 2, 1]
+
+
+def test_migrate_is_idempotent(legacy_db):
+    migrate(legacy_db)
+    snapshot = legacy_db.execute("SELECT COUNT(*) FROM snapshots").fetchone()
+    assert migrate(legacy_db) == LATEST_VERSION
+    assert legacy_db.execute("SELECT COUNT(*) FROM snapshots").fetchone() == snapshot
+
+
+def test_partial_upgrade_resumes_from_stored_version(legacy_db):
+    c = legacy_db.cursor()
+    MIGRATIONS[0][2](c)
+    c.execute("PRAGMA user_version = 1")
+    legacy_db.commit()
+    assert migrate(legacy_db) == LATEST_VERSION
+    assert "idx_subscriptions_url" in _indexes(legacy_db)
+
+
+def test_newer_database_is_rejected(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "future.db"))
+    conn.execute(f"PRAGMA user_version = {LATEST_VERSION + 1}")
+    with pytest.raises(RuntimeError):
+        migrate(conn)
+    conn.close()
@@ -0,0 +1,126 @@
+import json
+
+import pytest
+
+from src.db import snapshots
+from src.db.snapshots import (DEFAULT_SNAPSHOT_CONFIG, content_hash, gc_snapshots, load_content,
+                              migrate_inline_contents, read_snapshot, store_snapshot)
+
+
+def _page(version):
+    items = [{"title": f"item {i}", "link": f"https://example.com/{i}"} for i in range(version, version + 40)]
+    return json.dumps({"version": version, "items": items}, ensure_ascii=False)
+
+
+@pytest.fixture(params=["zstd", "zlib"])
+def codec(request, monkeypatch):
+    if request.param == "zstd" and snapshots.zstandard is None:
+        pytest.skip("zstandard 未安装")
+    settings = dict(DEFAULT_SNAPSHOT_CONFIG, codec=request.param)
+    monkeypatch.setattr(snapshots, "_settings", settings)
+    return settings
+
+
+def _stored(c, snapshot_hash):
+    c.execute("SELECT codec, base_hash, size, stored_size FROM snapshots WHERE hash = ?", (snapshot_hash,))
+    return c.fetchone()
+
+
+def _reference(c, subscription_id, snapshot_hash):
+    c.execute("INSERT INTO contents (subscription_id, content, content_hash) VALUES (?, '', ?)",
+              (subscription_id, snapshot_hash))
+    return c.lastrowid
+
+
+def test_round_trip(conn, codec):
+    c = conn.cursor()
+    text = _page(1) + " 中文内容"
+    snapshot_hash = store_snapshot(c, text)
+    assert snapshot_hash == content_hash(text)
+    assert read_snapshot(c, snapshot_hash) == text
+    codec_name, base_hash, size, stored_size = _stored(c, snapshot_hash)
+    assert (codec_name, base_hash, size) == (codec["codec"], None, len(text.encode("utf-8")))
+    assert stored_size < size
+
+
+def test_identical_content_is_stored_once(conn, codec):
+    c = conn.cursor()
+    assert store_snapshot(c, _page(1)) == store_snapshot(c, _page(1), base_hash=store_snapshot(c, _page(2)))
+    c.execute("SELECT COUNT(*) FROM snapshots")
+    assert c.fetchone()[0] == 2
+
+
+def test_load_content_prefers_snapshot(conn, codec):
+    c = conn.cursor()
+    snapshot_hash = store_snapshot(c, _page(1))
+    assert load_content(c, "", snapshot_hash) == _page(1)
+    # 迁移前写入的行直接返回 content 列  Rows predating the store keep their inline text
+    assert load_content(c, "inline", None) == "inline"
+
+
+def test_delta_chain_round_trip(conn, codec):
+    codec.update(delta=True, max_delta_chain=3)
+    c = conn.cursor()
+    hashes = []
+    for version in range(10):
+        hashes.append(store_snapshot(c, _page(version), base_hash=hashes[-1] if hashes else None))
+    for version, snapshot_hash in enumerate(hashes):
+        assert read_snapshot(c, snapshot_hash) == _page(version)
+
+    # 每 max_delta_chain 个增量之后是一个完整快照  A full snapshot after every max_delta_chain deltas
+    bases = [_stored(c, snapshot_hash)[1] for snapshot_hash in hashes]
+    full = {0, 4, 8}
+    assert bases == [None if version in full else hashes[version - 1] for version in range(10)]
+    codec_name, _, _, stored_size = _stored(c, hashes[1])
+    assert codec_name == f"{codec['codec']}-delta"
+    assert stored_size < _stored(c, hashes[0])[3]
+
+
+def test_delta_with_missing_base_stores_full_snapshot(conn, codec):
+    codec.update(delta=True)
+    c = conn.cursor()
+    snapshot_hash = store_snapshot(c, _page(1), base_hash="0" * 64)
+    assert _stored(c, snapshot_hash)[:2] == (codec["codec"], None)
+    assert read_snapshot(c, snapshot_hash) == _page(1)
+
+
+def test_gc_keeps_referenced_snapshots_and_delta_bases(conn, codec):
+    codec.update(delta=True, max_delta_chain=8)
+    c = conn.cursor()
+    c.execute("INSERT INTO subscriptions (url, check_interval) VALUES ('https://example.com', 60)")
+    subscription_id = c.lastrowid
+    hashes, content_ids = [], []
+    for version in range(3):
+        hashes.append(store_snapshot(c, _page(version), base_hash=hashes[-1] if hashes else None))
+        content_ids.append(_reference(c, subscription_id, hashes[-1]))
+    orphan = store_snapshot(c, "unreferenced")
+    assert gc_snapshots(c) == 1
+    c.execute("SELECT 1 FROM snapshots WHERE hash = ?", (orphan,))
+    assert c.fetchone() is None
+
+    # 链中间的快照失去引用后仍是下一个快照的基准  The middle of a chain is still a delta base
+    c.execute("DELETE FROM contents WHERE id IN (?, ?)", content_ids[:2])
+    assert gc_snapshots(c) == 0
+    assert read_snapshot(c, hashes[2]) == _page(2)
+
+    # 链末端也失去引用后整条链被删除  Dropping the tip frees the whole chain
+    c.execute("DELETE FROM contents WHERE id = ?", (content_ids[2],))
+    assert gc_snapshots(c) == 3
+    c.execute("SELECT COUNT(*) FROM snapshots")
+    assert c.fetchone()[0] == 0
+
+
+def test_migrate_inline_contents(conn, codec):
+    codec.update(delta=True)
+    c = conn.cursor()
+    c.execute("INSERT INTO subscriptions (url, check_interval) VALUES ('https://example.com', 60)")
+    subscription_id = c.lastrowid
+    for version in range(3):
+        c.execute("INSERT INTO contents (subscription_id, content) VALUES (?, ?)", (subscription_id, _page(version)))
+    assert migrate_inline_contents(c, batch_size=2) == 3
+    c.execute("SELECT content, content_hash FROM contents ORDER BY id")
+    rows = c.fetchall()
+    assert all(content == "" for content, _ in rows)
+    assert [load_content(c, content, snapshot_hash) for content, snapshot_hash in rows] == \
+        [_page(version) for version in range(3)]
+    assert _stored(c, rows[2][1])[1] == rows[1][1]
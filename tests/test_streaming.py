@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+from src.agent.streaming import IncrementalJSONParser, StreamMalformedError, stream_json
+
+SUMMARY = {
+    "content": "新增 \"两篇\" 文章\n",
+    "key_points": ["第一篇：été", "第二篇"],
+    "score": -1.5e2,
+    "flags": {"important": True, "tags": [], "source": None},
+}
+TEXT = json.dumps(SUMMARY, ensure_ascii=True)
+
+
+def _chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(TEXT)])
+def test_incremental_parse_matches_json_loads(size):
+    values = []
+    parser = IncrementalJSONParser(expected_keys=SUMMARY, on_value=lambda path, value: values.append((path, value)))
+    chunks = _chunks(TEXT, size)
+    for chunk in chunks[:-1]:
+        assert not parser.feed(chunk)
+    assert parser.feed(chunks[-1])
+    assert parser.root == SUMMARY
+    assert json.loads(parser.json_text) == SUMMARY
+    assert values[:3] == [(("content",), SUMMARY["content"]),
+                          (("key_points", 0), SUMMARY["key_points"][0]),
+                          (("key_points", 1), SUMMARY["key_points"][1])]
+
+
+def test_truncated_stream_exposes_partial_tree():
+    # 截断在第二个关键点的 unicode 转义中间  Cut inside an escape of the second key point
+    cut = TEXT.index(json.dumps(SUMMARY["key_points"][1])) + 4
+    parser = IncrementalJSONParser()
+    assert not parser.feed(TEXT[:cut])
+    assert not parser.done
+    assert parser.root == {"content": SUMMARY["content"], "key_points": [SUMMARY["key_points"][0]]}
+
+
+def test_stream_json_raises_on_truncated_stream():
+    with pytest.raises(StreamMalformedError):
+        stream_json(_chunks(TEXT[:-5], 4), IncrementalJSONParser())
+
+
+def test_stream_json_stops_after_object_and_closes_stream():
+    consumed = []
+
+    def chunks():
+        try:
+            for chunk in ["<think>{not json}</think>\n```json\n", TEXT[:10], TEXT[10:] + "\n```", "trailing"]:
+                consumed.append(chunk)
+                yield chunk
+        finally:
+            consumed.append("closed")
+
+    assert json.loads(stream_json(chunks(), IncrementalJSONParser())) == SUMMARY
+    assert consumed[-1] == "closed" and "trailing" not in consumed
+
+
+def test_stream_json_accepts_message_chunks():
+    class Chunk:
+        def __init__(self, content):
+            self.content = content
+
+    assert json.loads(stream_json([Chunk(c) for c in _chunks(TEXT, 5)], IncrementalJSONParser())) == SUMMARY
+
+
+def test_feed_after_done_is_ignored():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"a": 1} extra')
+    assert parser.feed('{"b": 2}')
+    assert parser.root == {"a": 1}
+
+
+@pytest.mark.parametrize("text", [
+    '{"content": "x" "key_points": []}',
+    '{"content": x}',
+    '{content: "x"}',
+    '{"content": "\\q"}',
+    '{"content": tru }',
+    '{"score": 1.2.3}',
+])
+def test_malformed_json_fails_fast(text):
+    with pytest.raises(StreamMalformedError):
+        IncrementalJSONParser().feed(text)
+
+
+def test_unknown_top_level_key_fails_fast():
+    parser = IncrementalJSONParser(expected_keys={"content"})
+    assert not parser.feed('{"content": {"nested": 1}, ')
+    with pytest.raises(StreamMalformedError):
+        parser.feed('"summary"')
+
+
+def test_long_preamble_fails_fast():
+    parser = IncrementalJSONParser(max_preamble=10)
+    assert not parser.feed("<think>" + "reasoning " * 100 + "</think>   ```")
+    with pytest.raises(StreamMalformedError):
+        parser.feed("Here is the summary:")
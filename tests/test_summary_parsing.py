@@ -0,0 +1,28 @@
+import json
+
+import pytest
+from langchain_core.output_parsers import PydanticOutputParser
+
+from src.agent.summary import BatchSummaryResponse
+
+
+@pytest.fixture
+def parser():
+    return PydanticOutputParser(pydantic_object=BatchSummaryResponse)
+
+
+def _response(*ids):
+    return json.dumps({"summaries": [{"id": item_id, "content": [f"条目 {item_id}"], "key_points": ["要点"],
+                                      "url_list": [[]], "word_count": 4} for item_id in ids]},
+                      ensure_ascii=False)
+
+
+def test_batch_response_accepts_string_ids(parser):
+    parsed = parser.parse(_response("1", "2"))
+    assert [item.id for item in parsed.summaries] == ["1", "2"]
+
+
+def test_batch_response_coerces_numeric_ids(parser):
+    parsed = parser.parse(_response(1, "2", 3))
+    assert [item.id for item in parsed.summaries] == ["1", "2", "3"]
+    assert parsed.summaries[2].content == ["条目 3"]
@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+from src.db.summary_queue import (FAILED, PENDING, RUNNING, claim_summary_jobs, complete_summary_job,
+                                  enqueue_summary, get_summary_queue_stats, release_summary_job,
+                                  retry_failed_summary_jobs)
+
+from conftest import add_content_update
+
+
+@pytest.fixture
+def job(conn):
+    content_update_id = add_content_update(conn)
+    enqueue_summary(conn.cursor(), content_update_id)
+    conn.commit()
+    return content_update_id
+
+
+def _job_row(conn, job_id):
+    return conn.execute("SELECT status, attempts, lease_owner, available_at, last_error "
+                        "FROM summary_jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def _expire_lease(conn, job_id):
+    conn.execute("UPDATE summary_jobs SET lease_expires_at = ? WHERE id = ?", (time.time() - 1, job_id))
+    conn.commit()
+
+
+def test_enqueue_is_idempotent(conn, job):
+    enqueue_summary(conn.cursor(), job)
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM summary_jobs").fetchone()[0] == 1
+
+
+def test_claim_leases_job_once(conn, job):
+    jobs = claim_summary_jobs(conn, "worker-a", limit=4)
+    assert [content_update_id for _, content_update_id in jobs] == [job]
+    status, attempts, owner, _, _ = _job_row(conn, jobs[0][0])
+    assert (status, attempts, owner) == (RUNNING, 1, "worker-a")
+    # 租约有效期内其他工作者认领不到  A live lease is not handed out again
+    assert claim_summary_jobs(conn, "worker-b") == []
+
+
+def test_expired_lease_is_reclaimed(conn, job):
+    (job_id, _), = claim_summary_jobs(conn, "worker-a")
+    _expire_lease(conn, job_id)
+    assert claim_summary_jobs(conn, "worker-b") == [(job_id, job)]
+    status, attempts, owner, _, _ = _job_row(conn, job_id)
+    assert (status, attempts, owner) == (RUNNING, 2, "worker-b")
+    # 原工作者的租约已被接管，完成时放弃写入  The fenced-out worker cannot complete the job
+    assert not complete_summary_job(conn, job_id, "worker-a", job, None)
+    assert complete_summary_job(conn, job_id, "worker-b", job, None)
+    assert conn.execute("SELECT COUNT(*) FROM summary_jobs").fetchone()[0] == 0
+
+
+def test_release_backs_off_exponentially(conn, job):
+    (job_id, _), = claim_summary_jobs(conn, "worker-a")
+    before = time.time()
+    release_summary_job(conn, job_id, "worker-a", "boom", retry_delay=10.0)
+    status, attempts, owner, available_at, error = _job_row(conn, job_id)
+    assert (status, attempts, owner, error) == (PENDING, 1, None, "boom")
+    assert available_at >= before + 10.0
+    # 重试时间未到时不可认领  Not due before the retry delay
+    assert claim_summary_jobs(conn, "worker-a") == []
+
+    conn.execute("UPDATE summary_jobs SET available_at = 0 WHERE id = ?", (job_id,))
+    conn.commit()
+    claim_summary_jobs(conn, "worker-a")
+    before = time.time()
+    release_summary_job(conn, job_id, "worker-a", "boom", retry_delay=10.0)
+    assert _job_row(conn, job_id)[3] >= before + 20.0
+
+
+def test_deferred_release_keeps_attempts(conn, job):
+    (job_id, _), = claim_summary_jobs(conn, "worker-a")
+    before = time.time()
+    release_summary_job(conn, job_id, "worker-a", "circuit open", delay=60.0)
+    status, attempts, _, available_at, _ = _job_row(conn, job_id)
+    assert (status, attempts) == (PENDING, 0)
+    assert available_at >= before + 60.0
+
+
+def test_release_by_other_worker_is_ignored(conn, job):
+    (job_id, _), = claim_summary_jobs(conn, "worker-a")
+    release_summary_job(conn, job_id, "worker-b", "boom")
+    assert _job_row(conn, job_id)[:3] == (RUNNING, 1, "worker-a")
+
+
+def test_release_fails_job_after_max_attempts(conn, db_path, job):
+    for attempt in range(2):
+        (job_id, _), = claim_summary_jobs(conn, "worker-a", max_attempts=2)
+        release_summary_job(conn, job_id, "worker-a", f"boom {attempt}", retry_delay=0.0, max_attempts=2)
+    status, attempts, owner, _, error = _job_row(conn, job_id)
+    assert (status, attempts, owner, error) == (FAILED, 2, None, "boom 1")
+    assert claim_summary_jobs(conn, "worker-a", max_attempts=2) == []
+
+    assert retry_failed_summary_jobs(db_path) == 1
+    assert _job_row(conn, job_id)[:2] == (PENDING, 0)
+
+
+def test_crashing_job_fails_after_max_attempts(conn, job):
+    for _ in range(2):
+        (job_id, _), = claim_summary_jobs(conn, "worker-a", max_attempts=2)
+        _expire_lease(conn, job_id)
+    assert claim_summary_jobs(conn, "worker-b", max_attempts=2) == []
+    status, attempts, owner, _, error = _job_row(conn, job_id)
+    assert (status, attempts, owner) == (FAILED, 2, None)
+    assert error == "租约多次过期"
+
+
+def test_queue_stats(conn, db_path):
+    for index in range(3):
+        enqueue_summary(conn.cursor(), add_content_update(conn, url=f"https://example.com/{index}"))
+    conn.commit()
+    claim_summary_jobs(conn, "worker-a")
+    stats = get_summary_queue_stats(db_path)
+    assert (stats[PENDING], stats[RUNNING], stats[FAILED], stats["due"]) == (2, 1, 0, 2)